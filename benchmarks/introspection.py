@@ -0,0 +1,86 @@
+"""
+Compare static and argparse2tool introspection of the script steps in a config.
+
+    python benchmarks/introspection.py --config tests/data/config.yml
+
+argparse2tool is measured twice, once with an empty environment pool (the cost of
+a first run) and once reusing the environments built by the first run.
+"""
+
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+from eoap_gen.config import StepConfig, WorkflowConfig
+from eoap_gen.cwl import generate_cwl_cli, write_cwl_cli_outputs
+from eoap_gen.dockerfile import get_requirements
+from eoap_gen.envs import EnvPool
+
+
+def introspect(
+    step: StepConfig, output_dir: Path, introspection: str, env_pool: EnvPool
+) -> float:
+    assert step.script
+    output_dir.mkdir(parents=True, exist_ok=True)
+    write_cwl_cli_outputs(output_dir / "tool_out.yml", step.outputs)
+    start = time.perf_counter()
+    generate_cwl_cli(
+        script_path=step.script,
+        output_dir=output_dir,
+        step_id=step.id_,
+        requirements=get_requirements(step.requirements),
+        cwl_outputs_path=output_dir / "tool_out.yml",
+        conda_pkgs=step.conda,
+        python_version=step.python_version,
+        env_pool=env_pool,
+        introspection=introspection,
+    )
+    return time.perf_counter() - start
+
+
+@click.command()
+@click.option(
+    "--config",
+    "config_path",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=Path("tests/data/config.yml"),
+    show_default=True,
+)
+@click.option("--repeat", type=click.IntRange(min=1), default=20, show_default=True)
+@click.option("--skip-argparse2tool", is_flag=True, help="Only time static analysis.")
+def main(config_path: Path, repeat: int, skip_argparse2tool: bool):
+    config = WorkflowConfig.load_config(config_path)
+    steps = [s for s in config.steps if s.script]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        env_pool = EnvPool(root=tmp_path / "envs")
+        click.echo(f"{'step':<20}{'static':>12}{'a2t cold':>12}{'a2t warm':>12}")
+        for step in steps:
+            out = tmp_path / "out" / step.id_
+            static = statistics.median(
+                introspect(step, out, "static", env_pool) for _ in range(repeat)
+            )
+            cold = warm = None
+            if skip_argparse2tool:
+                pass
+            elif step.conda and not shutil.which("micromamba"):
+                click.echo(f"{step.id_}: micromamba not found, skipping argparse2tool")
+            else:
+                cold = introspect(step, out, "argparse2tool", env_pool)
+                warm = introspect(step, out, "argparse2tool", env_pool)
+            click.echo(
+                f"{step.id_:<20}{static * 1000:>10.2f}ms"
+                + "".join(
+                    f"{t:>11.2f}s" if t is not None else f"{'-':>12}"
+                    for t in (cold, warm)
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
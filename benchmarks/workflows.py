@@ -0,0 +1,215 @@
+"""
+Time the generator phases on synthetic workflows of growing size.
+
+    python benchmarks/workflows.py --sizes 10,100,500,2000
+    python benchmarks/workflows.py --update-baseline
+
+Workflows only use docker image steps, so no python environments are built. Two
+shapes are generated: `chain`, where every step consumes the previous step's
+output, and `fanin`, where a split step feeds many scattered steps which are all
+gathered by a single merge step. Results are compared with the stored baselines,
+phases slower than `--threshold` times their baseline fail the run.
+"""
+
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+import click
+
+from eoap_gen.config import WorkflowConfig
+from eoap_gen.cwl import generate_docker_cli, generate_workflow, pack_workflow
+from eoap_gen.utils import create_output_dirs
+
+BASELINES_PATH = Path(__file__).parent / "baselines.json"
+PHASES = ["from_dict", "to_cwl", "generate_docker_cli", "generate_workflow", "pack"]
+
+
+def docker_step(id_: str, inputs: list[dict[str, Any]], **kwargs: Any) -> dict:
+    return {
+        "id": id_,
+        "docker_image": "alpine:latest",
+        "command": "process " + " ".join(f"--{i['id']} ${{{i['id']}}}" for i in inputs),
+        "inputs": inputs,
+        "outputs": [{"id": "out", "type": "File", "outputBinding": {"glob": "*.out"}}],
+        **kwargs,
+    }
+
+
+def chain_config(n: int) -> dict:
+    steps = [docker_step("step_0", [{"id": "data", "source": "chain/data"}])]
+    for i in range(1, n):
+        steps.append(
+            docker_step(f"step_{i}", [{"id": "data", "source": f"step_{i - 1}/out"}])
+        )
+    return {
+        "id": "chain",
+        "doc": f"Chain of {n} steps",
+        "inputs": [{"id": "data", "type": "string"}],
+        "outputs": [{"id": "out", "type": "File", "source": f"step_{n - 1}/out"}],
+        "steps": steps,
+    }
+
+
+def fanin_config(n: int) -> dict:
+    width = max(n - 2, 1)
+    split = docker_step("split", [{"id": "data", "source": "fanin/data"}])
+    split["outputs"] = [
+        {
+            "id": "parts",
+            "type": "string[]",
+            "outputBinding": {
+                "glob": "parts.txt",
+                "loadContents": True,
+                "outputEval": "$(self[0].contents.split('\\n'))",
+            },
+        }
+    ]
+    work = [
+        docker_step(
+            f"work_{i}", [{"id": "part", "source": "split/parts", "scatter": True}]
+        )
+        for i in range(width)
+    ]
+    merge = docker_step(
+        "merge", [{"id": f"in_{i}", "source": f"work_{i}/out"} for i in range(width)]
+    )
+    return {
+        "id": "fanin",
+        "doc": f"Fan-in of {width} scattered steps",
+        "inputs": [{"id": "data", "type": "string"}],
+        "outputs": [{"id": "out", "type": "File", "source": "merge/out"}],
+        "steps": [split, *work, merge],
+    }
+
+
+SHAPES: dict[str, Callable[[int], dict]] = {
+    "chain": chain_config,
+    "fanin": fanin_config,
+}
+
+
+def timed(timings: dict[str, float], phase: str, f: Callable[[], Any]) -> Any:
+    start = time.perf_counter()
+    res = f()
+    timings[phase] = time.perf_counter() - start
+    return res
+
+
+def run_once(raw: dict, output_path: Path) -> dict[str, float]:
+    timings: dict[str, float] = {}
+    cli_dir = output_path / "cli"
+    config = timed(timings, "from_dict", lambda: WorkflowConfig.from_dict(raw))
+    create_output_dirs(output_path, [s.id_ for s in config.steps])
+    config.set_step_run(cli_dir)
+    timed(timings, "to_cwl", config.to_cwl)
+    timed(
+        timings,
+        "generate_docker_cli",
+        lambda: [generate_docker_cli(s, cli_dir / s.id_) for s in config.steps],
+    )
+    timed(
+        timings,
+        "generate_workflow",
+        lambda: generate_workflow(config, cli_dir / "workflow.cwl"),
+    )
+    timed(
+        timings,
+        "pack",
+        lambda: pack_workflow(config, cli_dir / "workflow-packed.cwl"),
+    )
+    return timings
+
+
+def run_benchmark(raw: dict, repeat: int) -> dict[str, float]:
+    runs = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as tmp:
+            runs.append(run_once(raw, Path(tmp)))
+    return {p: statistics.median(r[p] for r in runs) for p in PHASES}
+
+
+@click.command()
+@click.option(
+    "--sizes",
+    default="10,100,500,2000",
+    show_default=True,
+    help="Comma separated numbers of steps.",
+)
+@click.option(
+    "--shapes",
+    default=",".join(SHAPES),
+    show_default=True,
+    help="Comma separated workflow shapes.",
+)
+@click.option("--repeat", type=click.IntRange(min=1), default=3, show_default=True)
+@click.option(
+    "--baseline",
+    "baseline_path",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=BASELINES_PATH,
+    show_default=True,
+)
+@click.option("--update-baseline", is_flag=True, help="Store results as baseline.")
+@click.option(
+    "--threshold",
+    type=click.FloatRange(min=1),
+    default=1.5,
+    show_default=True,
+    help="Fail when a phase takes longer than this multiple of its baseline.",
+)
+@click.option(
+    "--min-delta",
+    type=click.FloatRange(min=0),
+    default=0.02,
+    show_default=True,
+    help="Ignore slowdowns smaller than this many seconds, they are noise.",
+)
+def main(
+    sizes: str,
+    shapes: str,
+    repeat: int,
+    baseline_path: Path,
+    update_baseline: bool,
+    threshold: float,
+    min_delta: float,
+):
+    baselines = {}
+    if baseline_path.exists():
+        baselines = json.loads(baseline_path.read_text())
+
+    results = {}
+    regressions = []
+    click.echo(f"{'benchmark':<14}" + "".join(f"{p:>21}" for p in PHASES))
+    for shape in shapes.split(","):
+        for size in [int(s) for s in sizes.split(",")]:
+            name = f"{shape}-{size}"
+            results[name] = run_benchmark(SHAPES[shape](size), repeat)
+            cells = []
+            for phase in PHASES:
+                t = results[name][phase]
+                base = baselines.get(name, {}).get(phase)
+                cell = f"{t:.3f}s"
+                if base is not None and t > base * threshold and t - base > min_delta:
+                    regressions.append(
+                        f"{name} {phase}: {t:.3f}s, baseline {base:.3f}s"
+                    )
+                    cell += "!"
+                cells.append(cell.rjust(21))
+            click.echo(f"{name:<14}" + "".join(cells))
+
+    if update_baseline:
+        baselines.update(results)
+        baseline_path.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+        click.echo(f"Baseline written to {baseline_path}.")
+    elif regressions:
+        click.echo("Regressions:\n  " + "\n  ".join(regressions), err=True)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+import heapq
+import math
+from pathlib import Path
+from typing import Collection
+
+from eoap_gen.config import StepConfig, WorkflowConfig
+from eoap_gen.serialize import load
+
+# what CWL runners assume when a step doesn't set coresMin and ramMin (MiB)
+DEFAULT_CORES = 1
+DEFAULT_RAM = 1024
+
+
+class StepEstimate:
+    duration: float  # seconds, per item of scattered steps
+    scatter_size: int  # items of scattered steps
+
+    def __init__(self, duration: float = 60, scatter_size: int = 10) -> None:
+        if duration < 0:
+            raise ValueError("Step duration can't be negative.")
+        if scatter_size < 0:
+            raise ValueError("Scatter size can't be negative.")
+        self.duration = duration
+        self.scatter_size = scatter_size
+
+
+def load_estimates(
+    path: Path | None,
+    duration: float = 60,
+    scatter_size: int = 10,
+    step_ids: Collection[str] | None = None,
+) -> dict[str, StepEstimate]:
+    """
+    Load per step estimates from a YAML or JSON file mapping step ids to their
+    `duration` and `scatter_size`. Steps missing from the file get the defaults.
+    Raises a ValueError for entries that aren't estimates, or of steps not in
+    `step_ids` when given.
+    """
+    raw = (load(path) if path else None) or {}
+    if not isinstance(raw, dict):
+        raise ValueError(f"{path}: must map step ids to their estimates.")
+    estimates = {}
+    for step_id, d in raw.items():
+        if step_ids is not None and step_id not in step_ids:
+            raise ValueError(f"{path}: no step {step_id} in the workflow.")
+        if not isinstance(d, dict):
+            raise ValueError(f"{path}: estimates of step {step_id} must be a mapping.")
+        unknown = set(d) - {"duration", "scatter_size"}
+        if unknown:
+            raise ValueError(
+                f"{path}: unknown estimates {', '.join(sorted(unknown))} of step "
+                f"{step_id}."
+            )
+        for key, type_ in [("duration", (int, float)), ("scatter_size", int)]:
+            if key in d and (not isinstance(d[key], type_) or isinstance(d[key], bool)):
+                raise ValueError(f"{path}: {key} of step {step_id} must be a number.")
+        estimates[step_id] = StepEstimate(
+            d.get("duration", duration), d.get("scatter_size", scatter_size)
+        )
+    return estimates
+
+
+class Job:
+    step_id: str
+    duration: float
+    cores: float
+    ram: float
+
+    def __init__(self, step_id: str, duration: float, cores: float, ram: float):
+        self.step_id = step_id
+        self.duration = duration
+        self.cores = cores
+        self.ram = ram
+
+
+class WorkflowGraph:
+    """
+    Steps of a workflow and the steps each one takes inputs from.
+    """
+
+    steps: dict[str, StepConfig]
+    upstream: dict[str, list[str]]
+    downstream: dict[str, list[str]]
+
+    def __init__(self, config: WorkflowConfig) -> None:
+        self.steps = {s.id_: s for s in config.steps}
+        self.upstream = {s.id_: [] for s in config.steps}
+        self.downstream = {s.id_: [] for s in config.steps}
+        for step in config.steps:
+            for inp in step.inputs:
+                source = (inp.source or "").split("/")[0]
+                if source in self.steps and source not in self.upstream[step.id_]:
+                    self.upstream[step.id_].append(source)
+                    self.downstream[source].append(step.id_)
+        self.order = self.topological_order()
+
+    def topological_order(self) -> list[str]:
+        waiting = {k: len(v) for k, v in self.upstream.items()}
+        ready = [k for k, n in waiting.items() if n == 0]
+        order = []
+        while ready:
+            step_id = ready.pop(0)
+            order.append(step_id)
+            for down in self.downstream[step_id]:
+                waiting[down] -= 1
+                if waiting[down] == 0:
+                    ready.append(down)
+        if len(order) != len(self.steps):
+            cycle = sorted(set(self.steps) - set(order))
+            raise ValueError(f"Steps {', '.join(cycle)} depend on each other.")
+        return order
+
+
+def step_jobs(step: StepConfig, estimate: StepEstimate) -> list[Job]:
+    """
+    Jobs a runner starts for a step: one, one per scattered item, or one per
+    batch running its items `scatter_batch_parallelism` at a time.
+    """
+    cores = step.resources.cores_min or DEFAULT_CORES
+    ram = step.resources.ram_min or DEFAULT_RAM
+    if not any(i.scatter for i in step.inputs):
+        return [Job(step.id_, estimate.duration, cores, ram)]
+    size = estimate.scatter_size
+    if not step.scatter_batch_size:
+        return [Job(step.id_, estimate.duration, cores, ram) for _ in range(size)]
+    jobs = []
+    for start in range(0, size, step.scatter_batch_size):
+        items = min(step.scatter_batch_size, size - start)
+        rounds = math.ceil(items / step.scatter_batch_parallelism)
+        jobs.append(Job(step.id_, rounds * estimate.duration, cores, ram))
+    return jobs
+
+
+def critical_path(
+    graph: WorkflowGraph, jobs: dict[str, list[Job]]
+) -> tuple[float, list[str]]:
+    """
+    Longest chain of dependent steps with unlimited resources, where all jobs of
+    a step run at once. Returns its duration and step ids.
+    """
+    finish: dict[str, float] = {}
+    previous: dict[str, str | None] = {}
+    for step_id in graph.order:
+        start, previous[step_id] = 0.0, None
+        for up in graph.upstream[step_id]:
+            if finish[up] > start:
+                start, previous[step_id] = finish[up], up
+        finish[step_id] = start + max((j.duration for j in jobs[step_id]), default=0)
+    if not finish:
+        return 0.0, []
+    step_id: str | None = max(graph.order, key=lambda s: finish[s])
+    length = finish[step_id]
+    path = []
+    while step_id is not None:
+        path.append(step_id)
+        step_id = previous[step_id]
+    return length, path[::-1]
+
+
+class Node:
+    cores: float
+    ram: float
+    free_cores: float
+    free_ram: float
+    busy_core_seconds: float
+    busy_ram_seconds: float
+
+    def __init__(self, cores: float, ram: float) -> None:
+        self.cores = self.free_cores = cores
+        self.ram = self.free_ram = ram
+        self.busy_core_seconds = 0.0
+        self.busy_ram_seconds = 0.0
+
+    def fits(self, job: Job) -> bool:
+        return job.cores <= self.free_cores and job.ram <= self.free_ram
+
+
+class Simulation:
+    makespan: float
+    steps: dict[str, tuple[float, float]]  # step id -> start, end
+    peak_jobs: int
+    peak_steps: int
+    nodes: list[Node]
+
+    def __init__(self) -> None:
+        self.makespan = 0.0
+        self.steps = {}
+        self.peak_jobs = 0
+        self.peak_steps = 0
+        self.nodes = []
+
+    def utilisation(self, node: Node) -> tuple[float, float]:
+        if not self.makespan:
+            return 0.0, 0.0
+        return (
+            node.busy_core_seconds / (node.cores * self.makespan),
+            node.busy_ram_seconds / (node.ram * self.makespan),
+        )
+
+
+def simulate(
+    graph: WorkflowGraph,
+    jobs: dict[str, list[Job]],
+    nodes: list[Node] | None = None,
+) -> Simulation:
+    """
+    Discrete event simulation of a runner executing the workflow on `nodes`, or
+    on unlimited resources when not given. A step's jobs are queued once all its
+    upstream steps finished, queued jobs start in order on the first node with
+    enough free cores and RAM, skipping steps whose jobs don't fit anywhere yet.
+    """
+    sim = Simulation()
+    sim.nodes = nodes or []
+    for step_id, job_list in jobs.items():
+        # all jobs of a step need the same resources
+        job = job_list[0] if job_list else None
+        if (
+            job
+            and sim.nodes
+            and not any(job.cores <= n.cores and job.ram <= n.ram for n in sim.nodes)
+        ):
+            raise ValueError(
+                f"Step {step_id} needs {job.cores:g} cores and {job.ram:g} MB of "
+                "RAM, more than a node has."
+            )
+
+    waiting = {k: len(v) for k, v in graph.upstream.items()}
+    remaining = {k: len(v) for k, v in jobs.items()}
+    # jobs of each released step not started yet, in release order
+    queue: dict[str, list[Job]] = {}
+    # end time, sequence number breaking ties, job, node
+    running: list[tuple[float, int, Job, Node | None]] = []
+    running_steps: dict[str, int] = {}
+    seq = 0
+    now = 0.0
+
+    def release(step_id: str) -> None:
+        sim.steps[step_id] = (now, now)
+        if remaining[step_id]:
+            queue[step_id] = jobs[step_id][::-1]
+        else:
+            finish(step_id)
+
+    def finish(step_id: str) -> None:
+        sim.steps[step_id] = (sim.steps[step_id][0], now)
+        for down in graph.downstream[step_id]:
+            waiting[down] -= 1
+            if waiting[down] == 0:
+                release(down)
+
+    for step_id in graph.order:
+        if waiting[step_id] == 0:
+            release(step_id)
+
+    while queue or running:
+        # once a job doesn't fit, no job needing as much does until one ends
+        blocked: set[tuple[float, float]] = set()
+        for step_id, pending in list(queue.items()):
+            while pending:
+                job = pending[-1]
+                node = None
+                if sim.nodes:
+                    if (job.cores, job.ram) in blocked:
+                        break
+                    node = next((n for n in sim.nodes if n.fits(job)), None)
+                    if node is None:
+                        blocked.add((job.cores, job.ram))
+                        break
+                    node.free_cores -= job.cores
+                    node.free_ram -= job.ram
+                    node.busy_core_seconds += job.cores * job.duration
+                    node.busy_ram_seconds += job.ram * job.duration
+                pending.pop()
+                heapq.heappush(running, (now + job.duration, seq, job, node))
+                seq += 1
+                running_steps[step_id] = running_steps.get(step_id, 0) + 1
+            if not pending:
+                del queue[step_id]
+        sim.peak_jobs = max(sim.peak_jobs, len(running))
+        sim.peak_steps = max(sim.peak_steps, len(running_steps))
+
+        now = running[0][0]
+        while running and running[0][0] == now:
+            _, _, job, node = heapq.heappop(running)
+            if node is not None:
+                node.free_cores += job.cores
+                node.free_ram += job.ram
+            running_steps[job.step_id] -= 1
+            if not running_steps[job.step_id]:
+                del running_steps[job.step_id]
+            remaining[job.step_id] -= 1
+            if not remaining[job.step_id]:
+                finish(job.step_id)
+
+    sim.makespan = now
+    return sim
+
+
+def fan_outs(
+    graph: WorkflowGraph,
+    jobs: dict[str, list[Job]],
+    estimates: dict[str, StepEstimate],
+) -> list[tuple[StepConfig, list[str], int, int]]:
+    """
+    Scattered steps with the sources they scatter over, their expected number of
+    items and the number of jobs they run as.
+    """
+    res = []
+    for step_id in graph.order:
+        step = graph.steps[step_id]
+        sources = [i.source or i.id_ for i in step.inputs if i.scatter]
+        if sources:
+            res.append(
+                (step, sources, estimates[step_id].scatter_size, len(jobs[step_id]))
+            )
+    return res
+
+
+def format_seconds(seconds: float) -> str:
+    minutes, secs = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m{secs:02d}s"
+    if minutes:
+        return f"{minutes}m{secs:02d}s"
+    return f"{secs}s"
+
+
+def analyze(
+    config: WorkflowConfig,
+    estimates: dict[str, StepEstimate],
+    nodes: int = 1,
+    cores: float = 8,
+    ram: float = 32768,
+    default: StepEstimate | None = None,
+) -> str:
+    """
+    Report the critical path, parallel width and scatter fan-out of a workflow,
+    and its simulated makespan on `nodes` nodes of `cores` cores and `ram` MB.
+    """
+    default = default or StepEstimate()
+    graph = WorkflowGraph(config)
+    estimates = {s: estimates.get(s, default) for s in graph.steps}
+    jobs = {s: step_jobs(graph.steps[s], estimates[s]) for s in graph.order}
+
+    length, path = critical_path(graph, jobs)
+    unlimited = simulate(graph, jobs)
+    lines = [
+        f"Critical path: {format_seconds(length)}",
+        "  "
+        + " -> ".join(
+            f"{s} ({format_seconds(max((j.duration for j in jobs[s]), default=0))})"
+            for s in path
+        ),
+        f"Parallel width: {unlimited.peak_jobs} jobs of "
+        f"{unlimited.peak_steps} steps at once",
+    ]
+    scattered = fan_outs(graph, jobs, estimates)
+    if scattered:
+        lines.append("Scatter fan-out:")
+        for step, sources, size, n_jobs in scattered:
+            lines.append(
+                f"  {step.id_} over {', '.join(sources)}: {size} items in "
+                f"{n_jobs} jobs"
+            )
+
+    sim = simulate(graph, jobs, [Node(cores, ram) for _ in range(nodes)])
+    lines += [
+        f"Simulated on {nodes} node{'s' if nodes > 1 else ''} of {cores:g} cores "
+        f"and {ram:g} MB RAM:",
+        f"  makespan {format_seconds(sim.makespan)}, "
+        f"{sim.makespan / length if length else 1:.2f}x the critical path",
+    ]
+    for i, node in enumerate(sim.nodes, 1):
+        core_use, ram_use = sim.utilisation(node)
+        lines.append(f"  node {i}: {core_use:.0%} cores, {ram_use:.0%} RAM")
+    width = max(len(s) for s in graph.order) if graph.order else 4
+    lines.append(f"  {'step':<{width}}  {'start':>9}  {'end':>9}")
+    for step_id in sorted(graph.order, key=lambda s: sim.steps[s]):
+        start, end = sim.steps[step_id]
+        lines.append(
+            f"  {step_id:<{width}}  {format_seconds(start):>9}  "
+            f"{format_seconds(end):>9}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,327 @@
+import json
+from pathlib import Path
+from typing import Any
+
+from eoap_gen.config import StepConfig, cwl_parser
+from eoap_gen.serialize import dump, load
+
+# suffix of the chunk tool's outputs and the flatten tool's inputs, a process
+# can't have an input and an output with the same id
+BATCHES = "_batches"
+
+# runs the per item commands written by the InitialWorkDirRequirement, `xargs -P`
+# keeps up to the given number of them running at once
+RUN_BATCH = "tr '\\n' '\\0' < batch_commands.txt | xargs -0 -n 1 -P {} sh -c"
+
+# builds one shell command per item of the batch from the item tool's command line
+BATCH_COMMANDS_JS = """${{
+  var quote = function(v) {{
+    return "'" + String(v).split("'").join("'\\\\''") + "'";
+  }};
+  var str = function(v) {{
+    return v !== null && typeof v === "object" && "path" in v ? v.path : String(v);
+  }};
+  var base = {base};
+  var bindings = [{bindings}];
+  var stepValueFrom = {{{step_value_from}}};
+  var lines = [];
+  for (var i = 0; i < inputs.{first}.length; i++) {{
+    var item = {{}};
+    for (var k in inputs) {{ item[k] = inputs[k]; }}
+    {scattered}
+    var scattered = {{}};
+    for (var k in item) {{ scattered[k] = item[k]; }}
+    for (var k in stepValueFrom) {{
+      item[k] = stepValueFrom[k](scattered[k], scattered);
+    }}
+    var args = base.map(quote);
+    bindings.forEach(function(b) {{
+      var v = b.valueFrom ? b.valueFrom(item[b.id], item) : item[b.id];
+      if (v === null || v === undefined || v === false) {{ return; }}
+      var parts = v === true ? [] : (Array.isArray(v) ? v : [v]).map(str);
+      if (b.prefix !== null) {{
+        if (b.separate || !parts.length) {{ parts.unshift(b.prefix); }}
+        else {{ parts[0] = b.prefix + parts[0]; }}
+      }}
+      args = args.concat(parts.map(quote));
+    }});
+    var dir = "item_" + ("{zeros}" + i).slice(-{width});
+    lines.push("mkdir -p " + dir + " && cd " + dir + " && exec " + args.join(" "));
+  }}
+  return lines.join("\\n") + "\\n";
+}}"""
+
+
+def shortname(uri: str) -> str:
+    return uri.split("#")[-1].split("/")[-1]
+
+
+def clean_ids(node: Any) -> Any:
+    # generated tools can hold absolute ids of their own file, which would point
+    # at the item tool from the batch tools
+    if isinstance(node, dict):
+        return {
+            k: clean_ids(v)
+            for k, v in node.items()
+            if not (k == "name" and str(v).startswith("_:"))
+        }
+    if isinstance(node, list):
+        return [clean_ids(i) for i in node]
+    if isinstance(node, str) and node.startswith("file://") and "#" in node:
+        return shortname(node)
+    return node
+
+
+def as_list(params: list | dict) -> list[dict[str, Any]]:
+    if isinstance(params, dict):
+        return [
+            {"id": k, **(v if isinstance(v, dict) else {"type": v})}
+            for k, v in params.items()
+        ]
+    return [{**p, "id": shortname(p["id"])} for p in params]
+
+
+def array_of(type_: Any) -> dict[str, Any]:
+    return {"type": "array", "items": type_}
+
+
+def expression_js(expr: str) -> str:
+    """
+    Translate a CWL expression, evaluated with `self` and `inputs` in scope, to the
+    body of a JS function.
+    """
+    if expr.startswith("${") and expr.endswith("}"):
+        return expr[2:-1]
+    parts = []
+    literal = ""
+    i = 0
+    while i < len(expr):
+        if expr.startswith("$(", i):
+            depth = 0
+            for j in range(i + 1, len(expr)):
+                depth += {"(": 1, ")": -1}.get(expr[j], 0)
+                if depth == 0:
+                    break
+            else:
+                raise ValueError(f"Unbalanced expression {expr}.")
+            if literal:
+                parts.append(json.dumps(literal))
+                literal = ""
+            parts.append(f"({expr[i + 2 : j]})")
+            i = j + 1
+        else:
+            literal += expr[i]
+            i += 1
+    if literal:
+        parts.append(json.dumps(literal))
+    if len(parts) == 1:
+        return f"return {parts[0]};"
+    return "return " + " + ".join(f"String({p})" for p in parts) + ";"
+
+
+def js_function(expr: str) -> str:
+    return f"function(self, inputs) {{ {expression_js(expr)} }}"
+
+
+def chunk_tool(step: StepConfig) -> dict[str, Any]:
+    scattered = [i.id_ for i in step.inputs if i.scatter]
+    chunks = "".join(
+        f"    out.{i}{BATCHES}.push(inputs.{i}.slice(i, i + size));\n"
+        for i in scattered
+    )
+    expression = (
+        "${\n"
+        f"  var size = {step.scatter_batch_size};\n"
+        f"  var out = {{{', '.join(f'{i}{BATCHES}: []' for i in scattered)}}};\n"
+        f"  for (var i = 0; i < inputs.{scattered[0]}.length; i += size) {{\n"
+        f"{chunks}"
+        "  }\n"
+        "  return out;\n"
+        "}"
+    )
+    return {
+        "class": "ExpressionTool",
+        "doc": f"Split the scattered inputs of {step.id_} into batches.",
+        "requirements": [{"class": "InlineJavascriptRequirement"}],
+        "inputs": [{"id": i, "type": array_of("Any")} for i in scattered],
+        "outputs": [
+            {"id": f"{i}{BATCHES}", "type": array_of("Any")} for i in scattered
+        ],
+        "expression": expression,
+        "cwlVersion": step.cwl_version,
+    }
+
+
+def batch_tool(step: StepConfig, item_tool: dict[str, Any]) -> dict[str, Any]:
+    scattered = {i.id_: i for i in step.inputs if i.scatter}
+    inputs = as_list(item_tool["inputs"])
+
+    base = item_tool.get("baseCommand", [])
+    base = base if isinstance(base, list) else [base]
+    arguments = item_tool.get("arguments", [])
+    if not all(isinstance(a, str) and "$(" not in a for a in arguments):
+        raise ValueError(f"Step {step.id_} tool arguments can't be batched.")
+
+    bound = sorted(
+        (inp for inp in inputs if "inputBinding" in inp),
+        key=lambda inp: (inp["inputBinding"].get("position", 0), inp["id"]),
+    )
+    bindings = []
+    for inp in bound:
+        binding = inp["inputBinding"]
+        value_from = binding.get("valueFrom")
+        bindings.append(
+            "{"
+            f"id: {json.dumps(inp['id'])}, "
+            f"prefix: {json.dumps(binding.get('prefix'))}, "
+            f"separate: {json.dumps(binding.get('separate', True))}, "
+            f"valueFrom: {js_function(value_from) if value_from else 'null'}"
+            "}"
+        )
+    step_value_from = [
+        f"{json.dumps(i.id_)}: {js_function(i.value_from)}"
+        for i in scattered.values()
+        if i.value_from
+    ]
+    width = len(str(step.scatter_batch_size - 1))
+    commands = BATCH_COMMANDS_JS.format(
+        base=json.dumps(base + arguments),
+        bindings=", ".join(bindings),
+        step_value_from=", ".join(step_value_from),
+        first=next(iter(scattered)),
+        scattered=" ".join(f"item.{i} = inputs.{i}[i];" for i in scattered),
+        zeros="0" * width,
+        width=width,
+    )
+
+    outputs = []
+    for out in as_list(item_tool["outputs"]):
+        # plain globs only, see validate_config
+        glob = out["outputBinding"]["glob"]
+        outputs.append(
+            {
+                "id": out["id"],
+                "type": array_of(out["type"]),
+                "outputBinding": {
+                    "glob": "item_*" if glob == "." else f"item_*/{glob}"
+                },
+            }
+        )
+
+    requirements = [
+        r
+        for r in item_tool.get("requirements", [])
+        if r["class"] != "InlineJavascriptRequirement"
+    ]
+    tool = {
+        "class": "CommandLineTool",
+        "doc": (
+            f"Run {step.id_} on a batch of items in one container, "
+            f"{step.scatter_batch_parallelism} at a time."
+        ),
+        "baseCommand": ["sh", "-c"],
+        "arguments": [RUN_BATCH.format(step.scatter_batch_parallelism)],
+        "inputs": [
+            {
+                k: array_of(v) if k == "type" and inp["id"] in scattered else v
+                for k, v in inp.items()
+                if k != "inputBinding"
+            }
+            for inp in inputs
+        ],
+        "outputs": outputs,
+        "requirements": [
+            *requirements,
+            {"class": "InlineJavascriptRequirement"},
+            {
+                "class": "InitialWorkDirRequirement",
+                "listing": [{"entryname": "batch_commands.txt", "entry": commands}],
+            },
+        ],
+        "cwlVersion": step.cwl_version,
+    }
+    if item_tool.get("hints"):
+        tool["hints"] = item_tool["hints"]
+    return tool
+
+
+def flatten_tool(step: StepConfig, item_tool: dict[str, Any]) -> dict[str, Any]:
+    outputs = as_list(item_tool["outputs"])
+    flattened = ", ".join(
+        f"{o['id']}: [].concat.apply([], inputs.{o['id']}{BATCHES})" for o in outputs
+    )
+    return {
+        "class": "ExpressionTool",
+        "doc": f"Flatten the outputs of the batches of {step.id_}.",
+        "requirements": [{"class": "InlineJavascriptRequirement"}],
+        "inputs": [
+            {"id": f"{o['id']}{BATCHES}", "type": array_of(array_of(o["type"]))}
+            for o in outputs
+        ],
+        "outputs": [{"id": o["id"], "type": array_of(o["type"])} for o in outputs],
+        "expression": f"${{ return {{{flattened}}}; }}",
+        "cwlVersion": step.cwl_version,
+    }
+
+
+def generate_batch_tools(
+    step: StepConfig, output_dir: Path, output_format: str = "yaml"
+) -> None:
+    """
+    Generate the tools running a scattered step in batches: one splitting the
+    scattered inputs into batches, one running a whole batch in a single container
+    and one flattening the batches' outputs back into one array per output.
+    """
+    item_tool = clean_ids(load(output_dir / f"{step.id_}.cwl"))
+    chunk_id, batch_id, flatten_id = step.tool_ids()
+    dump(chunk_tool(step), output_dir / f"{chunk_id}.cwl", output_format)
+    dump(batch_tool(step, item_tool), output_dir / f"{batch_id}.cwl", output_format)
+    dump(flatten_tool(step, item_tool), output_dir / f"{flatten_id}.cwl", output_format)
+
+
+def batch_workflow_steps(step: StepConfig) -> list:
+    """
+    Workflow steps replacing a batched step. The last one keeps the step's id, so
+    sources referring to the step's outputs are left as they are.
+    """
+    parser = cwl_parser(step.cwl_version)
+    chunk_id, batch_id, flatten_id = step.tool_ids()
+    scattered = [i for i in step.inputs if i.scatter]
+    return [
+        parser.WorkflowStep(
+            id=chunk_id,
+            run=str(step.run.with_stem(chunk_id).resolve()),
+            in_=[
+                parser.WorkflowStepInput(id=i.id_, source=i.source) for i in scattered
+            ],
+            out=[parser.WorkflowStepOutput(id=f"{i.id_}{BATCHES}") for i in scattered],
+        ),
+        parser.WorkflowStep(
+            id=batch_id,
+            run=str(step.run.with_stem(batch_id).resolve()),
+            in_=[
+                (
+                    parser.WorkflowStepInput(
+                        id=i.id_, source=f"{chunk_id}/{i.id_}{BATCHES}"
+                    )
+                    if i.scatter
+                    else i.to_cwl(step.cwl_version)
+                )
+                for i in step.inputs
+            ],
+            out=[o.to_cwl(step.cwl_version) for o in step.outputs],
+            scatter=[i.id_ for i in scattered],
+            scatterMethod="dotproduct",
+        ),
+        parser.WorkflowStep(
+            id=step.id_,
+            run=str(step.run.with_stem(flatten_id).resolve()),
+            in_=[
+                parser.WorkflowStepInput(
+                    id=f"{o.id_}{BATCHES}", source=f"{batch_id}/{o.id_}"
+                )
+                for o in step.outputs
+            ],
+            out=[o.to_cwl(step.cwl_version) for o in step.outputs],
+        ),
+    ]
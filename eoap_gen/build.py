@@ -0,0 +1,240 @@
+import shutil
+from pathlib import Path
+from typing import Any
+
+import click
+
+from eoap_gen.cache import (
+    BuildManifest,
+    step_artifacts,
+    step_fingerprint,
+    workflow_fingerprint,
+)
+from eoap_gen.config import StepConfig, WorkflowConfig
+from eoap_gen.cwl import (
+    WorkflowValidationError,
+    generate_workflow,
+    pack_workflow,
+    validate_workflow,
+)
+from eoap_gen.dockerfile import generate_shared_dockerfiles
+from eoap_gen.envs import EnvPool
+from eoap_gen.steps import generate_step_tasks, generate_steps, step_docker_url
+from eoap_gen.utils import create_output_dirs, timed
+
+
+def build(
+    config: WorkflowConfig,
+    output_path: Path,
+    docker_url_base: str,
+    docker_tag: str,
+    manifest: BuildManifest,
+    env_pool: EnvPool,
+    jobs: int = 1,
+    introspection: str = "auto",
+    output_format: str = "yaml",
+    buildkit: bool = False,
+    shared_images: bool = False,
+    lock: bool = False,
+    cache_dir: Path | None = None,
+    tools: dict[str, Any] | None = None,
+    timings: dict[str, float] | None = None,
+) -> None:
+    """
+    Generate the steps that changed since the last build recorded in `manifest`,
+    then pack and validate the workflow if anything it depends on changed.
+
+    `tools` holds loaded CommandLineTools between builds, entries of regenerated
+    steps are dropped so they are loaded again when packing.
+    """
+    cli_dir = output_path / "cli"
+    with timed(timings, "steps"):
+        create_output_dirs(output_path, [s.id_ for s in config.steps])
+        manifest.prune([s.id_ for s in config.steps])
+
+        step_keys = {
+            s.id_: step_fingerprint(
+                s,
+                step_docker_url(s, docker_url_base, docker_tag, shared_images),
+                output_format,
+                buildkit,
+                shared_images,
+                lock,
+                introspection,
+            )
+            for s in config.steps
+        }
+        stale_steps = []
+        for s in config.steps:
+            if manifest.is_step_fresh(
+                s, step_keys[s.id_], cli_dir / s.id_, shared_images, lock
+            ):
+                click.echo(f"Step {s.id_} is up to date, skipping.")
+            else:
+                stale_steps.append(s)
+
+        errors = generate_steps(
+            stale_steps,
+            output_path,
+            docker_url_base,
+            docker_tag,
+            jobs=jobs,
+            env_pool=env_pool,
+            introspection=introspection,
+            output_format=output_format,
+            buildkit=buildkit,
+            shared_images=shared_images,
+            lock=lock,
+        )
+        env_pool.evict()
+        for s in stale_steps:
+            if tools is not None:
+                for tool_id in s.tool_ids():
+                    tools.pop(tool_id, None)
+            if s.id_ not in errors:
+                manifest.steps[s.id_] = step_keys[s.id_]
+    if errors:
+        manifest.save()
+        for step_id, exc in errors.items():
+            click.echo(f"Step {step_id} failed: {exc}", err=True)
+        raise click.ClickException(f"Failed generating steps: {', '.join(errors)}.")
+    if shared_images:
+        with timed(timings, "dockerfile"):
+            generate_shared_dockerfiles(config.steps, cli_dir, buildkit, lock)
+
+    wf_key = workflow_fingerprint(config, step_keys)
+    if not manifest.is_workflow_fresh(wf_key, cli_dir):
+        config.set_step_run(cli_dir)
+        packed_wf_path = cli_dir / "workflow-packed.cwl"
+        with timed(timings, "pack"):
+            generate_workflow(config, cli_dir / "workflow.cwl", output_format)
+            packed = pack_workflow(config, packed_wf_path, tools, output_format)
+        with timed(timings, "validate"):
+            try:
+                validate_workflow(packed, packed_wf_path, cache_dir)
+            except WorkflowValidationError as e:
+                manifest.save()
+                for error in e.errors:
+                    click.echo(error, err=True)
+                raise click.ClickException(f"{packed_wf_path} is not valid CWL.")
+        manifest.workflow = wf_key
+    else:
+        click.echo("Workflow is up to date, skipping.")
+    manifest.save()
+
+
+def build_many(
+    configs: list[WorkflowConfig],
+    output_path: Path,
+    docker_url_base: str,
+    docker_tag: str,
+    env_pool: EnvPool,
+    jobs: int = 1,
+    introspection: str = "auto",
+    output_format: str = "yaml",
+    buildkit: bool = False,
+    shared_images: bool = False,
+    lock: bool = False,
+    cache_dir: Path | None = None,
+    no_cache: bool = False,
+) -> dict[str, Exception]:
+    """
+    Build every workflow into `output_path / <workflow id>`.
+
+    Identical steps shared by several workflows are generated once and copied to
+    the other output trees, all steps go through one worker pool. Steps are only
+    identical with the same id, which the generated files are named after. Returns the
+    exceptions of failed workflows, keyed by workflow id.
+    """
+    outputs = {c.id_: output_path / c.id_ for c in configs}
+    manifests = {}
+    # step fingerprint -> every (workflow id, step) needing the step regenerated
+    stale: dict[str, list[tuple[str, StepConfig]]] = {}
+    # step fingerprint -> a step output dir already holding up to date files
+    fresh: dict[str, Path] = {}
+    for c in configs:
+        manifest = BuildManifest.load(outputs[c.id_])
+        if no_cache:
+            manifest = BuildManifest(manifest.path)
+        manifests[c.id_] = manifest
+        create_output_dirs(outputs[c.id_], [s.id_ for s in c.steps])
+        manifest.prune([s.id_ for s in c.steps])
+        for s in c.steps:
+            key = step_fingerprint(
+                s,
+                step_docker_url(s, docker_url_base, docker_tag, shared_images),
+                output_format,
+                buildkit,
+                shared_images,
+                lock,
+                introspection,
+            )
+            step_dir = outputs[c.id_] / "cli" / s.id_
+            if manifest.is_step_fresh(s, key, step_dir, shared_images, lock):
+                fresh.setdefault(key, step_dir)
+            else:
+                stale.setdefault(key, []).append((c.id_, s))
+
+    tasks = {
+        key: (uses[0][1], outputs[uses[0][0]])
+        for key, uses in stale.items()
+        if key not in fresh
+    }
+    click.echo(
+        f"Generating {len(tasks)} unique steps for "
+        f"{sum(len(uses) for uses in stale.values())} stale steps."
+    )
+    step_errors = generate_step_tasks(
+        tasks,
+        docker_url_base,
+        docker_tag,
+        jobs=jobs,
+        env_pool=env_pool,
+        introspection=introspection,
+        output_format=output_format,
+        buildkit=buildkit,
+        shared_images=shared_images,
+        lock=lock,
+    )
+    env_pool.evict()
+
+    errors = {}
+    for key, uses in stale.items():
+        if key in step_errors:
+            step = uses[0][1]
+            click.echo(f"Step {step.id_} failed: {step_errors[key]}", err=True)
+            for wf_id, _ in uses:
+                errors[wf_id] = RuntimeError(f"Failed generating step {step.id_}.")
+            continue
+        src_dir = fresh.get(key) or outputs[uses[0][0]] / "cli" / uses[0][1].id_
+        for wf_id, step in uses:
+            step_dir = outputs[wf_id] / "cli" / step.id_
+            if step_dir != src_dir:
+                for artifact in step_artifacts(step, src_dir, shared_images, lock):
+                    shutil.copy2(artifact, step_dir)
+            manifests[wf_id].steps[step.id_] = key
+
+    for c in configs:
+        if c.id_ in errors:
+            manifests[c.id_].save()
+            continue
+        click.echo(f"Building workflow {c.id_}.")
+        try:
+            build(
+                c,
+                outputs[c.id_],
+                docker_url_base,
+                docker_tag,
+                manifests[c.id_],
+                env_pool,
+                jobs=jobs,
+                introspection=introspection,
+                output_format=output_format,
+                buildkit=buildkit,
+                shared_images=shared_images,
+                lock=lock,
+                cache_dir=cache_dir,
+            )
+        except Exception as e:
+            errors[c.id_] = e
+    return {c.id_: errors[c.id_] for c in configs if c.id_ in errors}
@@ -0,0 +1,230 @@
+import hashlib
+import json
+from dataclasses import asdict, fields, is_dataclass
+from functools import cache
+from pathlib import Path
+from typing import Any
+
+from eoap_gen.config import StepConfig, WorkflowConfig
+
+MANIFEST_NAME = "eoap-gen-manifest.json"
+MANIFEST_VERSION = 1
+
+
+def hash_obj(obj: Any) -> str:
+    raw = json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def hash_file(path: Path | None) -> str | None:
+    if not path:
+        return None
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+@cache
+def generator_version() -> dict[str, Any]:
+    from importlib import metadata, resources
+
+    try:
+        version = metadata.version("eoap-gen")
+    except metadata.PackageNotFoundError:
+        version = None
+    templates = resources.files("eoap_gen") / "templates"
+    return {
+        "version": version,
+        # copied into the images of workflows with metrics
+        "instrument": hashlib.sha256(
+            (resources.files("eoap_gen") / "instrument.py").read_bytes()
+        ).hexdigest(),
+        "templates": {
+            t.name: hashlib.sha256(t.read_bytes()).hexdigest()
+            for t in sorted(templates.iterdir(), key=lambda t: t.name)
+            if t.name.endswith(".jinja")
+        },
+    }
+
+
+def step_fingerprint(
+    step: StepConfig,
+    docker_url: str | None = None,
+    output_format: str = "yaml",
+    buildkit: bool = False,
+    shared_images: bool = False,
+    lock: bool = False,
+    introspection: str = "auto",
+) -> str:
+    # only what ends up in the step's generated files, workflow wiring (sources,
+    # scatter) is covered by the workflow fingerprint
+    return hash_obj(
+        {
+            "generator": generator_version(),
+            # names the tool, Dockerfile and image, so steps differing only by id
+            # don't share generated files
+            "id": step.id_,
+            "script": hash_file(step.script),
+            "script_name": step.script.name if step.script else None,
+            "requirements": hash_file(step.requirements),
+            "apt_install": step.apt_install,
+            "conda": step.conda,
+            "python_version": step.python_version,
+            "base_image_digest": step.base_image_digest,
+            "buildkit": buildkit,
+            "shared_images": shared_images,
+            "lock": lock,
+            # the backends can write different tools for the same script
+            "introspection": introspection if step.script else None,
+            "docker_image": step.docker_image,
+            "docker_url": docker_url,
+            "output_format": output_format,
+            "command": step.command,
+            "inputs": [
+                {
+                    "id": i.id_,
+                    "type": i.type_,
+                    "value_from": i.value_from,
+                    "default": i.default,
+                    "scatter": i.scatter,
+                    "stage": i.stage,
+                }
+                for i in step.inputs
+            ],
+            "outputs": [
+                {"id": o.id_, "params": o.params, "list": o.list_file}
+                for o in step.outputs
+            ],
+            "resources": asdict(step.resources),
+            "scatter_batch_size": step.scatter_batch_size,
+            "scatter_batch_parallelism": step.scatter_batch_parallelism,
+            "cwl_version": step.cwl_version,
+            "load_listing": step.load_listing,
+            "work_reuse": step.work_reuse,
+            "network_access": step.network_access,
+            "metrics": step.metrics,
+            "fused": [
+                step_fingerprint(
+                    s, None, output_format, buildkit, shared_images, lock, introspection
+                )
+                for s in step.fused or []
+            ],
+        }
+    )
+
+
+def workflow_fingerprint(config: WorkflowConfig, step_keys: dict[str, str]) -> str:
+    def to_dict(obj: Any) -> Any:
+        if isinstance(obj, list):
+            return [to_dict(i) for i in obj]
+        if is_dataclass(obj):
+            # fields set after init are the step's run path, copies of the
+            # workflow's cwl_version and indexes
+            return {
+                f.name: to_dict(getattr(obj, f.name)) for f in fields(obj) if f.init
+            }
+        return obj
+
+    return hash_obj(
+        {
+            "generator": generator_version(),
+            "config": to_dict(config),
+            "steps": step_keys,
+        }
+    )
+
+
+def step_artifacts(
+    step: StepConfig,
+    step_output_dir: Path,
+    shared_images: bool = False,
+    lock: bool = False,
+) -> list[Path]:
+    artifacts = [step_output_dir / f"{step.id_}.cwl"]
+    if step.scatter_batch_size:
+        artifacts += [step_output_dir / f"{t}.cwl" for t in step.tool_ids()]
+    if step.fused:
+        from eoap_gen.fuse import FUSED_DRIVER
+
+        artifacts += [
+            step_output_dir / FUSED_DRIVER,
+            step_output_dir / f"{step.id_}.Dockerfile",
+            *(step_output_dir / f"{s.id_}.py" for s in step.fused),
+        ]
+        if step.metrics:
+            artifacts.append(step_output_dir / "instrument.py")
+        if lock and step.requirements:
+            artifacts += [
+                step_output_dir / "requirements.lock",
+                step_output_dir / "wheels",
+            ]
+    elif step.script:
+        artifacts += [
+            step_output_dir / "tool_out.yml",
+            step_output_dir / step.script.name,
+        ]
+        if not shared_images:
+            artifacts.append(step_output_dir / f"{step.id_}.Dockerfile")
+            if step.metrics:
+                artifacts.append(step_output_dir / "instrument.py")
+        if lock and step.requirements:
+            artifacts += [
+                step_output_dir / "requirements.lock",
+                step_output_dir / "wheels",
+            ]
+    return artifacts
+
+
+class BuildManifest:
+    path: Path
+    workflow: str | None
+    steps: dict[str, str]
+
+    def __init__(
+        self,
+        path: Path,
+        workflow: str | None = None,
+        steps: dict[str, str] | None = None,
+    ) -> None:
+        self.path = path
+        self.workflow = workflow
+        self.steps = steps or {}
+
+    @staticmethod
+    def load(output_path: Path) -> "BuildManifest":
+        path = output_path / MANIFEST_NAME
+        try:
+            with open(path) as f:
+                raw = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return BuildManifest(path)
+        if raw.get("version") != MANIFEST_VERSION:
+            return BuildManifest(path)
+        return BuildManifest(path, raw.get("workflow"), raw.get("steps"))
+
+    def save(self) -> None:
+        raw = {
+            "version": MANIFEST_VERSION,
+            "workflow": self.workflow,
+            "steps": dict(sorted(self.steps.items())),
+        }
+        with open(self.path, "w") as f:
+            json.dump(raw, f, indent=2)
+            f.write("\n")
+
+    def is_step_fresh(
+        self,
+        step: StepConfig,
+        key: str,
+        step_output_dir: Path,
+        shared_images: bool = False,
+        lock: bool = False,
+    ) -> bool:
+        return self.steps.get(step.id_) == key and all(
+            p.exists()
+            for p in step_artifacts(step, step_output_dir, shared_images, lock)
+        )
+
+    def is_workflow_fresh(self, key: str, cli_dir: Path) -> bool:
+        return self.workflow == key and (cli_dir / "workflow-packed.cwl").exists()
+
+    def prune(self, step_ids: list[str]) -> None:
+        self.steps = {k: v for k, v in self.steps.items() if k in step_ids}
@@ -1,21 +1,23 @@
-import os
+import glob
+import json
+import time
+from contextlib import contextmanager
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterator
 
 import click
 
-from eoap_gen.config import WorkflowConfig
-from eoap_gen.cwl import (
-    cleanup_packed_workflow,
-    generate_cwl_cli,
-    generate_docker_cli,
-    generate_workflow,
-    modify_cwl_cli,
-    pack_workflow,
-    validate_workflow,
-    write_cwl_cli_outputs,
-)
-from eoap_gen.dockerfile import generate_dockerfile, get_requirements
-from eoap_gen.utils import create_output_dirs, write_action_output
+from eoap_gen.cache import BuildManifest
+from eoap_gen.config import ConfigValidationError, WorkflowConfig
+from eoap_gen.introspect import INTROSPECTION_BACKENDS
+from eoap_gen.serialize import OUTPUT_FORMATS
+from eoap_gen.trace import Tracer, span, tracing
+from eoap_gen.utils import timed, write_action_output
+
+# the CWL and templating machinery is slow to import, commands import it when
+# they need it so --help and config errors stay fast
+if TYPE_CHECKING:
+    from eoap_gen.envs import EnvPool
 
 
 @click.group()
@@ -23,65 +25,597 @@ def cli():
     pass
 
 
-@cli.command()
-@click.option(
-    "--config",
-    "config_path",
-    type=click.Path(exists=True, dir_okay=False, path_type=Path),
-    required=True,
+# options of commands building a single workflow
+CONFIG_OPTIONS = [
+    click.option(
+        "--config",
+        "config_path",
+        type=click.Path(exists=True, dir_okay=False, path_type=Path),
+        required=True,
+    ),
+    click.option(
+        "--output",
+        "output_path",
+        type=click.Path(path_type=Path),
+        required=True,
+    ),
+]
+
+# options shared by all commands generating workflows
+BUILD_OPTIONS = [
+    click.option(
+        "--docker-url-base",
+        required=True,
+        help=(
+            "Base of the docker registry url, e.g. ghcr.io/owner/repo. In combination "
+            "with --docker-tag constructs full Docker pull url."
+        ),
+    ),
+    click.option(
+        "--docker-tag",
+        required=True,
+        help=(
+            "Docker image tag, to be used by CWL to pull generated CommandLineTools, "
+            "e.g. `main`"
+        ),
+    ),
+    click.option(
+        "--jobs",
+        "-j",
+        type=click.IntRange(min=1),
+        default=1,
+        show_default=True,
+        help="Number of steps to generate concurrently.",
+    ),
+    click.option(
+        "--max-env-builds",
+        type=click.IntRange(min=1),
+        default=None,
+        help=(
+            "Maximum number of python environments built at the same time while "
+            "generating script steps. Defaults to --jobs."
+        ),
+    ),
+    click.option(
+        "--env-cache-dir",
+        type=click.Path(file_okay=False, path_type=Path),
+        default=None,
+        help=(
+            "Directory holding the reusable python environments used to introspect "
+            "scripts and workflow validation results. Defaults to $EOAP_GEN_CACHE_DIR "
+            "or ~/.cache/eoap-gen."
+        ),
+    ),
+    click.option(
+        "--env-cache-size",
+        type=click.FloatRange(min=0),
+        default=10,
+        show_default=True,
+        help=(
+            "Size budget of the environment cache in GB, least recently used "
+            "environments are removed when it is exceeded."
+        ),
+    ),
+    click.option(
+        "--introspection",
+        type=click.Choice(INTROSPECTION_BACKENDS),
+        default="auto",
+        show_default=True,
+        help=(
+            "How script CLIs are turned into CWL inputs. `static` parses the script's "
+            "click/argparse definitions without installing or running it, "
+            "`argparse2tool` runs the script under argparse2tool in an environment "
+            "with its requirements, `auto` uses static and falls back to "
+            "argparse2tool for scripts it can't resolve."
+        ),
+    ),
+    click.option(
+        "--output-format",
+        type=click.Choice(OUTPUT_FORMATS),
+        default="yaml",
+        show_default=True,
+        help=(
+            "Serialization of the generated CWL files. JSON is faster to write and "
+            "to load, and is valid CWL as well."
+        ),
+    ),
+    click.option(
+        "--buildkit",
+        is_flag=True,
+        help=(
+            "Generate Dockerfiles using BuildKit cache mounts for apt, micromamba "
+            "and pip downloads, so image rebuilds don't download packages again."
+        ),
+    ),
+    click.option(
+        "--shared-images",
+        is_flag=True,
+        help=(
+            "Build one image per set of script step dependencies, holding the "
+            "scripts of all steps using it, instead of one image per step."
+        ),
+    ),
+    click.option(
+        "--lock",
+        is_flag=True,
+        help=(
+            "Pin script step requirements with their hashes into requirements.lock "
+            "and download them to a wheelhouse in the env cache dir, introspection "
+            "environments and images install from the lock."
+        ),
+    ),
+]
+
+
+NO_CACHE_OPTION = click.option(
+    "--no-cache",
+    is_flag=True,
+    help=(
+        "Regenerate every step, ignoring the build manifest of a previous run in "
+        "the output directory."
+    ),
 )
+
+
+# options reporting where the time of a run went
+TRACE_OPTIONS = [
+    click.option(
+        "--timings",
+        is_flag=True,
+        help="Print a table of the time spent in each phase, per step.",
+    ),
+    click.option(
+        "--trace",
+        "trace_path",
+        type=click.Path(dir_okay=False, path_type=Path),
+        default=None,
+        help=(
+            "Write spans of every phase and subprocess to a file in Chrome trace "
+            "event format, viewable in chrome://tracing or ui.perfetto.dev."
+        ),
+    ),
+]
+
+
+def with_options(*option_lists: list[Callable]) -> Callable:
+    def decorator(f: Callable) -> Callable:
+        for options in reversed(option_lists):
+            for option in reversed(options):
+                f = option(f)
+        return f
+
+    return decorator
+
+
+def make_env_pool(
+    env_cache_dir: Path | None,
+    env_cache_size: float,
+    max_env_builds: int | None,
+    jobs: int,
+) -> "EnvPool":
+    from eoap_gen.envs import EnvPool
+
+    return EnvPool(
+        root=env_cache_dir,
+        max_size=int(env_cache_size * 1024**3),
+        max_builds=max_env_builds or jobs,
+    )
+
+
+@contextmanager
+def traced(timings: bool, trace_path: Path | None) -> Iterator[None]:
+    tracer = Tracer() if timings or trace_path else None
+    with tracing(tracer):
+        try:
+            yield
+        finally:
+            if tracer and trace_path:
+                tracer.write_chrome_trace(trace_path)
+            if tracer and timings:
+                click.echo(tracer.timings_table())
+
+
+def load_config(path: Path) -> WorkflowConfig:
+    try:
+        return WorkflowConfig.load_config(path)
+    except ConfigValidationError as e:
+        raise click.ClickException(str(e))
+
+
+def watched_files(config_path: Path, config: WorkflowConfig | None) -> list[Path]:
+    paths = [config_path]
+    for step in config.steps if config else []:
+        for s in step.fused or [step]:
+            paths += [p for p in (s.script, s.requirements) if p]
+    return paths
+
+
+def file_mtimes(paths: list[Path]) -> dict[Path, float | None]:
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[path] = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtimes[path] = None
+    return mtimes
+
+
+@cli.command()
+@with_options(CONFIG_OPTIONS, BUILD_OPTIONS)
+@NO_CACHE_OPTION
+@with_options(TRACE_OPTIONS)
+def generate(
+    config_path: Path,
+    output_path: Path,
+    docker_url_base: str,
+    docker_tag: str,
+    jobs: int,
+    max_env_builds: int | None,
+    env_cache_dir: Path | None,
+    env_cache_size: float,
+    introspection: str,
+    output_format: str,
+    buildkit: bool,
+    shared_images: bool,
+    lock: bool,
+    no_cache: bool,
+    timings: bool,
+    trace_path: Path | None,
+):
+    from eoap_gen.build import build
+
+    with traced(timings, trace_path):
+        with span("config"):
+            config = load_config(config_path)
+
+        manifest = BuildManifest.load(output_path)
+        if no_cache:
+            manifest = BuildManifest(manifest.path)
+        env_pool = make_env_pool(env_cache_dir, env_cache_size, max_env_builds, jobs)
+        build(
+            config,
+            output_path,
+            docker_url_base,
+            docker_tag,
+            manifest,
+            env_pool,
+            jobs=jobs,
+            introspection=introspection,
+            output_format=output_format,
+            buildkit=buildkit,
+            shared_images=shared_images,
+            lock=lock,
+            cache_dir=env_cache_dir,
+        )
+        write_action_output(config, shared_images)
+
+
+@cli.command("generate-many")
+@click.argument("configs", nargs=-1, required=True)
 @click.option(
     "--output",
     "output_path",
-    type=click.Path(path_type=Path),
+    type=click.Path(file_okay=False, path_type=Path),
     required=True,
+    help="Directory to write the workflows to, one subdirectory per workflow id.",
 )
+@with_options(BUILD_OPTIONS)
+@NO_CACHE_OPTION
+@with_options(TRACE_OPTIONS)
+def generate_many(
+    configs: tuple[str, ...],
+    output_path: Path,
+    docker_url_base: str,
+    docker_tag: str,
+    jobs: int,
+    max_env_builds: int | None,
+    env_cache_dir: Path | None,
+    env_cache_size: float,
+    introspection: str,
+    output_format: str,
+    buildkit: bool,
+    shared_images: bool,
+    lock: bool,
+    no_cache: bool,
+    timings: bool,
+    trace_path: Path | None,
+):
+    """
+    Generate several workflows at once, given config paths or glob patterns.
+    Steps shared by the workflows are generated only once.
+    """
+    from eoap_gen.build import build_many
+
+    with traced(timings, trace_path):
+        config_paths = []
+        for pattern in configs:
+            matches = sorted(glob.glob(pattern, recursive=True))
+            if not matches:
+                raise click.BadParameter(f"No config matches {pattern}.")
+            config_paths += [Path(m) for m in matches if Path(m) not in config_paths]
+
+        workflows = {}
+        for path in config_paths:
+            config = load_config(path)
+            if config.id_ in workflows:
+                raise click.ClickException(
+                    f"Workflow id {config.id_} is used by both "
+                    f"{workflows[config.id_][0]} and {path}."
+                )
+            workflows[config.id_] = (path, config)
+
+        env_pool = make_env_pool(env_cache_dir, env_cache_size, max_env_builds, jobs)
+        errors = build_many(
+            [config for _, config in workflows.values()],
+            output_path,
+            docker_url_base,
+            docker_tag,
+            env_pool,
+            jobs=jobs,
+            introspection=introspection,
+            output_format=output_format,
+            buildkit=buildkit,
+            shared_images=shared_images,
+            lock=lock,
+            cache_dir=env_cache_dir,
+            no_cache=no_cache,
+        )
+        for wf_id, exc in errors.items():
+            click.echo(f"Workflow {wf_id} failed: {exc}", err=True)
+        if errors:
+            raise click.ClickException(
+                f"Failed generating workflows: {', '.join(errors)}."
+            )
+
+
+@cli.command()
+@with_options(CONFIG_OPTIONS, BUILD_OPTIONS)
 @click.option(
-    "--docker-url-base",
-    required=True,
-    help=(
-        "Base of the docker registry url, e.g. ghcr.io/owner/repo. In combination with "
-        "--docker-tag constructs full Docker pull url."
-    ),
+    "--interval",
+    type=click.FloatRange(min=0, min_open=True),
+    default=1.0,
+    show_default=True,
+    help="Seconds between checks for changed files.",
 )
+def watch(
+    config_path: Path,
+    output_path: Path,
+    docker_url_base: str,
+    docker_tag: str,
+    jobs: int,
+    max_env_builds: int | None,
+    env_cache_dir: Path | None,
+    env_cache_size: float,
+    introspection: str,
+    output_format: str,
+    buildkit: bool,
+    shared_images: bool,
+    lock: bool,
+    interval: float,
+):
+    """
+    Regenerate the workflow whenever the config or a step's script or requirements
+    change, only redoing the steps affected by the change.
+    """
+    from eoap_gen.build import build
+
+    manifest = BuildManifest.load(output_path)
+    env_pool = make_env_pool(env_cache_dir, env_cache_size, max_env_builds, jobs)
+    config = None
+    tools = {}
+    config_mtime = None
+    mtimes = None
+    click.echo(f"Watching {config_path} for changes, press Ctrl+C to stop.")
+    try:
+        while True:
+            new_mtimes = file_mtimes(watched_files(config_path, config))
+            if new_mtimes == mtimes:
+                time.sleep(interval)
+                continue
+            mtimes = new_mtimes
+
+            timings = {}
+            start = time.perf_counter()
+            try:
+                if config is None or mtimes[config_path] != config_mtime:
+                    with timed(timings, "config"):
+                        config = load_config(config_path)
+                    # only once loaded, so a broken config is retried on any change
+                    config_mtime = mtimes[config_path]
+                    # pick up scripts added to the config
+                    mtimes = file_mtimes(watched_files(config_path, config))
+                build(
+                    config,
+                    output_path,
+                    docker_url_base,
+                    docker_tag,
+                    manifest,
+                    env_pool,
+                    jobs=jobs,
+                    introspection=introspection,
+                    output_format=output_format,
+                    buildkit=buildkit,
+                    shared_images=shared_images,
+                    lock=lock,
+                    cache_dir=env_cache_dir,
+                    tools=tools,
+                    timings=timings,
+                )
+            except Exception as e:
+                click.echo(f"Generating failed: {e}", err=True)
+                continue
+            phases = ", ".join(f"{k} {v:.2f}s" for k, v in timings.items())
+            click.echo(
+                f"Generated {config.id_} in {time.perf_counter() - start:.2f}s "
+                f"({phases})."
+            )
+    except KeyboardInterrupt:
+        pass
+
+
+@cli.command()
 @click.option(
-    "--docker-tag",
+    "--config",
+    "config_path",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
     required=True,
+)
+@click.option(
+    "--estimates",
+    "estimates_path",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=None,
     help=(
-        "Docker image tag, to be used by CWL to pull generated CommandLineTools, e.g. "
-        "`main`"
+        "YAML or JSON file mapping step ids to their expected `duration` in "
+        "seconds, per item for scattered steps, and `scatter_size`."
     ),
 )
-def generate(
-    config_path: Path, output_path: Path, docker_url_base: str, docker_tag: str
+@click.option(
+    "--duration",
+    type=click.FloatRange(min=0),
+    default=60,
+    show_default=True,
+    help="Duration in seconds of steps without an estimate.",
+)
+@click.option(
+    "--scatter-size",
+    type=click.IntRange(min=0),
+    default=10,
+    show_default=True,
+    help="Number of items of scattered steps without an estimate.",
+)
+@click.option("--nodes", type=click.IntRange(min=1), default=1, show_default=True)
+@click.option(
+    "--cores",
+    type=click.FloatRange(min=0, min_open=True),
+    default=8,
+    show_default=True,
+    help="Cores per node.",
+)
+@click.option(
+    "--ram",
+    type=click.FloatRange(min=0, min_open=True),
+    default=32768,
+    show_default=True,
+    help="RAM per node in MB.",
+)
+def analyze(
+    config_path: Path,
+    estimates_path: Path | None,
+    duration: float,
+    scatter_size: int,
+    nodes: int,
+    cores: float,
+    ram: float,
 ):
-    config = WorkflowConfig.load_config(config_path)
-
-    create_output_dirs(output_path, [s.id_ for s in config.steps])
-    for s in config.steps:
-        step_output_dir = output_path / "cli" / s.id_
-        if s.docker_image:
-            generate_docker_cli(s, step_output_dir)
-        elif s.script:
-            generate_dockerfile(s, step_output_dir)
-            write_cwl_cli_outputs(step_output_dir / "tool_out.yml", s.outputs)
-            generate_cwl_cli(
-                script_path=s.script,
-                output_dir=step_output_dir,
-                step_id=s.id_,
-                requirements=get_requirements(s.requirements),
-                cwl_outputs_path=step_output_dir / "tool_out.yml",
-                conda_pkgs=s.conda,
-                python_version=s.python_version,
-            )
-            full_docker_url = os.path.join(docker_url_base, f"{s.id_}:{docker_tag}")
-            modify_cwl_cli(step_output_dir / f"{s.script.stem}.cwl", full_docker_url, s)
-        else:
-            raise ValueError(f"Step {s.id_} has no docker image or script.")
-    config.set_step_run(output_path / "cli")
-    wf_path = output_path / "cli" / "workflow.cwl"
-    generate_workflow(config, wf_path)
-    packed_wf_path = pack_workflow(wf_path)
-    cleanup_packed_workflow(packed_wf_path, config.id_)
-    validate_workflow(packed_wf_path)
-    write_action_output(config)
+    """
+    Report the critical path, parallel width and scatter fan-out of a workflow,
+    and simulate running it on a cluster to predict its makespan and the
+    utilisation of each node.
+    """
+    from eoap_gen.analyze import StepEstimate, analyze, load_estimates
+
+    config = load_config(config_path)
+    try:
+        estimates = load_estimates(
+            estimates_path, duration, scatter_size, step_ids=config.steps_by_id
+        )
+        report = analyze(
+            config,
+            estimates,
+            nodes=nodes,
+            cores=cores,
+            ram=ram,
+            default=StepEstimate(duration, scatter_size),
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(report)
+
+
+@cli.command()
+@with_options(CONFIG_OPTIONS)
+@click.option(
+    "--inputs",
+    "inputs_path",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=None,
+    help="Job order file with the workflow inputs, defaults are used otherwise.",
+)
+@click.option(
+    "--runner",
+    default="cwltool --parallel --no-container",
+    show_default=True,
+    help="CWL runner command, given --outdir, the workflow and the inputs.",
+)
+@click.option(
+    "--python",
+    default="python",
+    show_default=True,
+    help="Interpreter running script steps, it needs their requirements.",
+)
+@click.option(
+    "--run-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Directory for the run's workflow, outputs and metrics. Defaults to "
+    "<output>/run.",
+)
+@click.option(
+    "--report",
+    "report_path",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="JSON report path. Defaults to <run dir>/report.json.",
+)
+@click.option(
+    "--html",
+    "html_path",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Also write the report as an HTML page.",
+)
+def run(
+    config_path: Path,
+    output_path: Path,
+    inputs_path: Path | None,
+    runner: str,
+    python: str,
+    run_dir: Path | None,
+    report_path: Path | None,
+    html_path: Path | None,
+):
+    """
+    Run a generated workflow on this machine without containers, and report the
+    wall time, cpu time, peak memory and staged bytes of each step and job.
+    """
+    from eoap_gen.execute import run_workflow, write_html_report
+
+    config = load_config(config_path)
+    if not (output_path / "cli" / "workflow-packed.cwl").exists():
+        raise click.ClickException(
+            f"No generated workflow in {output_path}, run `eoap-gen generate` first."
+        )
+    run_dir = run_dir or output_path / "run"
+    report = run_workflow(config, output_path, run_dir, inputs_path, runner, python)
+    report_path = report_path or run_dir / "report.json"
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+    if html_path:
+        write_html_report(report, html_path)
+
+    width = max([len("step"), *(len(s) for s in report["steps"])])
+    click.echo(
+        f"{'step':<{width}}  {'jobs':>5}  {'wall':>8}  {'cpu':>8}  {'peak RSS':>9}"
+    )
+    for step_id, step in report["steps"].items():
+        click.echo(
+            f"{step_id:<{width}}  {step['jobs']:>5}  {step['wall_s']:>7.2f}s  "
+            f"{step['cpu_s']:>7.2f}s  {step['max_rss_kb'] / 1024:>6.1f} MB"
+        )
+    click.echo(f"Report written to {report_path}.")
+    if report["returncode"] != 0:
+        raise click.ClickException(
+            f"Workflow run failed with exit code {report['returncode']}."
+        )
@@ -1,40 +1,162 @@
+import importlib
 import os
+from dataclasses import dataclass, field, fields
 from pathlib import Path
 from typing import Any
 
-from cwl_utils.parser.cwl_v1_0 import (
-    InputParameter,
-    ResourceRequirement,
-    ScatterFeatureRequirement,
-    Workflow,
-    WorkflowOutputParameter,
-    WorkflowStep,
-    WorkflowStepInput,
-    WorkflowStepOutput,
-)
-from ruamel.yaml import YAML
+from eoap_gen.serialize import load
+
+CWL_VERSIONS = ("v1.0", "v1.2")
+LOAD_LISTINGS = ("no_listing", "shallow_listing", "deep_listing")
+# read-only links into the work dir, or writable ones the step updates in place
+STAGES = ("link", "inplace")
+# file the tools of workflows with metrics write their runtime metrics to
+METRICS_FILE = "metrics.json"
+SCATTER_METHODS = ("dotproduct", "nested_crossproduct", "flat_crossproduct")
+
+# keys each part of a config can set and the types of their values, CWL types
+# can be names or schemas
+CWL_TYPE = (str, dict, list)
+NUMBER = (int, float)
+RESOURCE_KEYS: dict[str, Any] = {
+    **{
+        f"{r}_{b}": NUMBER
+        for r in ["cores", "ram", "tmpdir", "outdir"]
+        for b in ["min", "max"]
+    },
+    "hint": bool,
+}
+WORKFLOW_KEYS: dict[str, Any] = {
+    "id": str,
+    "doc": str,
+    "label": str,
+    "cwl_version": str,
+    "resources": dict,
+    "inputs": list,
+    "outputs": list,
+    "steps": list,
+    "fuse": bool,
+    "metrics": bool,
+}
+WORKFLOW_INPUT_KEYS: dict[str, Any] = {
+    "id": str,
+    "type": CWL_TYPE,
+    "label": str,
+    "doc": str,
+    "default": object,
+}
+WORKFLOW_OUTPUT_KEYS: dict[str, Any] = {
+    "id": str,
+    "type": CWL_TYPE,
+    "source": (str, list),
+}
+STEP_KEYS: dict[str, Any] = {
+    "id": str,
+    "script": str,
+    "requirements": str,
+    "apt_install": list,
+    "docker_image": str,
+    "command": str,
+    "inputs": list,
+    "outputs": list,
+    "scatter_method": str,
+    "conda": list,
+    # an unquoted 3.11 is read as a number
+    "python_version": (str, *NUMBER),
+    "resources": dict,
+    "scatter_batch_size": int,
+    "scatter_batch_parallelism": int,
+    "base_image_digest": str,
+    "load_listing": str,
+    "work_reuse": bool,
+    "network_access": bool,
+    "fuse": bool,
+}
+STEP_INPUT_KEYS: dict[str, Any] = {
+    "id": str,
+    "source": str,
+    "scatter": bool,
+    "value_from": str,
+    "default": object,
+    "type": CWL_TYPE,
+    "stage": str,
+}
+
+
+def cwl_parser(cwl_version: str) -> Any:
+    # the cwl_utils module holding the classes of a CWL version
+    return importlib.import_module(
+        "cwl_utils.parser.cwl_" + cwl_version.replace(".", "_")
+    )
+
+
+@dataclass(slots=True, eq=False)
+class ResourcesConfig:
+    cores_min: int | float | None = None
+    cores_max: int | float | None = None
+    ram_min: int | float | None = None
+    ram_max: int | float | None = None
+    tmpdir_min: int | float | None = None
+    tmpdir_max: int | float | None = None
+    outdir_min: int | float | None = None
+    outdir_max: int | float | None = None
+    hint: bool | None = None  # emit as a hint rather than a requirement
+
+    @staticmethod
+    def from_dict(d: dict[str, Any] | None):
+        d = d or {}
+        return ResourcesConfig(
+            cores_min=d.get("cores_min"),
+            cores_max=d.get("cores_max"),
+            ram_min=d.get("ram_min"),
+            ram_max=d.get("ram_max"),
+            tmpdir_min=d.get("tmpdir_min"),
+            tmpdir_max=d.get("tmpdir_max"),
+            outdir_min=d.get("outdir_min"),
+            outdir_max=d.get("outdir_max"),
+            hint=d.get("hint"),
+        )
+
+    def with_defaults(self, defaults: "ResourcesConfig") -> "ResourcesConfig":
+        return ResourcesConfig(
+            **{
+                f.name: (
+                    getattr(self, f.name)
+                    if getattr(self, f.name) is not None
+                    else getattr(defaults, f.name)
+                )
+                for f in fields(self)
+            }
+        )
+
+    def to_cwl(self, cwl_version: str = "v1.0"):
+        if all(getattr(self, f.name) is None for f in fields(self) if f.name != "hint"):
+            return None
+        return cwl_parser(cwl_version).ResourceRequirement(
+            coresMin=self.cores_min,
+            coresMax=self.cores_max,
+            ramMin=self.ram_min,
+            ramMax=self.ram_max,
+            tmpdirMin=self.tmpdir_min,
+            tmpdirMax=self.tmpdir_max,
+            outdirMin=self.outdir_min,
+            outdirMax=self.outdir_max,
+        )
 
 
+@dataclass(slots=True, eq=False)
 class WorkflowInputConfig:
     id_: str
-    label: str
-    doc: str
-    type_: str
-    default: str | None
-
-    def __init__(
-        self,
-        id_: str,
-        type_: str | None = None,
-        label: str | None = None,
-        doc: str | None = None,
-        default: str | None = None,
-    ) -> None:
-        self.id_ = id_
-        self.type_ = type_ or "string"
+    type_: str | None = None  # string when not set
+    label: str | None = None
+    doc: str | None = None
+    default: str | None = None
+
+    def __post_init__(self) -> None:
+        id_, label, doc = self.id_, self.label, self.doc
+        self.type_ = self.type_ or "string"
         self.label = label or doc or id_
         self.doc = doc or label or id_
-        self.default = default
 
     @staticmethod
     def from_dict(d: dict[str, Any]):
@@ -46,8 +168,11 @@ class WorkflowInputConfig:
             default=d.get("default"),
         )
 
-    def to_cwl(self):
-        return InputParameter(
+    def to_cwl(self, cwl_version: str = "v1.0"):
+        parser = cwl_parser(cwl_version)
+        # workflow inputs got their own class after v1.0
+        cls = getattr(parser, "WorkflowInputParameter", None) or parser.InputParameter
+        return cls(
             id=self.id_,
             label=self.label,
             doc=self.doc,
@@ -56,23 +181,16 @@ class WorkflowInputConfig:
         )
 
 
+@dataclass(slots=True, eq=False)
 class WorkflowOutputConfig:
     id_: str
-    type_: str
-    source: list[str]
-
-    def __init__(
-        self,
-        id_: str,
-        source: str | list[str],
-        type_: str | None = None,
-    ) -> None:
-        self.id_ = id_
-        self.type_ = type_ or "Directory"
-        if isinstance(source, list):
-            self.source = source
-        else:
-            self.source = [source]
+    source: list[str]  # a single source is put in a list
+    type_: str | None = None  # Directory when not set
+
+    def __post_init__(self) -> None:
+        self.type_ = self.type_ or "Directory"
+        if not isinstance(self.source, list):
+            self.source = [self.source]
 
     @staticmethod
     def from_dict(d: dict[str, Any]):
@@ -82,37 +200,23 @@ class WorkflowOutputConfig:
             source=d["source"],
         )
 
-    def to_cwl(self):
-        return WorkflowOutputParameter(
+    def to_cwl(self, cwl_version: str = "v1.0"):
+        return cwl_parser(cwl_version).WorkflowOutputParameter(
             id=self.id_,
             outputSource=self.source,
             type_=self.type_,
         )
 
 
+@dataclass(slots=True, eq=False)
 class StepInputConfig:
     id_: str
-    source: str | None
-    scatter: bool
-    value_from: str | None
-    default: str | None
-    type_: str | None
-
-    def __init__(
-        self,
-        id_: str,
-        source: str | None = None,
-        scatter: bool = False,
-        value_from: str | None = None,
-        default: str | None = None,
-        type_: str | None = None,
-    ) -> None:
-        self.id_ = id_
-        self.source = source
-        self.scatter = scatter
-        self.value_from = value_from
-        self.default = default
-        self.type_ = type_
+    source: str | None = None
+    scatter: bool = False
+    value_from: str | None = None
+    default: str | None = None
+    type_: str | None = None
+    stage: str | None = None  # how File and Directory inputs are put in the work dir
 
     @staticmethod
     def from_dict(d: dict[str, Any]):
@@ -123,10 +227,11 @@ class StepInputConfig:
             value_from=d.get("value_from"),
             default=d.get("default"),
             type_=d.get("type"),
+            stage=d.get("stage"),
         )
 
-    def to_cwl(self):
-        return WorkflowStepInput(
+    def to_cwl(self, cwl_version: str = "v1.0"):
+        return cwl_parser(cwl_version).WorkflowStepInput(
             id=self.id_,
             source=self.source,
             valueFrom=self.value_from,
@@ -134,75 +239,69 @@ class StepInputConfig:
         )
 
 
+@dataclass(slots=True, eq=False)
 class StepOutputConfig:
     id_: str
     params: dict[str, Any]
+    list_file: str | None = None  # file the step writes the output's items to
 
-    def __init__(self, id_: str, params: dict[str, Any]) -> None:
-        self.id_ = id_
-        self.params = params
+    def __post_init__(self) -> None:
+        if self.list_file:
+            # set from the cwl.output.json the tool's wrapper writes
+            self.params = {"type": "string[]"}
 
     @staticmethod
     def from_dict(d: dict[str, Any]):
-        params = {k: v for k, v in d.items() if k != "id"}
+        params = {k: v for k, v in d.items() if k not in ["id", "list"]}
         return StepOutputConfig(
             id_=d["id"],
             params=params,
+            list_file=d.get("list"),
         )
 
-    def to_cwl(self):
-        return WorkflowStepOutput(id=self.id_)
+    def to_cwl(self, cwl_version: str = "v1.0"):
+        return cwl_parser(cwl_version).WorkflowStepOutput(id=self.id_)
 
 
+@dataclass(slots=True, eq=False)
 class StepConfig:
     id_: str
-    script: Path | None  # if generating from py script
-    requirements: Path | None  # if generating from py script
-    apt_install: list[str] | None  # if generating from py script
-    docker_image: str | None  # if 3rd party docker image
-    command: str | None  # if 3rd party docker image
     inputs: list[StepInputConfig]
     outputs: list[StepOutputConfig]
-    scatter_ids: list[str] | None
-    scatter_method: str | None
-    run: Path
-    conda: (
-        list[str] | None
-    )  # if generating from py script, and should create a conda env
-    python_version: (
-        str | None
-    )  # if generating from py script, and should create a conda env
-
-    def __init__(
-        self,
-        id_: str,
-        inputs: list[StepInputConfig],
-        outputs: list[StepOutputConfig],
-        script: os.PathLike | None = None,
-        requirements: os.PathLike | None = None,
-        apt_install: list[str] | None = None,
-        docker_image: str | None = None,
-        command: str | None = None,
-        scatter_ids: list[str] | None = None,
-        scatter_method: str | None = None,
-        conda: list[str] | None = None,
-        python_version: str | None = None,
-    ) -> None:
-        self.id_ = id_
-        self.script = Path(script) if script else None
-        self.requirements = Path(requirements) if requirements else None
-        self.apt_install = apt_install
-        self.docker_image = docker_image
-        self.command = command
-        self.inputs = inputs
-        self.outputs = outputs
-        self.scatter_ids = scatter_ids
-        if scatter_ids and not scatter_method:
+    script: Path | None = None  # if generating from py script
+    requirements: Path | None = None  # if generating from py script
+    apt_install: list[str] | None = None  # if generating from py script
+    docker_image: str | None = None  # if 3rd party docker image
+    command: str | None = None  # if 3rd party docker image
+    scatter_ids: list[str] | None = None
+    scatter_method: str | None = None
+    # if generating from py script, and should create a conda env
+    conda: list[str] | None = None
+    python_version: str | None = None
+    resources: ResourcesConfig = field(default_factory=ResourcesConfig)
+    scatter_batch_size: int | None = None  # run this many scatter items per container
+    scatter_batch_parallelism: int = 1  # items of a batch running at the same time
+    base_image_digest: str | None = None  # if generating from py script
+    load_listing: str | None = None  # CWL v1.2 only, like the rest below
+    work_reuse: bool | None = None
+    network_access: bool | None = None
+    fuse: bool | None = None  # fuse with the step it follows, the workflow's if None
+    fused: list["StepConfig"] | None = None  # steps run by a fused step, in order
+    cwl_version: str = field(default="v1.0", init=False)  # the workflow's
+    metrics: bool = field(default=False, init=False)  # the workflow's
+    run: Path = field(init=False)
+    inputs_by_id: dict[str, StepInputConfig] = field(init=False, repr=False)
+    outputs_by_id: dict[str, StepOutputConfig] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.script = Path(self.script) if self.script else None
+        self.requirements = Path(self.requirements) if self.requirements else None
+        if self.scatter_ids and not self.scatter_method:
             self.scatter_method = "dotproduct"
-        else:
-            self.scatter_method = scatter_method
-        self.conda = conda
-        self.python_version = python_version
+        self.resources = self.resources or ResourcesConfig()
+        self.scatter_batch_parallelism = self.scatter_batch_parallelism or 1
+        self.inputs_by_id = {i.id_: i for i in self.inputs}
+        self.outputs_by_id = {o.id_: o for o in self.outputs}
 
     @staticmethod
     def from_dict(d: dict[str, Any]):
@@ -229,58 +328,568 @@ class StepConfig:
             scatter_ids=scatter_ids,
             scatter_method=d.get("scatter_method"),
             conda=d.get("conda"),
-            python_version=d.get("python_version"),
+            python_version=(
+                str(d["python_version"]) if d.get("python_version") else None
+            ),
+            resources=ResourcesConfig.from_dict(d.get("resources")),
+            scatter_batch_size=d.get("scatter_batch_size"),
+            scatter_batch_parallelism=d.get("scatter_batch_parallelism"),
+            base_image_digest=d.get("base_image_digest"),
+            load_listing=d.get("load_listing"),
+            work_reuse=d.get("work_reuse"),
+            network_access=d.get("network_access"),
+            fuse=d.get("fuse"),
+        )
+
+    def tool_ids(self) -> list[str]:
+        # tools the workflow runs for this step, each generated into
+        # `<tool id>.cwl` next to the step's own tool
+        if self.scatter_batch_size:
+            return [f"{self.id_}_chunk", f"{self.id_}_batch", f"{self.id_}_flatten"]
+        return [self.id_]
+
+    def runtime_to_cwl(self) -> tuple[list, list]:
+        """
+        Requirements and hints of the step's tools controlling directory listing,
+        work reuse and network access.
+        """
+        if self.cwl_version == "v1.0":
+            return [], []
+        parser = cwl_parser(self.cwl_version)
+        requirements = []
+        if self.load_listing:
+            requirements.append(
+                parser.LoadListingRequirement(loadListing=self.load_listing)
+            )
+        # v1.0 tools always have network access, keep it unless turned off
+        requirements.append(
+            parser.NetworkAccess(networkAccess=self.network_access is not False)
         )
+        hints = []
+        if self.work_reuse is not None:
+            hints.append(parser.WorkReuse(enableReuse=self.work_reuse))
+        return requirements, hints
+
+    def staging_to_cwl(self) -> tuple[list, list]:
+        """
+        Work dir entries staging the step's inputs that set `stage`, linked rather
+        than copied, and the requirements updating them in place needs.
+        """
+        parser = cwl_parser(self.cwl_version)
+        entries = []
+        for inp in self.inputs:
+            if not inp.stage:
+                continue
+            writable = inp.stage == "inplace"
+            if self.cwl_version == "v1.0":
+                # v1.0 entries can't be arrays, expressions can return them
+                entries.append(f"$(inputs.{inp.id_})")
+            else:
+                entries.append(
+                    parser.Dirent(entry=f"$(inputs.{inp.id_})", writable=writable)
+                )
+        requirements = []
+        if any(inp.stage == "inplace" for inp in self.inputs):
+            requirements.append(parser.InplaceUpdateRequirement(inplaceUpdate=True))
+        return entries, requirements
+
+    def recaptured_outputs(self) -> list[str]:
+        # outputs globbing the whole work dir, staged inputs or metrics included
+        staged = any(inp.stage for inp in self.inputs)
+        return [
+            o.id_
+            for o in self.outputs
+            if (o.params.get("outputBinding") or {}).get("glob") in [".", "./", "*"]
+            and (
+                (staged and "Directory" in str(o.params.get("type")))
+                or (self.metrics and o.id_ != "metrics")
+            )
+        ]
 
     def to_cwl(self):
-        return WorkflowStep(
+        return cwl_parser(self.cwl_version).WorkflowStep(
             id=self.id_,
             run=str(self.run.resolve()),
-            in_=[inp.to_cwl() for inp in self.inputs],
-            out=[out.to_cwl() for out in self.outputs],
+            in_=[inp.to_cwl(self.cwl_version) for inp in self.inputs],
+            out=[out.to_cwl(self.cwl_version) for out in self.outputs],
             scatter=self.scatter_ids or None,
             scatterMethod=self.scatter_method,
         )
 
 
+class ConfigValidationError(ValueError):
+    def __init__(self, errors: list[str], path: os.PathLike | None = None):
+        self.errors = errors
+        self.path = path
+        where = f"{path} is not a valid config" if path else "Invalid config"
+        super().__init__(f"{where}:\n" + "\n".join(errors))
+
+
+def check_keys(
+    d: Any, keys: dict[str, Any], required: list[str], where: str
+) -> list[str]:
+    if not isinstance(d, dict):
+        return [f"{where}: must be a mapping."]
+    errors = [f"{where}: missing {k}." for k in required if k not in d]
+    for k, v in d.items():
+        if k not in keys:
+            errors.append(f"{where}: unknown key {k}.")
+        # bool is an int, but not a number of cores
+        elif v is not None and (
+            not isinstance(v, keys[k]) or (isinstance(v, bool) and keys[k] is not bool)
+        ):
+            errors.append(f"{where}.{k}: {v!r} has the wrong type.")
+    return errors
+
+
+def check_choice(value: Any, choices: tuple[str, ...], where: str) -> list[str]:
+    if value is None or value in choices:
+        return []
+    return [f"{where}: {value!r} must be one of {', '.join(choices)}."]
+
+
+def check_ids(items: list[Any], where: str) -> list[str]:
+    seen = set()
+    errors = []
+    for item in items:
+        id_ = item.get("id") if isinstance(item, dict) else None
+        if id_ in seen:
+            errors.append(f"{where}: id {id_} is used twice.")
+        seen.add(id_)
+    return errors
+
+
+def validate_config(d: Any) -> list[str]:
+    """
+    Check a raw config in one pass before anything is built: its keys and their
+    types, ids, that every source refers to a workflow input or step output,
+    every scatter option to scattered inputs and every option to a step and CWL
+    version supporting it. Returns all problems found.
+    """
+    errors = check_keys(d, WORKFLOW_KEYS, ["id", "outputs", "steps"], "config")
+    if not isinstance(d, dict):
+        return errors
+    wf_id = d.get("id")
+    v1_0 = (d.get("cwl_version") or "v1.0") == "v1.0"
+    errors += check_choice(d.get("cwl_version"), CWL_VERSIONS, "cwl_version")
+    if isinstance(d.get("resources"), dict):
+        errors += check_keys(d["resources"], RESOURCE_KEYS, [], "resources")
+
+    inputs = d.get("inputs") if isinstance(d.get("inputs"), list) else []
+    outputs = d.get("outputs") if isinstance(d.get("outputs"), list) else []
+    steps = d.get("steps") if isinstance(d.get("steps"), list) else []
+    # every source a step input or workflow output can take data from, and the
+    # list outputs scattering the inputs they're sources of
+    sources = set()
+    lists = set()
+    for i, inp in enumerate(inputs):
+        errors += check_keys(inp, WORKFLOW_INPUT_KEYS, ["id"], f"inputs[{i}]")
+        if isinstance(inp, dict):
+            sources.add(f"{wf_id}/{inp.get('id')}")
+    for step in steps:
+        if isinstance(step, dict) and isinstance(step.get("outputs"), list):
+            for o in step["outputs"]:
+                if isinstance(o, dict):
+                    sources.add(f"{step.get('id')}/{o.get('id')}")
+                    if o.get("list"):
+                        lists.add(f"{step.get('id')}/{o.get('id')}")
+    errors += check_ids(inputs, "inputs") + check_ids(outputs, "outputs")
+    errors += check_ids(steps, "steps")
+    output_ids = {o.get("id") for o in outputs if isinstance(o, dict)}
+
+    for i, out in enumerate(outputs):
+        where = f"outputs[{i}]"
+        errors += check_keys(out, WORKFLOW_OUTPUT_KEYS, ["id", "source"], where)
+        if not isinstance(out, dict):
+            continue
+        source = out.get("source")
+        for src in source if isinstance(source, list) else [source]:
+            if isinstance(src, str) and src not in sources:
+                errors.append(f"{where}.source: no input or step output {src}.")
+
+    for n, step in enumerate(steps):
+        where = f"steps[{n}]"
+        errors += check_keys(step, STEP_KEYS, ["id"], where)
+        if not isinstance(step, dict):
+            continue
+        if bool(step.get("script")) == bool(step.get("docker_image")):
+            errors.append(f"{where}: set either script or docker_image.")
+        errors += check_choice(
+            step.get("scatter_method"), SCATTER_METHODS, f"{where}.scatter_method"
+        )
+        errors += check_choice(
+            step.get("load_listing"), LOAD_LISTINGS, f"{where}.load_listing"
+        )
+        if isinstance(step.get("resources"), dict):
+            errors += check_keys(
+                step["resources"], RESOURCE_KEYS, [], f"{where}.resources"
+            )
+        if v1_0 and any(
+            step.get(k) is not None
+            for k in ["load_listing", "work_reuse", "network_access"]
+        ):
+            errors.append(
+                f"{where}: load_listing, work_reuse and network_access need "
+                "cwl_version v1.2."
+            )
+
+        step_inputs = step.get("inputs") if isinstance(step.get("inputs"), list) else []
+        step_outputs = step.get("outputs")
+        step_outputs = step_outputs if isinstance(step_outputs, list) else []
+        errors += check_ids(step_inputs, f"{where}.inputs")
+        errors += check_ids(step_outputs, f"{where}.outputs")
+        for m, out in enumerate(step_outputs):
+            if not isinstance(out, dict) or "id" not in out:
+                errors.append(f"{where}.outputs[{m}]: missing id.")
+                continue
+            if out.get("list") and set(out) - {"id", "list"}:
+                errors.append(
+                    f"{where}.outputs[{m}]: list outputs can't set other CWL fields."
+                )
+            if out.get("list") and step.get("docker_image"):
+                errors.append(f"{where}.outputs[{m}]: list outputs need a script step.")
+            if d.get("metrics") and out["id"] == "metrics":
+                errors.append(
+                    f"{where}.outputs[{m}]: id metrics is the step's metrics output."
+                )
+        if d.get("metrics") and f"{step.get('id')}_metrics" in output_ids:
+            errors.append(
+                f"outputs: id {step.get('id')}_metrics is {where}'s metrics output."
+            )
+        scattered = 0
+        for m, inp in enumerate(step_inputs):
+            inp_where = f"{where}.inputs[{m}]"
+            errors += check_keys(inp, STEP_INPUT_KEYS, ["id"], inp_where)
+            if not isinstance(inp, dict):
+                continue
+            errors += check_choice(inp.get("stage"), STAGES, f"{inp_where}.stage")
+            if v1_0 and inp.get("stage") == "inplace":
+                errors.append(f"{inp_where}.stage: inplace needs cwl_version v1.2.")
+            source = inp.get("source")
+            scatter = inp.get("scatter")
+            scattered += bool(scatter if "scatter" in inp else source in lists)
+            if not isinstance(source, str):
+                continue
+            if source not in sources:
+                errors.append(f"{inp_where}.source: no input or step output {source}.")
+            elif source.split("/")[0] == step.get("id"):
+                errors.append(f"{inp_where}.source: step takes its own output.")
+        if not scattered and step.get("scatter_method"):
+            errors.append(f"{where}: scatter_method set but no input scatters.")
+        batch_size = step.get("scatter_batch_size")
+        if batch_size is not None:
+            if not scattered:
+                errors.append(f"{where}: scatter_batch_size set but no input scatters.")
+            elif isinstance(batch_size, int) and batch_size < 1:
+                errors.append(f"{where}.scatter_batch_size: must be positive.")
+            if scattered > 1 and (step.get("scatter_method") or "dotproduct") != (
+                "dotproduct"
+            ):
+                errors.append(f"{where}: can only batch scatter_method dotproduct.")
+            errors += batch_problems(step, step_inputs, step_outputs, d, where)
+    return errors
+
+
+def batch_problems(
+    step: dict[str, Any],
+    inputs: list[Any],
+    outputs: list[Any],
+    d: dict[str, Any],
+    where: str,
+) -> list[str]:
+    # a batch runs its items from commands staged in the work dir, so the step
+    # can't stage anything else there, and collects each output from every item
+    errors = []
+    if any(isinstance(o, dict) and o.get("list") for o in outputs):
+        errors.append(f"{where}: batched steps can't have list outputs.")
+    if any(isinstance(i, dict) and i.get("stage") for i in inputs):
+        errors.append(f"{where}: batched steps can't stage inputs.")
+    if d.get("metrics") and step.get("docker_image"):
+        errors.append(f"{where}: batched docker_image steps can't record metrics.")
+    for m, out in enumerate(outputs):
+        if not isinstance(out, dict) or out.get("list"):
+            continue
+        binding = out.get("outputBinding")
+        plain = (
+            isinstance(binding, dict)
+            and set(binding) == {"glob"}
+            and isinstance(binding["glob"], str)
+            and "$" not in binding["glob"]
+        )
+        if not plain:
+            errors.append(
+                f"{where}.outputs[{m}]: batched steps need outputs with a plain glob."
+            )
+    return errors
+
+
+def scatter_list_inputs(steps_raw: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Scatter step inputs taking a list output over its items, unless they set
+    `scatter` themselves.
+    """
+    lists = {
+        f"{s['id']}/{o['id']}"
+        for s in steps_raw
+        for o in s.get("outputs") or []
+        if o.get("list")
+    }
+    return [
+        (
+            {
+                **s,
+                "inputs": [
+                    (
+                        {**inp, "scatter": True}
+                        if "scatter" not in inp and inp.get("source") in lists
+                        else inp
+                    )
+                    for inp in s["inputs"]
+                ],
+            }
+            if s.get("inputs")
+            else s
+        )
+        for s in steps_raw
+    ]
+
+
+def glob_output(params: dict[str, Any]) -> dict[str, Any] | None:
+    """
+    Glob and class of a File or Directory output with a plain glob, which needs
+    no runner to be collected, or None for any other output.
+    """
+    binding = params.get("outputBinding") or {}
+    type_ = params.get("type")
+    if set(binding) != {"glob"} or not isinstance(type_, str):
+        return None
+    glob = binding["glob"]
+    class_ = type_.rstrip("?")
+    array = class_.endswith("[]")
+    class_ = class_.removesuffix("[]")
+    if not isinstance(glob, str) or "$" in glob or class_ not in ["File", "Directory"]:
+        return None
+    return {"glob": glob, "class": class_, "array": array}
+
+
+def fuse_problem(
+    up: StepConfig, down: StepConfig, consumers: dict[str, set[str]]
+) -> str | None:
+    # why `down` can't run in the same tool right after `up`, if anything
+    for step in [up, down]:
+        if not step.script:
+            return f"{step.id_} isn't a script step"
+        if step.scatter_ids:
+            return f"{step.id_} is scattered"
+        if any(o.list_file for o in step.outputs):
+            return f"{step.id_} has list outputs"
+        if any(i.stage for i in step.inputs):
+            return f"{step.id_} stages inputs"
+    if consumers.get(up.id_) != {down.id_}:
+        return f"outputs of {up.id_} are used by other steps or the workflow"
+    if any(glob_output(o.params) is None for o in up.outputs):
+        return f"outputs of {up.id_} need a plain glob and File or Directory type"
+    for inp in down.inputs:
+        if inp.source and inp.source.split("/")[0] == up.id_ and inp.value_from:
+            return f"input {inp.id_} has a value_from"
+
+    def env(step: StepConfig) -> list[Any]:
+        return [
+            step.requirements.resolve() if step.requirements else None,
+            step.apt_install,
+            step.conda,
+            step.python_version,
+            step.base_image_digest,
+            step.load_listing,
+            step.work_reuse,
+            step.network_access,
+        ]
+
+    if env(up) != env(down):
+        return f"{up.id_} and {down.id_} need different environments"
+    return None
+
+
+def fused_step(chain: list[StepConfig], defaults: ResourcesConfig) -> StepConfig:
+    ids = {s.id_ for s in chain}
+    first, last = chain[0], chain[-1]
+    # inputs not taken from other steps of the chain, prefixed by their step id
+    inputs = [
+        StepInputConfig(
+            id_=f"{s.id_}_{inp.id_}",
+            source=inp.source,
+            value_from=inp.value_from,
+            default=inp.default,
+            type_=inp.type_,
+        )
+        for s in chain
+        for inp in s.inputs
+        if not (inp.source and inp.source.split("/")[0] in ids)
+    ]
+    # the scripts run one at a time, so they need the most cores and ram of any,
+    # but the files of each stay in the work dirs, so their sizes add up. Only
+    # what the steps set adds up, the workflow's defaults apply once to the rest
+    values = {
+        f.name: [v for s in chain if (v := getattr(s.resources, f.name)) is not None]
+        for f in fields(ResourcesConfig)
+        if f.name != "hint"
+    }
+    hinted = [
+        bool(s.resources.hint if s.resources.hint is not None else defaults.hint)
+        for s in chain
+        if any(getattr(s.resources, name) is not None for name in values)
+    ]
+    resources = ResourcesConfig(
+        **{
+            name: (
+                (sum(vs) if name.startswith(("tmpdir", "outdir")) else max(vs))
+                if vs
+                else None
+            )
+            for name, vs in values.items()
+        },
+        # a hint only if every step setting resources only hints them
+        hint=all(hinted) if hinted else None,
+    ).with_defaults(defaults)
+    return StepConfig(
+        id_=last.id_,
+        inputs=inputs,
+        outputs=last.outputs,
+        requirements=first.requirements,
+        apt_install=first.apt_install,
+        conda=first.conda,
+        python_version=first.python_version,
+        resources=resources,
+        base_image_digest=first.base_image_digest,
+        load_listing=first.load_listing,
+        work_reuse=first.work_reuse,
+        network_access=first.network_access,
+        fused=chain,
+    )
+
+
+def fuse_steps(
+    steps: list[StepConfig],
+    outputs_raw: list[dict[str, Any]],
+    fuse: bool = False,
+    resources: ResourcesConfig | None = None,
+) -> list[StepConfig]:
+    """
+    Replace chains of script steps, each taking outputs only from the one before
+    it, by a single step running them in order. Steps setting `fuse` are fused
+    with the step they follow or fail, the rest are fused when `fuse` is set and
+    they can be. A fused step takes the id and outputs of its chain's last step,
+    and resources for all of them from what they set, with `resources` as the
+    defaults.
+    """
+    by_id = {s.id_: s for s in steps}
+    consumers: dict[str, set[str]] = {}
+    for step in steps:
+        for inp in step.inputs:
+            source = (inp.source or "").split("/")[0]
+            if source in by_id:
+                consumers.setdefault(source, set()).add(step.id_)
+    for out in outputs_raw:
+        sources = out["source"] if isinstance(out["source"], list) else [out["source"]]
+        for source in sources:
+            consumers.setdefault(source.split("/")[0], set()).add("")
+
+    previous: dict[str, str] = {}
+    errors = []
+    for n, step in enumerate(steps):
+        if not (step.fuse if step.fuse is not None else fuse):
+            continue
+        ups = {
+            src.split("/")[0]
+            for inp in step.inputs
+            if (src := inp.source) and src.split("/")[0] in by_id
+        }
+        problem = (
+            fuse_problem(by_id[next(iter(ups))], step, consumers)
+            if len(ups) == 1
+            else f"{step.id_} doesn't take outputs from exactly one step"
+        )
+        if problem is None:
+            previous[step.id_] = next(iter(ups))
+        elif step.fuse:
+            errors.append(f"steps[{n}].fuse: can't be fused, {problem}.")
+    if errors:
+        raise ConfigValidationError(errors)
+
+    following = {up: down for down, up in previous.items()}
+    res = []
+    for step in steps:
+        if step.id_ in following:
+            continue
+        chain = [step]
+        while chain[0].id_ in previous:
+            chain.insert(0, by_id[previous[chain[0].id_]])
+        res.append(
+            fused_step(chain, resources or ResourcesConfig())
+            if len(chain) > 1
+            else step
+        )
+    return res
+
+
+@dataclass(slots=True, eq=False)
 class WorkflowConfig:
     id_: str
-    doc: str
-    label: str
     inputs: list[WorkflowInputConfig]
     outputs: list[WorkflowOutputConfig]
     steps: list[StepConfig]
-    ram_min: int | float | None
-    ram_max: int | float | None
-    cores_min: int | float | None
-    cores_max: int | float | None
-
-    def __init__(
-        self,
-        id_: str,
-        inputs: list[WorkflowInputConfig],
-        outputs: list[WorkflowOutputConfig],
-        steps: list[StepConfig],
-        doc: str | None = None,
-        label: str | None = None,
-        ram_min: int | float | None = None,
-        ram_max: int | float | None = None,
-        cores_min: int | float | None = None,
-        cores_max: int | float | None = None,
-    ) -> None:
-        self.id_ = id_
+    doc: str | None = None
+    label: str | None = None
+    # defaults for the steps' resources
+    resources: ResourcesConfig = field(default_factory=ResourcesConfig)
+    cwl_version: str = "v1.0"
+    fuse: bool = False  # fuse chains of script steps where possible
+    metrics: bool = False  # every tool records its runtime metrics
+    steps_by_id: dict[str, StepConfig] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        id_, label, doc = self.id_, self.label, self.doc
         self.doc = doc or label or id_
         self.label = label or doc or id_
-        self.inputs = inputs
-        self.outputs = outputs
-        self.steps = steps
-        self.ram_min = ram_min
-        self.ram_max = ram_max
-        self.cores_min = cores_min
-        self.cores_max = cores_max
+        self.resources = self.resources or ResourcesConfig()
+        self.cwl_version = self.cwl_version or "v1.0"
+        self.steps_by_id = {s.id_: s for s in self.steps}
+        for step in self.steps:
+            step.cwl_version = self.cwl_version
+            for sub in step.fused or []:
+                sub.cwl_version = self.cwl_version
+        if self.metrics:
+            self.add_metrics_outputs()
+
+    def add_metrics_outputs(self) -> None:
+        # a metrics output on every step, collected into a workflow output
+        for step in self.steps:
+            step.metrics = True
+            out = StepOutputConfig(
+                "metrics", {"type": "File", "outputBinding": {"glob": METRICS_FILE}}
+            )
+            step.outputs.append(out)
+            step.outputs_by_id[out.id_] = out
+            if (
+                len(step.scatter_ids or []) > 1
+                and step.scatter_method == "nested_crossproduct"
+            ):
+                # nested arrays have no type shorthand, the step still has them
+                continue
+            self.outputs.append(
+                WorkflowOutputConfig(
+                    f"{step.id_}_metrics",
+                    [f"{step.id_}/metrics"],
+                    "File[]" if step.scatter_ids else "File",
+                )
+            )
 
     @staticmethod
-    def from_dict(d: dict[str, Any]):
+    def from_dict(d: dict[str, Any], path: os.PathLike | None = None):
+        errors = validate_config(d)
+        if errors:
+            raise ConfigValidationError(errors, path)
+
         inputs_raw = d.get("inputs")
         inputs = []
         if inputs_raw:
@@ -288,8 +897,16 @@ class WorkflowConfig:
 
         outputs = [WorkflowOutputConfig.from_dict(out) for out in d["outputs"]]
 
-        steps = [StepConfig.from_dict(s) for s in d["steps"]]
-        resources = d.get("resources", {})
+        resources = ResourcesConfig.from_dict(d.get("resources"))
+        steps = [StepConfig.from_dict(s) for s in scatter_list_inputs(d["steps"])]
+        try:
+            # fused before the defaults apply, which the steps would each add up
+            steps = fuse_steps(steps, d["outputs"], bool(d.get("fuse")), resources)
+        except ConfigValidationError as e:
+            raise ConfigValidationError(e.errors, path) from None
+        for step in steps:
+            for s in [step, *(step.fused or [])]:
+                s.resources = s.resources.with_defaults(resources)
         return WorkflowConfig(
             id_=d["id"],
             doc=d.get("doc"),
@@ -297,41 +914,40 @@ class WorkflowConfig:
             inputs=inputs,
             outputs=outputs,
             steps=steps,
-            ram_min=resources.get("ram_min"),
-            ram_max=resources.get("ram_max"),
-            cores_min=resources.get("cores_min"),
-            cores_max=resources.get("cores_max"),
+            resources=resources,
+            cwl_version=d.get("cwl_version"),
+            fuse=bool(d.get("fuse")),
+            metrics=bool(d.get("metrics")),
         )
 
     @staticmethod
     def load_config(path: os.PathLike):
-        yaml = YAML()
-        yaml.default_flow_style = False
-        raw = yaml.load(Path(path))
-        return WorkflowConfig.from_dict(raw)
+        raw = load(Path(path))
+        return WorkflowConfig.from_dict(raw, path)
 
     def set_step_run(self, cli_dir: Path):
         for step in self.steps:
             step.run = cli_dir / step.id_ / f"{step.id_}.cwl"
 
     def to_cwl(self):
-        additional_requirements = []
-        if self.ram_min or self.ram_max or self.cores_min or self.cores_max:
-            additional_requirements.append(
-                ResourceRequirement(
-                    ramMin=self.ram_min,
-                    ramMax=self.ram_max,
-                    coresMin=self.cores_min,
-                    coresMax=self.cores_max,
-                )
-            )
-        return Workflow(
+        from eoap_gen.batch import batch_workflow_steps
+
+        parser = cwl_parser(self.cwl_version)
+        steps = []
+        for step in self.steps:
+            if step.scatter_batch_size:
+                steps += batch_workflow_steps(step)
+            else:
+                steps.append(step.to_cwl())
+
+        # resources are set on each step's tool, the workflow's are only defaults
+        return parser.Workflow(
             id=self.id_,
             doc=self.doc,
             label=self.label,
-            inputs=[inp.to_cwl() for inp in self.inputs],
-            outputs=[out.to_cwl() for out in self.outputs],
-            steps=[step.to_cwl() for step in self.steps],
-            cwlVersion="v1.0",
-            requirements=[ScatterFeatureRequirement(), *additional_requirements],
+            inputs=[inp.to_cwl(self.cwl_version) for inp in self.inputs],
+            outputs=[out.to_cwl(self.cwl_version) for out in self.outputs],
+            steps=steps,
+            cwlVersion=self.cwl_version,
+            requirements=[parser.ScatterFeatureRequirement()],
         )
@@ -1,66 +1,100 @@
-import json
 import os
 import re
 import shutil
-import subprocess
+import sys
+from importlib import metadata
 from pathlib import Path
 from typing import Any
 
-from cwl_utils.parser import load_document_by_uri, save
-from cwl_utils.parser.cwl_v1_0 import (
-    CommandInputParameter,
-    CommandLineBinding,
-    CommandLineTool,
-    DockerRequirement,
-    InlineJavascriptRequirement,
+from cwl_utils.parser import load_document_by_yaml, save
+from cwltool.context import LoadingContext
+from cwltool.load_tool import load_tool
+from cwltool.workflow import default_make_tool
+from schema_salad.exceptions import ValidationException
+
+from eoap_gen.cache import hash_obj
+from eoap_gen.config import (
+    METRICS_FILE,
+    StepConfig,
+    StepOutputConfig,
+    WorkflowConfig,
+    cwl_parser,
 )
-from ruamel.yaml import YAML
-
-from eoap_gen.config import StepConfig, StepOutputConfig, WorkflowConfig
+from eoap_gen.envs import EnvPool, EnvSpec, default_cache_dir
+from eoap_gen.introspect import StaticIntrospectionError, introspect_script
+from eoap_gen.outputs import wrap_list_outputs
+from eoap_gen.serialize import dump, load
 from eoap_gen.template import get_template
+from eoap_gen.trace import run, span
 
-yaml = YAML()
-yaml.default_flow_style = False
+# micromamba images need their entrypoint to activate the environment
+MICROMAMBA_ENTRYPOINT = ["/usr/local/bin/_entrypoint.sh", "env", "HOME=/tmp"]
+# the script running scripts with metrics, and where their images have it
+INSTRUMENT_PATH = Path(__file__).parent / "instrument.py"
+IMAGE_INSTRUMENT = "/opt/eoap-gen/instrument.py"
+# staged into docker image steps with metrics, as their images can be any
+METRICS_WRAPPER = "eoap_gen_metrics.sh"
 
 
 def generate_cwl_cli(
     script_path: Path,
     output_dir: Path,
     step_id: str,
-    venv: str | None = None,
     requirements: list[str] = [],
     cwl_outputs_path: Path | None = None,
     conda_pkgs: list[str] | None = None,
     python_version: str | None = None,
+    env_pool: EnvPool | None = None,
+    introspection: str = "auto",
+    output_format: str = "yaml",
+    wheelhouse: Path | None = None,
 ):
-    if not venv:
-        venv = f"{step_id}-venv"
+    new_script_path = Path(shutil.copy2(script_path, output_dir))
+    if introspection != "argparse2tool":
+        try:
+            with span("introspect"):
+                tool = introspect_script(new_script_path, cwl_outputs_path)
+        except StaticIntrospectionError as e:
+            if introspection == "static":
+                raise
+            print(
+                f"Static introspection failed, falling back to argparse2tool: {e}",
+                file=sys.stderr,
+            )
+        else:
+            dump(tool, output_dir / f"{new_script_path.stem}.cwl", output_format)
+            return
 
-    if conda_pkgs:
-        conda_env = venv
-    else:
-        conda_env = None
-    new_script_path = shutil.copy2(script_path, output_dir)
-    cmd = get_template("cwltool.jinja").render(
-        output_dir=output_dir.resolve(),
-        venv=venv,
-        requirements=requirements,
-        script_path=Path(new_script_path).resolve(),
-        cwl_outputs_path=cwl_outputs_path.resolve() if cwl_outputs_path else None,
-        conda_env=conda_env,
-        conda_pkgs=conda_pkgs,
+    env_pool = env_pool or EnvPool()
+    spec = EnvSpec(
         python_version=python_version,
+        conda=conda_pkgs,
+        requirements=requirements,
+        wheelhouse=wheelhouse,
     )
-    res = subprocess.run(cmd, shell=True, executable="/bin/bash", capture_output=True)
+    with env_pool.acquire(spec) as env_path:
+        cmd = get_template("cwltool.jinja").render(
+            output_dir=output_dir.resolve(),
+            venv=env_path,
+            script_path=new_script_path.resolve(),
+            cwl_outputs_path=cwl_outputs_path.resolve() if cwl_outputs_path else None,
+            conda_env=env_path if conda_pkgs else None,
+        )
+        res = run(cmd, "argparse2tool")
     if res.returncode != 0:
-        print("Command stdout: ", res.stdout)
-        print("Command stderr: ", res.stderr)
-        raise RuntimeError("Failed generating cwl CommandLineTool.")
+        raise RuntimeError(
+            "Failed generating cwl CommandLineTool.\n"
+            f"Command stdout: {res.stdout.decode(errors='replace')}\n"
+            f"Command stderr: {res.stderr.decode(errors='replace')}"
+        )
 
 
-def generate_docker_cli(step: StepConfig, output_dir: Path) -> None:
+def generate_docker_cli(
+    step: StepConfig, output_dir: Path, output_format: str = "yaml"
+) -> None:
     if not step.command:
         raise ValueError(f"Step {step.id_} has no command.")
+    parser = cwl_parser(step.cwl_version)
     command_parts = step.command.split()
     base_command = []
     inputs = []
@@ -80,161 +114,285 @@ def generate_docker_cli(step: StepConfig, output_dir: Path) -> None:
             if prefix and next_prefix:
                 prefix = f"{next_prefix} {prefix}"
             inp_id = re_match.group(2)
-            inp_config = next((i for i in step.inputs if i.id_ == inp_id), None)
+            inp_config = step.inputs_by_id.get(inp_id)
             if not inp_config:
                 raise ValueError(f"Step {step.id_} has no input {inp_id}.")
-            inp = CommandInputParameter(
+            # runners reject `separate` on bindings without a prefix
+            separate = None
+            if prefix or next_prefix:
+                separate = bool(next_prefix and not prefix)
+            inp = parser.CommandInputParameter(
                 id=inp_id,
-                type_="string",
-                inputBinding=CommandLineBinding(
+                type_=inp_config.type_ or "string",
+                inputBinding=parser.CommandLineBinding(
                     position=i,
                     prefix=prefix or next_prefix,
-                    separate=True if next_prefix and not prefix else False,
+                    separate=separate,
                     valueFrom=inp_config.value_from,
                 ),
             )
-            if inp_config:
-                inp.default = inp_config.default
+            inp.default = inp_config.default
             inputs.append(inp)
             next_prefix = None
         else:
             next_prefix = part
 
-    tool_obj = CommandLineTool(
+    tool_obj = parser.CommandLineTool(
         baseCommand=command_parts[0],
         requirements=[
-            DockerRequirement(dockerPull=step.docker_image),
-            InlineJavascriptRequirement(),
+            parser.DockerRequirement(dockerPull=step.docker_image),
+            parser.InlineJavascriptRequirement(),
         ],
         inputs=inputs,
         outputs=outputs,
-        cwlVersion="v1.0",
+        cwlVersion=step.cwl_version,
     )
+    add_staging(tool_obj, step)
+    if step.metrics:
+        add_work_dir_entries(
+            tool_obj,
+            step,
+            [
+                parser.Dirent(
+                    entryname=METRICS_WRAPPER,
+                    entry=get_template("metrics.jinja").render(
+                        metrics_file=METRICS_FILE
+                    ),
+                )
+            ],
+        )
+        tool_obj.baseCommand = ["sh", METRICS_WRAPPER, command_parts[0]]
+    add_resources(tool_obj, step)
+    add_runtime_controls(tool_obj, step)
+
+    dump(save(tool_obj), output_dir / f"{step.id_}.cwl", output_format)
+
+
+def add_resources(tool_obj: Any, step: StepConfig) -> None:
+    requirement = step.resources.to_cwl(step.cwl_version)
+    if requirement is None:
+        return
+    if step.resources.hint:
+        tool_obj.hints = [*(tool_obj.hints or []), requirement]
+    else:
+        tool_obj.requirements.append(requirement)
+
+
+def add_runtime_controls(tool_obj: Any, step: StepConfig) -> None:
+    requirements, hints = step.runtime_to_cwl()
+    tool_obj.requirements.extend(requirements)
+    if hints:
+        tool_obj.hints = [*(tool_obj.hints or []), *hints]
 
-    tool_dict = save(tool_obj)
-    with open(output_dir / f"{step.id_}.cwl", "w") as f:
-        yaml.dump(tool_dict, f)
+
+def instrumented(base: list[str], app_path: str) -> list[str]:
+    # [..., "python", script, ...] -> [..., "python", instrument, script, ...]
+    i = base.index(app_path)
+    return [*base[:i], IMAGE_INSTRUMENT, *base[i:]]
+
+
+def add_work_dir_entries(tool_obj: Any, step: StepConfig, entries: list) -> None:
+    parser = cwl_parser(step.cwl_version)
+    work_dir = next(
+        (
+            r
+            for r in tool_obj.requirements
+            if isinstance(r, parser.InitialWorkDirRequirement)
+        ),
+        None,
+    )
+    if work_dir is None:
+        work_dir = parser.InitialWorkDirRequirement(listing=[])
+        tool_obj.requirements.append(work_dir)
+    work_dir.listing = [*work_dir.listing, *entries]
+
+
+def add_staging(tool_obj: Any, step: StepConfig) -> None:
+    entries, requirements = step.staging_to_cwl()
+    if entries:
+        add_work_dir_entries(tool_obj, step, entries)
+        tool_obj.requirements.extend(requirements)
+    for out_id in step.recaptured_outputs():
+        print(
+            f"Step {step.id_} output {out_id} globs the whole work dir, which "
+            "captures its staged inputs or metrics too. Narrow the glob to what the "
+            "step writes.",
+            file=sys.stderr,
+        )
 
 
 def write_cwl_cli_outputs(path: Path, outputs: list[StepOutputConfig]):
     raw = {"outputs": {}}
     for o in outputs:
         raw["outputs"][o.id_] = o.params
-    with open(path, "w") as f:
-        yaml.dump(raw, f)
+    dump(raw, path)
 
 
-def modify_cwl_cli(cwl_path: Path, docker_url: str, step: StepConfig):
+def modify_cwl_cli(
+    cwl_path: Path,
+    docker_url: str,
+    step: StepConfig,
+    output_format: str = "yaml",
+    app_path: str = "/app/app.py",
+):
     new_path = cwl_path.with_stem(step.id_)
     os.rename(cwl_path, new_path)
-    tool_obj: CommandLineTool = load_document_by_uri(new_path)
+    # introspected tools are v1.0, which later versions read the same way
+    tool_obj = load_cwl(new_path, step.cwl_version)
 
+    parser = cwl_parser(step.cwl_version)
     tool_obj.requirements = [
-        DockerRequirement(dockerPull=docker_url),
-        InlineJavascriptRequirement(),
+        parser.DockerRequirement(dockerPull=docker_url),
+        parser.InlineJavascriptRequirement(),
     ]
 
-    tool_obj.baseCommand = ["python", "/app/app.py"]
+    tool_obj.baseCommand = ["python", app_path]
     if step.conda:
         # if using micromamba, need to run the entrypoint script explicitly
-        tool_obj.baseCommand = [
-            "/usr/local/bin/_entrypoint.sh",
-            "env",
-            "HOME=/tmp",
-            "python",
-            "/app/app.py",
-        ]
+        tool_obj.baseCommand = [*MICROMAMBA_ENTRYPOINT, "python", app_path]
 
+    tool_inputs = {i.id.split("#")[-1].split("/")[-1]: i for i in tool_obj.inputs}
     for inp in step.inputs:
         if inp.type_:
-            inp_config = next(
-                (i for i in tool_obj.inputs if f"#{inp.id_}" in i.id), None
-            )
+            inp_config = tool_inputs.get(inp.id_)
             if not inp_config:
                 raise ValueError(f"Step {step.id_} has no input {inp.id_}.")
             inp_config.type_ = inp.type_
+    if any(o.list_file for o in step.outputs):
+        wrap_list_outputs(tool_obj, step)
+    if step.metrics:
+        tool_obj.baseCommand = instrumented(tool_obj.baseCommand, app_path)
+    add_staging(tool_obj, step)
+    add_resources(tool_obj, step)
+    add_runtime_controls(tool_obj, step)
 
-    tool_dict = save(tool_obj)
+    dump(save(tool_obj), new_path, output_format)
 
-    with open(new_path, "w") as f:
-        yaml.dump(tool_dict, f)
 
-
-def generate_workflow(config: WorkflowConfig, wf_path: Path):
+def generate_workflow(
+    config: WorkflowConfig, wf_path: Path, output_format: str = "yaml"
+):
     wf = config.to_cwl()
-    with open(wf_path.resolve(), "w") as f:
-        yaml.dump(save(wf, relative_uris=False), f)
-
-
-def pack_workflow(wf_path: Path) -> Path:
-    wf_abs_path = wf_path.resolve()
-    pack_res = subprocess.run(
-        f"cwltool --pack {wf_abs_path}",
-        shell=True,
-        executable="/bin/bash",
-        capture_output=True,
-    )
-    if pack_res.returncode != 0:
-        print("Command stdout: ", pack_res.stdout)
-        print("Command stderr: ", pack_res.stderr)
-        raise RuntimeError("Failed packing workflow.")
-    packed_obj = json.loads(pack_res.stdout)
-    packed_path = wf_abs_path.with_stem(f"{wf_abs_path.stem}-packed")
-    with open(packed_path, "w") as f:
-        yaml.dump(packed_obj, f)
-    return packed_path
-
-
-def cleanup_packed_workflow(packed_path: Path, wf_id: str) -> None:
-    with open(packed_path) as f:
-        workflow_data = yaml.load(f)
-
-    def clean_id(id_str: str) -> str:
-        return id_str.split("/")[-1].lstrip("#").replace(".cwl", "")
+    dump(save(wf, relative_uris=False), wf_path.resolve(), output_format)
+
+
+def pack_workflow(
+    config: WorkflowConfig,
+    packed_path: Path,
+    tools: dict[str, Any] | None = None,
+    output_format: str = "yaml",
+) -> dict:
+    """
+    Pack the workflow and the tools its steps run into a single `$graph` document,
+    with every tool referenced by its file name, the step id for most steps.
+
+    Tools missing from `tools` are loaded from the step's run path and added to it,
+    so callers packing repeatedly only pay for loading tools that changed.
+    """
+    if tools is None:
+        tools = {}
+    wf_prefix = f"{config.id_}/"
 
     def clean_source(source: str) -> str:
-        return source.split("/", maxsplit=1)[-1].lstrip("#").replace(".cwl", "")
+        return source[len(wf_prefix) :] if source.startswith(wf_prefix) else source
 
-    def clean_node(node: Any) -> None:
+    def clean_node(node: Any, tool_uri: str) -> Any:
+        # enum symbols and record fields are saved as absolute URIs of the tool file
+        # and anonymous types get random names, neither belongs in the packed file
         if isinstance(node, dict):
-            if "id" in node:
-                node["id"] = clean_id(node["id"])
-
-            if node.get("id") == "main":
-                node["id"] = wf_id
-
-            if "run" in node:
-                node["run"] = node["run"].replace(".cwl", "")
-
-            if "scatter" in node:
-                node["scatter"] = [clean_id(i) for i in node["scatter"]]
-
-            for field in ["source", "outputSource"]:
-                if field in node:
-                    if isinstance(node[field], list):
-                        node[field] = [clean_source(src) for src in node[field]]
-                    else:
-                        node[field] = clean_source(node[field])
-
-            # Recursively process all values
-            for value in node.values():
-                clean_node(value)
-
-        elif isinstance(node, list):
-            for item in node:
-                clean_node(item)
-
-    clean_node(workflow_data)
-
-    with open(packed_path, "w") as f:
-        yaml.dump(workflow_data, f)
-
-
-def validate_workflow(wf_path: Path) -> bool:
-    abs_path = wf_path.resolve()
-    res = subprocess.run(
-        f"cwltool --validate {abs_path}",
-        shell=True,
-        executable="/bin/bash",
-    )
-    return res.returncode == 0
+            if str(node.get("name", "")).startswith("_:"):
+                del node["name"]
+            return {k: clean_node(v, tool_uri) for k, v in node.items()}
+        if isinstance(node, list):
+            return [clean_node(item, tool_uri) for item in node]
+        if isinstance(node, str) and node.startswith(f"{tool_uri}#"):
+            return node.split("/")[-1]
+        return node
+
+    tool_paths = {
+        tool_id: step.run.with_stem(tool_id)
+        for step in config.steps
+        for tool_id in step.tool_ids()
+    }
+    graph = []
+    for tool_id, path in sorted(tool_paths.items()):
+        if tool_id not in tools:
+            tools[tool_id] = load_cwl(path)
+        tool_obj = tools[tool_id]
+        tool = clean_node(save(tool_obj), tool_obj.id)
+        tool["id"] = tool_id
+        tool.pop("cwlVersion", None)
+        graph.append(tool)
+
+    wf = save(config.to_cwl(), relative_uris=False)
+    wf.pop("cwlVersion", None)
+    for wf_step in wf["steps"]:
+        wf_step["run"] = "#" + Path(wf_step["run"]).stem
+        for step_in in wf_step["in"]:
+            source = step_in.get("source")
+            if isinstance(source, list):
+                step_in["source"] = [clean_source(src) for src in source]
+            elif source:
+                step_in["source"] = clean_source(source)
+    for wf_out in wf["outputs"]:
+        wf_out["outputSource"] = [clean_source(src) for src in wf_out["outputSource"]]
+    graph.append(wf)
+
+    packed = {"$graph": graph, "cwlVersion": config.cwl_version}
+    dump(packed, packed_path, output_format)
+    return packed
+
+
+def load_cwl(path: Path, cwl_version: str | None = None) -> Any:
+    # parse with the C loader, cwl_utils' own loader uses ruamel's pure python
+    # round trip parser
+    doc = load(path)
+    if cwl_version:
+        doc["cwlVersion"] = cwl_version
+    return load_document_by_yaml(doc, path.resolve().as_uri())
+
+
+class WorkflowValidationError(Exception):
+    def __init__(self, path: Path, errors: list[str]):
+        self.path = path
+        self.errors = errors
+        super().__init__(f"{path} is not valid CWL:\n" + "\n".join(errors))
+
+
+# hashes of packed documents that have already passed validation
+VALIDATED: set[str] = set()
+
+
+def validate_workflow(
+    packed: dict, packed_path: Path, cache_dir: Path | None = None
+) -> None:
+    """
+    Validate the packed workflow in-process, the same way `cwltool --validate` does.
+
+    Successful results are remembered by a hash of the packed document, in memory
+    and under `cache_dir`, so validating an unchanged workflow again is free.
+    Raises WorkflowValidationError listing every problem found.
+    """
+    key = hash_obj([packed, metadata.version("cwltool")])
+    marker = (cache_dir or default_cache_dir()) / "validated" / key
+    if key in VALIDATED or marker.exists():
+        VALIDATED.add(key)
+        return
+
+    uri = f"{packed_path.resolve().as_uri()}#{packed['$graph'][-1]['id']}"
+    loading_context = LoadingContext({"construct_tool_object": default_make_tool})
+    try:
+        load_tool(uri, loading_context)
+    except ValidationException as e:
+        errors = []
+        for leaf in e.leaves():
+            if leaf.file and leaf.start:
+                line, col = leaf.start
+                errors.append(f"{leaf.file}:{line}:{col}: {leaf.message}")
+            else:
+                errors.append(leaf.message)
+        raise WorkflowValidationError(packed_path, errors) from e
+
+    VALIDATED.add(key)
+    marker.parent.mkdir(parents=True, exist_ok=True)
+    marker.touch()
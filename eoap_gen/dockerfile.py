@@ -1,9 +1,16 @@
 import os
+import shutil
 from pathlib import Path
 
+from eoap_gen.cache import hash_file, hash_obj
 from eoap_gen.config import StepConfig
+from eoap_gen.cwl import IMAGE_INSTRUMENT, INSTRUMENT_PATH
+from eoap_gen.fuse import FUSED_DRIVER
+from eoap_gen.lock import LOCK_NAME, WHEELS_DIR
 from eoap_gen.template import get_template
 
+SHARED_IMAGE_PREFIX = "env-"
+
 
 def get_requirements(path: Path | None) -> list[str]:
     if not path:
@@ -14,40 +21,130 @@ def get_requirements(path: Path | None) -> list[str]:
 
 
 def get_dockerfile_content(
-    script_path: Path,
+    scripts: dict[str, str],
     requirements: list[str] | None = None,
     apt_install: list[str] | None = None,
     conda: list[str] | None = None,
     python_version: str | None = None,
+    base_image_digest: str | None = None,
+    buildkit: bool = False,
+    locked: bool = False,
+    metrics: bool = False,
 ) -> str:
-
     return get_template("dockerfile.jinja").render(
         requirements=requirements,
         apt_install=apt_install,
-        script_name=script_path.name,
+        scripts=scripts,
         conda=conda,
         python_version=python_version,
+        base_image_digest=base_image_digest,
+        buildkit=buildkit,
+        locked=locked,
+        instrument=(INSTRUMENT_PATH.name, IMAGE_INSTRUMENT) if metrics else None,
     )
 
 
 def save_dockerfile(
     directory: Path,
-    script_path: Path,
-    step_id: str,
+    image_name: str,
     dockerfile_content: str,
 ) -> None:
-    filename = f"{step_id}.Dockerfile"
+    filename = f"{image_name}.Dockerfile"
     path = os.path.join(directory, filename)
 
     with open(path, "w") as f:
         f.write(dockerfile_content.strip())
 
 
-def generate_dockerfile(step: StepConfig, save_dir: Path):
+def generate_dockerfile(
+    step: StepConfig, save_dir: Path, buildkit: bool = False, locked: bool = False
+):
     reqs = get_requirements(step.requirements)
-    if not step.script:
+    if step.fused:
+        # the driver runs the scripts of the fused steps from next to it
+        scripts = {
+            FUSED_DRIVER: "app.py",
+            **{f"{s.id_}.py": f"{s.id_}.py" for s in step.fused},
+        }
+    elif step.script:
+        scripts = {step.script.name: "app.py"}
+    else:
         raise ValueError(f"Step {step.id_} has no script.")
+    if step.metrics:
+        shutil.copy2(INSTRUMENT_PATH, save_dir / INSTRUMENT_PATH.name)
     content = get_dockerfile_content(
-        step.script, reqs, step.apt_install, step.conda, step.python_version or "3.12"
+        scripts,
+        reqs,
+        step.apt_install,
+        step.conda,
+        step.python_version or "3.12",
+        step.base_image_digest,
+        buildkit,
+        locked,
+        step.metrics,
+    )
+    save_dockerfile(save_dir, step.id_, content)
+
+
+def shared_image_name(step: StepConfig) -> str:
+    # named after everything installed in the image, so steps with the same
+    # dependencies get the same image
+    key = hash_obj(
+        {
+            "requirements": hash_file(step.requirements),
+            "apt_install": step.apt_install,
+            "conda": step.conda,
+            "python_version": step.python_version or "3.12",
+            "base_image_digest": step.base_image_digest,
+            "metrics": step.metrics,
+        }
     )
-    save_dockerfile(save_dir, step.script, step.id_, content)
+    return f"{SHARED_IMAGE_PREFIX}{key[:12]}"
+
+
+def generate_shared_dockerfiles(
+    steps: list[StepConfig], cli_dir: Path, buildkit: bool = False, lock: bool = False
+) -> list[str]:
+    """
+    Write one image directory per set of script step dependencies, holding a
+    Dockerfile, the scripts of all steps using it as `<step id>.py` and, with
+    `lock`, the requirements lock and wheels of the first of them. Image
+    directories of previous runs that are no longer used are removed. Returns the
+    image names.
+    """
+    images: dict[str, list[StepConfig]] = {}
+    for step in steps:
+        if step.script:
+            images.setdefault(shared_image_name(step), []).append(step)
+
+    for name, image_steps in images.items():
+        image_dir = cli_dir / name
+        os.makedirs(image_dir, exist_ok=True)
+        for step in image_steps:
+            shutil.copy2(step.script, image_dir / f"{step.id_}.py")
+        step = image_steps[0]
+        locked = lock and bool(step.requirements)
+        if locked:
+            shutil.copy2(cli_dir / step.id_ / LOCK_NAME, image_dir / LOCK_NAME)
+            shutil.rmtree(image_dir / WHEELS_DIR, ignore_errors=True)
+            shutil.copytree(cli_dir / step.id_ / WHEELS_DIR, image_dir / WHEELS_DIR)
+        if step.metrics:
+            shutil.copy2(INSTRUMENT_PATH, image_dir / INSTRUMENT_PATH.name)
+        content = get_dockerfile_content(
+            {f"{s.id_}.py": f"{s.id_}.py" for s in image_steps},
+            get_requirements(step.requirements),
+            step.apt_install,
+            step.conda,
+            step.python_version or "3.12",
+            step.base_image_digest,
+            buildkit,
+            locked,
+            step.metrics,
+        )
+        save_dockerfile(image_dir, name, content)
+
+    step_ids = {s.id_ for s in steps}
+    for path in cli_dir.glob(f"{SHARED_IMAGE_PREFIX}*"):
+        if path.is_dir() and path.name not in images and path.name not in step_ids:
+            shutil.rmtree(path)
+    return sorted(images)
@@ -0,0 +1,247 @@
+import fcntl
+import hashlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Iterator
+
+from eoap_gen.template import get_template
+from eoap_gen.trace import run, span
+
+DEFAULT_PYTHON_VERSION = "3.12"
+READY_MARKER = "eoap-gen-env.json"
+
+
+def default_cache_dir() -> Path:
+    cache_dir = os.getenv("EOAP_GEN_CACHE_DIR")
+    if cache_dir:
+        return Path(cache_dir)
+    xdg_cache = os.getenv("XDG_CACHE_HOME")
+    return Path(xdg_cache or Path.home() / ".cache") / "eoap-gen"
+
+
+def dir_size(path: Path) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return size
+
+
+class EnvSpec:
+    python_version: str | None
+    conda: list[str]
+    requirements: list[str]
+    wheelhouse: Path | None
+
+    def __init__(
+        self,
+        python_version: str | None = None,
+        conda: list[str] | None = None,
+        requirements: list[str] | None = None,
+        wheelhouse: Path | None = None,
+    ) -> None:
+        self.conda = sorted(conda or [])
+        self.requirements = sorted(r.strip() for r in requirements or [] if r.strip())
+        # requirements are a hashed lock, installed from this directory only
+        self.wheelhouse = wheelhouse
+        if self.conda:
+            self.python_version = python_version or DEFAULT_PYTHON_VERSION
+        else:
+            # venvs are created by the interpreter running eoap-gen
+            self.python_version = platform.python_version()
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "python_version": self.python_version,
+            "conda": self.conda,
+            "requirements": self.requirements,
+            "locked": self.wheelhouse is not None,
+        }
+
+    @property
+    def base_key(self) -> str:
+        # environments sharing a base only differ in the pip installed packages
+        raw = json.dumps([self.python_version, self.conda, sys.platform])
+        return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+    @property
+    def key(self) -> str:
+        raw = json.dumps(
+            [self.base_key, self.requirements, self.wheelhouse is not None]
+        )
+        return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+class EnvPool:
+    """
+    Persistent pool of python environments used to introspect step scripts.
+
+    Environments live outside of the generated output and are keyed by their
+    python version, conda packages and pip requirements, so steps with the same
+    dependencies share one. Conda environments are cloned from an existing
+    environment with the same conda packages when possible, and pip and conda
+    package caches are shared by all environments. Least recently used
+    environments are evicted once the pool grows over `max_size` bytes.
+    """
+
+    root: Path
+    max_size: int | None
+    build_slots: threading.Semaphore | None
+
+    def __init__(
+        self,
+        root: Path | None = None,
+        max_size: int | None = None,
+        max_builds: int | None = None,
+    ) -> None:
+        self.root = root or default_cache_dir()
+        self.max_size = max_size
+        self.build_slots = (
+            threading.BoundedSemaphore(max_builds) if max_builds else None
+        )
+
+    @property
+    def envs_dir(self) -> Path:
+        return self.root / "envs"
+
+    @property
+    def wheelhouse(self) -> Path:
+        return self.root / "wheelhouse"
+
+    def build_env_vars(self) -> dict[str, str]:
+        env = dict(os.environ)
+        env.setdefault("PIP_CACHE_DIR", str(self.root / "pip-cache"))
+        env.setdefault("CONDA_PKGS_DIRS", str(self.root / "conda-pkgs"))
+        return env
+
+    @contextmanager
+    def _lock(self, key: str, mode: int) -> Iterator[None]:
+        self.envs_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.envs_dir / f"{key}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _is_ready(self, path: Path) -> bool:
+        return (path / READY_MARKER).exists()
+
+    def _find_base(self, spec: EnvSpec) -> Path | None:
+        if not self.envs_dir.exists():
+            return None
+        for marker in self.envs_dir.glob(f"*/{READY_MARKER}"):
+            try:
+                with open(marker) as f:
+                    meta = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            if meta.get("base_key") == spec.base_key:
+                return marker.parent
+        return None
+
+    def _build(self, spec: EnvSpec, path: Path) -> None:
+        if path.exists():
+            # leftovers of an interrupted build
+            shutil.rmtree(path)
+        base = self._find_base(spec) if spec.conda else None
+        # keep the environment we clone from from being evicted while cloning
+        base_lock = self._lock(base.name, fcntl.LOCK_SH) if base else nullcontext()
+        with tempfile.TemporaryDirectory() as tmp, base_lock:
+            clone_spec = Path(tmp) / "clone-spec.txt" if base else None
+            lock_path = None
+            if spec.wheelhouse:
+                lock_path = Path(tmp) / "requirements.lock"
+                lock_path.write_text("\n".join(spec.requirements) + "\n")
+            params = dict(
+                env_path=path,
+                conda=spec.conda,
+                python_version=spec.python_version,
+                requirements=spec.requirements,
+                clone_from=base,
+                clone_spec=clone_spec,
+                wheelhouse=spec.wheelhouse,
+                lock_path=lock_path,
+            )
+            # separate runs so creating the base and installing the requirements
+            # are timed on their own
+            for template, name in [
+                ("env_create.jinja", "env create"),
+                ("env_install.jinja", "env install"),
+            ]:
+                cmd = get_template(template).render(**params)
+                res = run(cmd, name, env=self.build_env_vars())
+                if res.returncode != 0:
+                    shutil.rmtree(path, ignore_errors=True)
+                    raise RuntimeError(
+                        "Failed creating python environment.\n"
+                        f"Command stdout: {res.stdout.decode(errors='replace')}\n"
+                        f"Command stderr: {res.stderr.decode(errors='replace')}"
+                    )
+        with open(path / READY_MARKER, "w") as f:
+            json.dump({"key": spec.key, "base_key": spec.base_key, **spec.to_dict()}, f)
+
+    @contextmanager
+    def acquire(self, spec: EnvSpec) -> Iterator[Path]:
+        """
+        Yield the path of a ready environment for `spec`, building it if needed.
+
+        The environment is protected from eviction until the context exits.
+        """
+        path = self.envs_dir / spec.key
+        while True:
+            with (
+                span("env", env=spec.key) as args,
+                self._lock(spec.key, fcntl.LOCK_EX),
+            ):
+                args["built"] = not self._is_ready(path)
+                if args["built"]:
+                    with self.build_slots or nullcontext():
+                        self._build(spec, path)
+                # marker mtime serves as last used time for eviction
+                os.utime(path / READY_MARKER)
+            with self._lock(spec.key, fcntl.LOCK_SH):
+                if self._is_ready(path):
+                    yield path
+                    return
+            # evicted by another process between the two locks, the shared lock
+            # is released first as this process can't upgrade its own lock
+
+    def evict(self) -> list[Path]:
+        if self.max_size is None or not self.envs_dir.exists():
+            return []
+        envs = []
+        for marker in self.envs_dir.glob(f"*/{READY_MARKER}"):
+            envs.append(
+                (marker.stat().st_mtime, marker.parent, dir_size(marker.parent))
+            )
+        envs.sort()
+        total = sum(size for _, _, size in envs)
+        evicted = []
+        for _, path, size in envs:
+            if total <= self.max_size:
+                break
+            with open(self.envs_dir / f"{path.name}.lock", "w") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # in use
+                    continue
+                try:
+                    (path / READY_MARKER).unlink()
+                    shutil.rmtree(path)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+            total -= size
+            evicted.append(path)
+        return evicted
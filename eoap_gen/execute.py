@@ -0,0 +1,197 @@
+import json
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+from eoap_gen.config import StepConfig, WorkflowConfig
+from eoap_gen.cwl import IMAGE_INSTRUMENT, INSTRUMENT_PATH, MICROMAMBA_ENTRYPOINT
+from eoap_gen.fuse import FUSED_DRIVER
+from eoap_gen.outputs import LIST_WRAPPER
+from eoap_gen.serialize import dump, load
+from eoap_gen.template import get_template
+
+DEFAULT_RUNNER = "cwltool --parallel --no-container"
+PROBE_PATH = Path(__file__).parent / "probe.py"
+# where script steps' tools run their script from in the images
+APP_PATH = re.compile(r"/app/[\w.-]+\.py")
+# base command of the per item commands of batch tools
+BATCH_BASE = re.compile(r"var base = (\[.*?\]);")
+
+
+def local_command(args: list[str], script: str, python: str) -> list[str]:
+    if args[: len(MICROMAMBA_ENTRYPOINT)] == MICROMAMBA_ENTRYPOINT:
+        args = args[len(MICROMAMBA_ENTRYPOINT) :]
+    return [
+        (
+            python
+            if a == "python"
+            and i + 1 < len(args)
+            and (
+                APP_PATH.fullmatch(args[i + 1])
+                or args[i + 1] in (LIST_WRAPPER, IMAGE_INSTRUMENT)
+            )
+            else (
+                str(INSTRUMENT_PATH)
+                if a == IMAGE_INSTRUMENT
+                else APP_PATH.sub(script, a)
+            )
+        )
+        for i, a in enumerate(args)
+    ]
+
+
+def localize(node: Any, script: str, python: str) -> Any:
+    """
+    Point the commands of a script step's tool at the generated copy of its
+    script, run by `python`, instead of the image's.
+    """
+    if isinstance(node, dict):
+        res = {k: localize(v, script, python) for k, v in node.items()}
+        if isinstance(res.get("baseCommand"), list):
+            res["baseCommand"] = local_command(res["baseCommand"], script, python)
+        return res
+    if isinstance(node, list):
+        return [localize(i, script, python) for i in node]
+    if isinstance(node, str) and BATCH_BASE.search(node):
+        return BATCH_BASE.sub(
+            lambda m: "var base = "
+            + json.dumps(local_command(json.loads(m.group(1)), script, python))
+            + ";",
+            node,
+        )
+    return node
+
+
+def without_docker(process: dict[str, Any]) -> dict[str, Any]:
+    for key in ["requirements", "hints"]:
+        if key in process:
+            process[key] = [
+                r for r in process[key] if r.get("class") != "DockerRequirement"
+            ]
+    return process
+
+
+def local_workflow(
+    config: WorkflowConfig,
+    packed: dict[str, Any],
+    cli_dir: Path,
+    metrics_dir: Path,
+    python: str = "python",
+) -> dict[str, Any]:
+    """
+    Rewrite a packed workflow to run on this machine: without containers, script
+    steps run their generated script copy and every command runs through the
+    probe, which writes its metrics to `metrics_dir`.
+    """
+    tool_steps: dict[str, StepConfig] = {
+        tool_id: step for step in config.steps for tool_id in step.tool_ids()
+    }
+    graph = []
+    for process in packed["$graph"]:
+        process = without_docker(process)
+        step = tool_steps.get(process["id"].lstrip("#"))
+        if step and (step.script or step.fused):
+            name = FUSED_DRIVER if step.fused else step.script.name  # type: ignore
+            script = str((cli_dir / step.id_ / name).resolve())
+            process = localize(process, script, python)
+        if process["class"] == "CommandLineTool":
+            base = process.get("baseCommand", [])
+            base = base if isinstance(base, list) else [base]
+            process["baseCommand"] = [
+                sys.executable,
+                str(PROBE_PATH),
+                str(metrics_dir.resolve()),
+                process["id"].lstrip("#"),
+                str(len(base)),
+                *base,
+            ]
+        graph.append(process)
+    return {**packed, "$graph": graph}
+
+
+def step_summary(jobs: list[dict[str, Any]]) -> dict[str, Any]:
+    return {
+        "jobs": len(jobs),
+        "wall_s": round(
+            max(j["started"] + j["wall_s"] for j in jobs)
+            - min(j["started"] for j in jobs),
+            3,
+        ),
+        "job_wall_s": round(sum(j["wall_s"] for j in jobs), 3),
+        "cpu_s": round(sum(j["user_s"] + j["sys_s"] for j in jobs), 3),
+        "max_rss_kb": max(j["max_rss_kb"] for j in jobs),
+        "input_bytes": sum(j["input_bytes"] for j in jobs),
+        "output_bytes": sum(j["output_bytes"] for j in jobs),
+        "failed": sum(1 for j in jobs if j["returncode"] != 0),
+    }
+
+
+def run_workflow(
+    config: WorkflowConfig,
+    output_path: Path,
+    run_dir: Path,
+    inputs: Path | None = None,
+    runner: str = DEFAULT_RUNNER,
+    python: str = "python",
+) -> dict[str, Any]:
+    """
+    Run the generated workflow in `output_path` with `runner` and return a report
+    of the time, cpu, memory and bytes staged by each step and each of its jobs.
+    """
+    cli_dir = output_path / "cli"
+    metrics_dir = run_dir / "metrics"
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    metrics_dir.mkdir(parents=True)
+
+    packed = load(cli_dir / "workflow-packed.cwl")
+    wf_path = run_dir / "workflow-run.cwl"
+    dump(local_workflow(config, packed, cli_dir, metrics_dir, python), wf_path)
+
+    cmd = [
+        *shlex.split(runner),
+        "--outdir",
+        str(run_dir / "outputs"),
+        f"{wf_path}#{config.id_}",
+        *([str(inputs)] if inputs else []),
+    ]
+    start = time.perf_counter()
+    res = subprocess.run(cmd, stdout=subprocess.PIPE)
+    wall = time.perf_counter() - start
+    try:
+        outputs = json.loads(res.stdout)
+    except json.JSONDecodeError:
+        outputs = None
+
+    jobs = []
+    for path in metrics_dir.glob("*.json"):
+        with open(path) as f:
+            jobs.append(json.load(f))
+    jobs.sort(key=lambda j: j["started"])
+    tool_steps = {t: s.id_ for s in config.steps for t in s.tool_ids()}
+    for job in jobs:
+        job["step"] = tool_steps.get(job["tool"], job["tool"])
+    steps = {}
+    for step in config.steps:
+        step_jobs = [j for j in jobs if j["step"] == step.id_]
+        if step_jobs:
+            steps[step.id_] = step_summary(step_jobs)
+
+    return {
+        "workflow": config.id_,
+        "command": shlex.join(cmd),
+        "returncode": res.returncode,
+        "wall_s": round(wall, 3),
+        "outputs": outputs,
+        "steps": steps,
+        "jobs": jobs,
+    }
+
+
+def write_html_report(report: dict[str, Any], path: Path) -> None:
+    with open(path, "w") as f:
+        f.write(get_template("run_report.jinja").render(report=report))
@@ -0,0 +1,146 @@
+from pathlib import Path
+from typing import Any
+
+from cwl_utils.parser import save
+
+from eoap_gen.batch import as_list, clean_ids
+from eoap_gen.config import METRICS_FILE, StepConfig, glob_output
+from eoap_gen.cwl import (
+    IMAGE_INSTRUMENT,
+    MICROMAMBA_ENTRYPOINT,
+    add_resources,
+    add_runtime_controls,
+    load_cwl,
+)
+from eoap_gen.serialize import dump
+from eoap_gen.template import get_template
+
+# script a fused step's tool runs, calling the scripts of the steps it fuses
+FUSED_DRIVER = "fused.py"
+# the fused tool's inputs, written by the runner for the driver to read
+FUSED_INPUTS = "fused_inputs.json"
+
+
+def fused_input_id(step: StepConfig, inp_id: str) -> str:
+    return f"{step.id_}_{inp_id}"
+
+
+def is_internal(step: StepConfig, source: str | None) -> bool:
+    # whether a source is an output of another step of the fused chain
+    assert step.fused
+    return bool(source) and source.split("/")[0] in {s.id_ for s in step.fused}
+
+
+def fused_spec(step: StepConfig, tools: dict[str, dict[str, Any]]) -> list[dict]:
+    """
+    What the driver needs to run each step of the chain: the bindings of its
+    script's arguments, with where their values come from, and the outputs
+    later steps of the chain take from it.
+    """
+    assert step.fused
+    spec = []
+    for sub in step.fused:
+        bound = sorted(
+            (i for i in as_list(tools[sub.id_]["inputs"]) if "inputBinding" in i),
+            key=lambda i: (i["inputBinding"].get("position", 0), i["id"]),
+        )
+        args = []
+        for tool_inp in bound:
+            inp = sub.inputs_by_id.get(tool_inp["id"])
+            if inp is None:
+                # left to the script's default
+                continue
+            binding = tool_inp["inputBinding"]
+            if binding.get("valueFrom"):
+                raise ValueError(
+                    f"Step {sub.id_} input {inp.id_} can't be fused, its binding "
+                    "has a valueFrom."
+                )
+            arg: dict[str, Any] = {
+                "prefix": binding.get("prefix"),
+                "separate": binding.get("separate", True),
+                "item_separator": binding.get("itemSeparator"),
+            }
+            if is_internal(step, inp.source):
+                arg["output"] = inp.source.split("/")  # type: ignore[union-attr]
+            else:
+                arg["input"] = fused_input_id(sub, inp.id_)
+            args.append(arg)
+        outputs = {}
+        if sub is not step.fused[-1]:
+            outputs = {o.id_: glob_output(o.params) for o in sub.outputs}
+        spec.append({"id": sub.id_, "args": args, "outputs": outputs})
+    return spec
+
+
+def write_fused_driver(
+    step: StepConfig, tools: dict[str, dict[str, Any]], output_dir: Path
+) -> None:
+    content = get_template("fused.jinja").render(
+        steps=fused_spec(step, tools),
+        inputs_name=FUSED_INPUTS,
+        metrics_file=METRICS_FILE,
+    )
+    with open(output_dir / FUSED_DRIVER, "w") as f:
+        f.write(content)
+
+
+def generate_fused_cli(
+    step: StepConfig,
+    tools: dict[str, dict[str, Any]],
+    output_dir: Path,
+    docker_url: str,
+    output_format: str = "yaml",
+) -> None:
+    """
+    Write the tool of a fused step from the tools of the steps it fuses: their
+    inputs not taken from each other, the last one's outputs, and the driver as
+    its script, reading the inputs from a file the runner writes.
+    """
+    assert step.fused
+    inputs = []
+    for sub in step.fused:
+        tool_inputs = {i["id"]: i for i in as_list(tools[sub.id_]["inputs"])}
+        for inp in sub.inputs:
+            if is_internal(step, inp.source):
+                continue
+            if inp.id_ not in tool_inputs:
+                raise ValueError(f"Step {sub.id_} has no input {inp.id_}.")
+            inputs.append(
+                {
+                    "id": fused_input_id(sub, inp.id_),
+                    "type": inp.type_ or clean_ids(tool_inputs[inp.id_]["type"]),
+                }
+            )
+
+    base = ["python", "/app/app.py"]
+    if step.metrics:
+        # the driver runs each script through it, the scripts' samples are lost
+        # when profiling the driver itself
+        base.append(IMAGE_INSTRUMENT)
+    if step.conda:
+        base = [*MICROMAMBA_ENTRYPOINT, *base]
+    tool = {
+        "class": "CommandLineTool",
+        "cwlVersion": step.cwl_version,
+        "doc": f"Run {', '.join(s.id_ for s in step.fused)} in sequence.",
+        "baseCommand": base,
+        "inputs": inputs,
+        "outputs": clean_ids(as_list(tools[step.fused[-1].id_]["outputs"])),
+        "requirements": [
+            {"class": "DockerRequirement", "dockerPull": docker_url},
+            {"class": "InlineJavascriptRequirement"},
+            {
+                "class": "InitialWorkDirRequirement",
+                "listing": [
+                    {"entryname": FUSED_INPUTS, "entry": "$(JSON.stringify(inputs))"}
+                ],
+            },
+        ],
+    }
+    path = output_dir / f"{step.id_}.cwl"
+    dump(tool, path, output_format)
+    tool_obj = load_cwl(path)
+    add_resources(tool_obj, step)
+    add_runtime_controls(tool_obj, step)
+    dump(save(tool_obj), path, output_format)
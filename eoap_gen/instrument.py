@@ -0,0 +1,111 @@
+"""
+Run a python script in this interpreter and record its wall time, cpu time,
+peak memory, bytes read and written and the functions most often on the cpu, as
+metrics.json in the work dir.
+
+    python instrument.py <script> <args...>
+
+Images of workflows with metrics run their scripts through it, so it only uses
+the standard library.
+"""
+
+import json
+import os
+import resource
+import runpy
+import signal
+import sys
+import time
+import traceback
+from collections import Counter
+from types import FrameType
+
+METRICS_FILE = "metrics.json"
+# seconds of cpu time between samples of the running function
+SAMPLE_INTERVAL = 0.005
+TOP_FUNCTIONS = 20
+
+
+def proc_io() -> dict[str, int]:
+    # linux only, bytes passed to read and write calls
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+    except OSError:
+        return {}
+    return {"read": int(fields["rchar"]), "write": int(fields["wchar"])}
+
+
+def max_rss_kb(usage: resource.struct_rusage) -> int:
+    return usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+
+
+def hot_functions(samples: Counter, total: int) -> list[dict]:
+    return [
+        {
+            "function": name,
+            "file": file,
+            "line": line,
+            "samples": count,
+            "share": round(count / total, 3),
+        }
+        for (file, line, name), count in samples.most_common(TOP_FUNCTIONS)
+    ]
+
+
+def main(argv: list[str]) -> int:
+    script, *args = argv
+    cwd = os.getcwd()
+    samples: Counter = Counter()
+
+    def sample(signum: int, frame: FrameType | None) -> None:
+        if frame is not None:
+            code = frame.f_code
+            samples[(code.co_filename, code.co_firstlineno, code.co_name)] += 1
+
+    io_start = proc_io()
+    start = time.perf_counter()
+    signal.signal(signal.SIGPROF, sample)
+    signal.setitimer(signal.ITIMER_PROF, SAMPLE_INTERVAL, SAMPLE_INTERVAL)
+    sys.argv = [script, *args]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    try:
+        runpy.run_path(script, run_name="__main__")
+        returncode = 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            returncode = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+            returncode = 1
+    except BaseException:
+        traceback.print_exc()
+        returncode = 1
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+    wall = time.perf_counter() - start
+    io_end = proc_io()
+
+    # the script's own usage and that of the commands it waited for
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    total = sum(samples.values())
+    record = {
+        "wall_s": round(wall, 3),
+        "user_s": round(usage.ru_utime + children.ru_utime, 3),
+        "sys_s": round(usage.ru_stime + children.ru_stime, 3),
+        "max_rss_kb": max(max_rss_kb(usage), max_rss_kb(children)),
+        "read_bytes": io_end["read"] - io_start["read"] if io_end else None,
+        "write_bytes": io_end["write"] - io_start["write"] if io_end else None,
+        "returncode": returncode,
+        "samples": total,
+        "hot_functions": hot_functions(samples, total) if total else [],
+    }
+    with open(os.path.join(cwd, METRICS_FILE), "w") as f:
+        json.dump(record, f, indent=2)
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
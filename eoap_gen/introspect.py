@@ -0,0 +1,627 @@
+"""
+Static introspection of click and argparse scripts.
+
+Builds the same CommandLineTool description argparse2tool would produce, but from
+the script's AST, so no environment has to be created and the script is never
+imported. Anything that can't be resolved without running the script raises
+StaticIntrospectionError, and the caller falls back to argparse2tool.
+"""
+
+import ast
+import inspect
+import re
+from pathlib import Path
+from typing import Any
+
+from ruamel.yaml import YAML
+
+PY_TO_CWL_TYPES = {
+    "str": "string",
+    "bool": "boolean",
+    "int": "int",
+    "float": "float",
+    "list": "array",
+    "TextIOWrapper": "File",
+    "open": "File",
+}
+
+CLICK_TO_CWL_TYPES = {
+    "integer": "int",
+    "text": "string",
+    "choice": "enum",
+    "integer range": "array",
+    "float range": "array",
+    "float": "float",
+    "boolean": "boolean",
+    "uuid": "string",
+    "filename": "File",
+    "file": "File",
+    "directory": "Directory",
+    "path": "string",
+}
+
+# click ParamType instances and classes by attribute name, mapped to their `name`
+CLICK_TYPE_NAMES = {
+    "STRING": "text",
+    "INT": "integer",
+    "FLOAT": "float",
+    "BOOL": "boolean",
+    "UUID": "uuid",
+    "File": "filename",
+    "Choice": "choice",
+    "IntRange": "integer range",
+    "FloatRange": "float range",
+}
+
+ARGPARSE_ACTIONS = {"store", "store_true", "store_false", "append", "append_const"}
+ARGPARSE_IGNORED_ACTIONS = {"store_const", "count", "help", "version", "extend"}
+CLICK_IGNORED_DECORATORS = {"pass_context", "pass_obj"}
+
+INTROSPECTION_BACKENDS = ("auto", "static", "argparse2tool")
+
+SUPPRESS = "==SUPPRESS=="
+STDOUT = object()
+
+
+class StaticIntrospectionError(Exception):
+    pass
+
+
+class CliParam:
+    id: str
+    type_: str
+    position: int | None
+    description: str | None
+    default: Any
+    prefix: str | None
+    optional: bool
+    items_type: str | None
+    choices: list[Any] | None
+    is_output: bool
+
+    def __init__(
+        self,
+        id_: str,
+        type_: str,
+        position: int | None = None,
+        description: str | None = None,
+        default: Any = None,
+        prefix: str | None = None,
+        optional: bool = False,
+        items_type: str | None = None,
+        choices: list[Any] | None = None,
+        is_output: bool = False,
+    ) -> None:
+        self.id = id_
+        self.type_ = type_
+        self.position = position
+        if description:
+            # same normalisation argparse2tool applies before writing yaml
+            description = description.replace(":", " -").replace("\n", " ")
+            description = re.sub(r"\s{2,}", " ", description)
+        self.description = description or None
+        self.default = None if default is STDOUT else default
+        self.prefix = prefix
+        self.optional = optional
+        self.items_type = items_type
+        self.choices = choices
+        self.is_output = is_output
+
+    def to_cwl(self) -> dict[str, Any]:
+        if self.type_ in ("enum", "array"):
+            type_: Any = {"type": self.type_}
+            if self.type_ == "array":
+                type_["items"] = self.items_type or "string"
+            else:
+                type_["symbols"] = load_scalar(str(self.choices))
+            if self.optional:
+                type_ = ["null", type_]
+        else:
+            type_ = ["null", self.type_] if self.optional else self.type_
+        param: dict[str, Any] = {"type": type_}
+        if self.default is not None:
+            param["default"] = load_scalar(str(self.default))
+        if self.description:
+            param["doc"] = load_scalar(self.description)
+        if self.position or self.prefix:
+            binding = {}
+            if self.position:
+                binding["position"] = self.position
+            if self.prefix:
+                binding["prefix"] = self.prefix
+            param["inputBinding"] = binding
+        return param
+
+
+def load_scalar(raw: str) -> Any:
+    # values are written into argparse2tool's yaml template verbatim, parse them
+    # the same way the resulting file would be parsed
+    try:
+        return YAML(typ="safe", pure=True).load(f"value: {raw}")["value"]
+    except Exception as e:
+        raise StaticIntrospectionError(f"Cannot represent {raw!r} in CWL.") from e
+
+
+def load_block(description: str) -> str:
+    # argparse2tool indents the description into a `doc: |` block scalar
+    text = f"value: |\n  {description}\n"
+    try:
+        return YAML(typ="safe", pure=True).load(text)["value"]
+    except Exception as e:
+        raise StaticIntrospectionError(
+            f"Cannot represent {description!r} in CWL."
+        ) from e
+
+
+def indent_description(description: str | None) -> str:
+    return description.replace("\n", "\n  ") if description else "None"
+
+
+class ScriptModule:
+    path: Path
+    tree: ast.Module
+    aliases: dict[str, str]
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        try:
+            self.tree = ast.parse(path.read_text(), filename=str(path))
+        except SyntaxError as e:
+            raise StaticIntrospectionError(f"Cannot parse {path}: {e}") from e
+        self.aliases = {}
+        for node in ast.walk(self.tree):
+            if isinstance(node, ast.Import):
+                for a in node.names:
+                    self.aliases[a.asname or a.name] = a.name
+            elif isinstance(node, ast.ImportFrom) and node.module:
+                for a in node.names:
+                    self.aliases[a.asname or a.name] = f"{node.module}.{a.name}"
+
+    def error(self, node: ast.AST, msg: str) -> StaticIntrospectionError:
+        return StaticIntrospectionError(
+            f"{self.path}:{getattr(node, 'lineno', '?')}: {msg}"
+        )
+
+    def qualname(self, node: ast.AST) -> str | None:
+        """Fully qualified name of a referenced object, e.g. `click.option`."""
+        if isinstance(node, ast.Name):
+            return self.aliases.get(node.id, node.id)
+        if isinstance(node, ast.Attribute):
+            base = self.qualname(node.value)
+            return f"{base}.{node.attr}" if base else None
+        return None
+
+    def call_name(self, node: ast.AST) -> str | None:
+        return self.qualname(node.func) if isinstance(node, ast.Call) else None
+
+    def literal(self, node: ast.AST) -> Any:
+        name = self.qualname(node)
+        if name == "argparse.SUPPRESS":
+            return SUPPRESS
+        if name == "sys.stdout":
+            return STDOUT
+        try:
+            return ast.literal_eval(node)
+        except ValueError:
+            raise self.error(node, "value can't be resolved statically.")
+
+    def kwargs(self, call: ast.Call) -> dict[str, ast.expr]:
+        if any(k.arg is None for k in call.keywords):
+            raise self.error(call, "**kwargs can't be resolved statically.")
+        return {k.arg: k.value for k in call.keywords if k.arg}
+
+    def args(self, call: ast.Call) -> list[Any]:
+        if any(isinstance(a, ast.Starred) for a in call.args):
+            raise self.error(call, "*args can't be resolved statically.")
+        return [self.literal(a) for a in call.args]
+
+
+def click_type_name(module: ScriptModule, node: ast.expr | None, default: Any) -> str:
+    """Name of the click ParamType click would pick, see `click.types.convert_type`."""
+    if node is None:
+        if isinstance(default, (tuple, list)):
+            default = default[0] if default else None
+            if isinstance(default, (tuple, list)):
+                raise StaticIntrospectionError("click tuple types are not supported.")
+        if default is None:
+            return "text"
+        return {bool: "boolean", int: "integer", float: "float"}.get(
+            type(default), "text"
+        )
+    name = module.qualname(node.func if isinstance(node, ast.Call) else node)
+    if name in ("str", "builtins.str"):
+        return "text"
+    if name in ("int", "bool", "float"):
+        return {"int": "integer", "bool": "boolean", "float": "float"}[name]
+    if not name or not name.startswith("click."):
+        raise module.error(node, "unsupported click parameter type.")
+    attr = name.removeprefix("click.").removeprefix("types.")
+    if attr == "Path":
+        kw = module.kwargs(node) if isinstance(node, ast.Call) else {}
+        file_okay = module.literal(kw["file_okay"]) if "file_okay" in kw else True
+        dir_okay = module.literal(kw["dir_okay"]) if "dir_okay" in kw else True
+        if file_okay and not dir_okay:
+            return "file"
+        if dir_okay and not file_okay:
+            return "directory"
+        return "path"
+    if attr not in CLICK_TYPE_NAMES:
+        raise module.error(node, f"unsupported click parameter type {name}.")
+    return CLICK_TYPE_NAMES[attr]
+
+
+def click_option_name(decls: list[str]) -> tuple[str, list[str], list[str]]:
+    # mirrors click.Option._parse_decls
+    opts, secondary_opts, possible_names = [], [], []
+    name = None
+    for decl in decls:
+        if decl.isidentifier():
+            name = decl
+            continue
+        split_char = ";" if decl[:1] == "/" else "/"
+        if split_char in decl:
+            first, second = decl.split(split_char, 1)
+            first = first.rstrip()
+            if first:
+                possible_names.append(re.match(r"^(\W*)(.*)$", first).groups())
+                opts.append(first)
+            second = second.lstrip()
+            if second:
+                secondary_opts.append(second)
+        else:
+            possible_names.append(re.match(r"^(\W*)(.*)$", decl).groups())
+            opts.append(decl)
+    if name is None and possible_names:
+        possible_names.sort(key=lambda x: -len(x[0]))
+        name = possible_names[0][1].replace("-", "_").lower()
+    if not name or not name.isidentifier():
+        raise StaticIntrospectionError(f"Could not determine name for {decls}.")
+    return name, opts, secondary_opts
+
+
+def click_params(module: ScriptModule) -> tuple[str, list[CliParam]] | None:
+    commands = []
+    for node in ast.walk(module.tree):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        for dec in node.decorator_list:
+            name = module.qualname(dec.func if isinstance(dec, ast.Call) else dec)
+            if name == "click.group":
+                raise module.error(dec, "click groups are not supported.")
+            if name == "click.command":
+                commands.append((node, dec))
+    if not commands:
+        return None
+    if len(commands) > 1:
+        raise module.error(commands[1][0], "multiple click commands found.")
+    func, command_dec = commands[0]
+
+    help_ = ast.get_docstring(func, clean=False)
+    if isinstance(command_dec, ast.Call):
+        kw = module.kwargs(command_dec)
+        if "help" in kw:
+            help_ = module.literal(kw["help"])
+
+    params = []
+    positional_count = 0
+    # decorators apply bottom up, click reverses them back into source order
+    for dec in func.decorator_list:
+        name = module.qualname(dec.func if isinstance(dec, ast.Call) else dec)
+        if name == "click.command":
+            continue
+        if name and name.removeprefix("click.") in CLICK_IGNORED_DECORATORS:
+            continue
+        if name not in ("click.option", "click.argument") or not isinstance(
+            dec, ast.Call
+        ):
+            raise module.error(dec, f"unsupported decorator {name}.")
+        decls = module.args(dec)
+        kw = module.kwargs(dec)
+        lit = {
+            k: module.literal(v)
+            for k, v in kw.items()
+            if k not in ("type", "callback", "shell_complete")
+        }
+        has_default = "default" in lit
+        default = lit.get("default")
+        nargs = lit.get("nargs", 1)
+        if name == "click.option":
+            if nargs != 1:
+                raise module.error(dec, "options with nargs are not supported.")
+            if lit.get("prompt") is not None and lit.get("prompt_required") is False:
+                raise module.error(dec, "optional prompts are not supported.")
+            id_, opts, secondary_opts = click_option_name(decls)
+            required = bool(lit.get("required", False))
+            flag_value = lit.get("flag_value")
+            is_flag = lit.get("is_flag")
+            if is_flag is None:
+                is_flag = flag_value is not None or bool(secondary_opts)
+            if is_flag and not has_default and not required:
+                default = () if lit.get("multiple") else False
+            if lit.get("count"):
+                type_name = "integer range" if "type" not in kw else None
+                if not has_default:
+                    default = 0
+            else:
+                type_name = None
+            if type_name is None:
+                if is_flag and "type" not in kw:
+                    if flag_value is None:
+                        flag_value = not default
+                    type_name = click_type_name(module, None, flag_value)
+                else:
+                    type_name = click_type_name(module, kw.get("type"), default)
+            help_text = lit.get("help")
+            description = inspect.cleandoc(help_text) if help_text else None
+            prefix = opts[-1]
+        else:
+            if len(decls) != 1:
+                raise module.error(dec, "arguments take exactly one declaration.")
+            id_ = decls[0].replace("-", "_").lower()
+            required = lit.get("required")
+            if required is None:
+                required = False if default is not None else nargs > 0
+            type_name = click_type_name(module, kw.get("type"), default)
+            description = lit.get("metavar") or id_.upper()
+            prefix = None
+
+        position = None
+        if required:
+            positional_count += 1
+            position = positional_count
+        if type_name not in CLICK_TO_CWL_TYPES:
+            raise module.error(dec, f"unsupported click type {type_name}.")
+        choices = None
+        is_output = False
+        type_node = kw.get("type")
+        if type_name in ("choice", "filename") and not isinstance(type_node, ast.Call):
+            raise module.error(dec, f"unsupported click type {type_name}.")
+        if type_name == "choice":
+            choices = list(module.args(type_node)[0])
+        if type_name == "filename":
+            file_kw = module.kwargs(type_node)
+            file_args = module.args(type_node) or ["r"]
+            mode = (
+                module.literal(file_kw["mode"]) if "mode" in file_kw else file_args[0]
+            )
+            is_output = "w" in mode
+        params.append(
+            CliParam(
+                id_=id_,
+                type_=CLICK_TO_CWL_TYPES[type_name],
+                position=position,
+                description=description,
+                default=default,
+                prefix=prefix,
+                optional=not required,
+                choices=choices,
+                is_output=is_output,
+            )
+        )
+    return indent_description(help_), params
+
+
+def argparse_cwl_type(
+    module: ScriptModule, node: ast.expr | None
+) -> tuple[str | None, bool]:
+    """CWL type of an argparse `type=`, and whether it is an output file."""
+    if node is None:
+        return None, False
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return PY_TO_CWL_TYPES.get(node.value), False
+    name = (
+        module.call_name(node) if isinstance(node, ast.Call) else module.qualname(node)
+    )
+    if name == "argparse.FileType":
+        args = module.args(node)
+        kw = module.kwargs(node)
+        mode = module.literal(kw["mode"]) if "mode" in kw else (args or ["r"])[0]
+        return "File", "w" in mode
+    if name == "open":
+        return "File", False
+    if name in PY_TO_CWL_TYPES and not isinstance(node, ast.Call):
+        return PY_TO_CWL_TYPES[name], False
+    raise module.error(node, "unsupported argparse argument type.")
+
+
+def in_unsupported_block(module: ScriptModule, target: ast.AST) -> bool:
+    # arguments added in loops may be added any number of times
+    for node in ast.walk(module.tree):
+        if isinstance(node, (ast.For, ast.AsyncFor, ast.While, ast.comprehension)):
+            if any(n is target for n in ast.walk(node)):
+                return True
+    return False
+
+
+def argparse_params(module: ScriptModule) -> tuple[str, list[CliParam]] | None:
+    parser_calls = [
+        node
+        for node in ast.walk(module.tree)
+        if module.call_name(node) == "argparse.ArgumentParser"
+    ]
+    if not parser_calls:
+        return None
+    if len(parser_calls) > 1:
+        raise module.error(parser_calls[1], "multiple argument parsers found.")
+    parser_call = parser_calls[0]
+    parser_name = None
+    for node in ast.walk(module.tree):
+        if (
+            isinstance(node, ast.Assign)
+            and node.value is parser_call
+            and len(node.targets) == 1
+            and isinstance(node.targets[0], ast.Name)
+        ):
+            parser_name = node.targets[0].id
+    if not parser_name:
+        raise module.error(parser_call, "argument parser is not assigned to a name.")
+
+    groups: dict[str, str] = {}
+    for node in ast.walk(module.tree):
+        if (
+            isinstance(node, ast.Assign)
+            and len(node.targets) == 1
+            and isinstance(node.targets[0], ast.Name)
+            and isinstance(node.value, ast.Call)
+            and isinstance(node.value.func, ast.Attribute)
+            and isinstance(node.value.func.value, ast.Name)
+            and node.value.func.value.id == parser_name
+            and node.value.func.attr
+            in ("add_argument_group", "add_mutually_exclusive_group")
+        ):
+            groups[node.targets[0].id] = parser_name
+        elif (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and node.func.attr == "add_subparsers"
+        ):
+            raise module.error(node, "subparsers are not supported.")
+
+    kw = module.kwargs(parser_call)
+    if "parents" in kw or "argument_default" in kw:
+        raise module.error(parser_call, "parents and argument_default not supported.")
+    args = module.args(parser_call)
+    description = module.literal(kw["description"]) if "description" in kw else None
+    if description is None and len(args) > 2:
+        description = args[2]
+    epilog = module.literal(kw["epilog"]) if "epilog" in kw else None
+    add_help = module.literal(kw["add_help"]) if "add_help" in kw else True
+    prefix_chars = module.literal(kw["prefix_chars"]) if "prefix_chars" in kw else "-"
+
+    calls = [
+        node
+        for node in ast.walk(module.tree)
+        if isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Attribute)
+        and node.func.attr == "add_argument"
+        and isinstance(node.func.value, ast.Name)
+        and node.func.value.id in (parser_name, *groups)
+    ]
+    calls.sort(key=lambda n: (n.lineno, n.col_offset))
+
+    params = []
+    names = ["help"] if add_help else []
+    positional_count = 0
+    for call in calls:
+        if in_unsupported_block(module, call):
+            raise module.error(call, "arguments added in a loop are not supported.")
+        flags = module.args(call)
+        kw = module.kwargs(call)
+        lit = {k: module.literal(v) for k, v in kw.items() if k != "type"}
+        action = lit.get("action", "store")
+        if not isinstance(action, str):
+            raise module.error(call, "custom actions are not supported.")
+        option_strings = [f for f in flags if f and f[0] in prefix_chars]
+        if option_strings:
+            long_opts = [o for o in option_strings if o[1:2] in prefix_chars]
+            dest = lit.get("dest") or (long_opts or option_strings)[0]
+            dest = dest.lstrip(prefix_chars).replace("-", "_")
+        else:
+            dest = flags[0]
+
+        if dest in names:
+            if action == "append_const":
+                continue
+            dest = "_" + dest
+        names.append(dest)
+        if action in ARGPARSE_IGNORED_ACTIONS:
+            continue
+        if action not in ARGPARSE_ACTIONS:
+            raise module.error(call, f"unsupported action {action}.")
+
+        cwl_type, is_output = argparse_cwl_type(module, kw.get("type"))
+        default = lit.get("default")
+        optional = False
+        items_type = None
+        if action in ("store_true", "store_false"):
+            cwl_type = "boolean"
+            if "default" not in lit:
+                default = action == "store_false"
+        elif action == "append":
+            items_type = cwl_type
+            cwl_type = "array"
+        elif action == "append_const":
+            cwl_type = "array"
+            optional = True
+        else:
+            nargs = lit.get("nargs")
+            if nargs:
+                if nargs != "?":
+                    items_type = cwl_type
+                    cwl_type = "array"
+                if nargs in ("?", "*"):
+                    optional = True
+        prefix = None
+        position = None
+        if option_strings:
+            prefix = option_strings[-1]
+            if not lit.get("required", False):
+                optional = True
+        else:
+            positional_count += 1
+            position = positional_count
+        choices = None
+        if lit.get("choices") is not None and action not in (
+            "store_true",
+            "store_false",
+            "append_const",
+        ):
+            choices = list(lit["choices"])
+            cwl_type = "enum"
+        params.append(
+            CliParam(
+                id_=dest,
+                type_=cwl_type or "string",
+                position=position,
+                description=lit.get("help"),
+                default=default,
+                prefix=prefix,
+                optional=optional,
+                items_type=items_type,
+                choices=choices,
+                is_output=is_output,
+            )
+        )
+
+    if epilog is not None:
+        if not description:
+            raise module.error(parser_call, "epilog without a description.")
+        # argparse2tool appends the epilog after indenting the description
+        return indent_description(description) + epilog, params
+    return indent_description(description), params
+
+
+def introspect_script(
+    script_path: Path, cwl_outputs_path: Path | None = None
+) -> dict[str, Any]:
+    """Describe `script_path`'s command line as a CommandLineTool document."""
+    module = ScriptModule(script_path)
+    click_cli = click_params(module)
+    argparse_cli = argparse_params(module)
+    if click_cli and argparse_cli:
+        raise StaticIntrospectionError(f"{script_path} uses both click and argparse.")
+    if not click_cli and not argparse_cli:
+        raise StaticIntrospectionError(f"No click or argparse cli in {script_path}.")
+    description, params = click_cli or argparse_cli
+
+    tool: dict[str, Any] = {
+        "cwlVersion": "v1.0",
+        "class": "CommandLineTool",
+        "baseCommand": [script_path.name],
+        "doc": load_block(description),
+        "inputs": {p.id: p.to_cwl() for p in params} or [],
+    }
+    if cwl_outputs_path:
+        with open(cwl_outputs_path) as f:
+            tool.update(YAML(typ="safe", pure=True).load(f) or {})
+    else:
+        tool["outputs"] = {
+            f"{p.id}_out": {
+                "type": "File",
+                **({"doc": load_scalar(p.description)} if p.description else {}),
+                "outputBinding": {"glob": f"$(inputs.{p.id}.path)"},
+            }
+            for p in params
+            if p.is_output
+        } or []
+    return tool
@@ -0,0 +1,221 @@
+import fcntl
+import json
+import platform
+import shlex
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+from eoap_gen.cache import hash_obj
+from eoap_gen.config import StepConfig
+from eoap_gen.envs import DEFAULT_PYTHON_VERSION, EnvPool
+from eoap_gen.trace import run
+
+LOCK_NAME = "requirements.lock"
+# the image's wheels next to the lock, in the step's docker build context
+WHEELS_DIR = "wheels"
+# platform of the generated images, pip also accepts wheels for older glibc
+IMAGE_PLATFORM = "manylinux_2_28_x86_64"
+COMPLETE_DIR = ".complete"
+
+
+def image_python_version(step: StepConfig) -> str:
+    return step.python_version or DEFAULT_PYTHON_VERSION
+
+
+def env_python_version(step: StepConfig) -> str:
+    # the introspection environment, venvs use the interpreter running eoap-gen
+    if step.conda:
+        return image_python_version(step)
+    return ".".join(platform.python_version_tuple()[:2])
+
+
+def target_args(python_version: str, image: bool) -> list[str]:
+    args = ["--python-version", python_version]
+    if image:
+        args += [
+            "--platform",
+            IMAGE_PLATFORM,
+            "--implementation",
+            "cp",
+            "--only-binary=:all:",
+        ]
+    return args
+
+
+def pip(args: list[str], name: str, env_pool: EnvPool) -> None:
+    cmd = shlex.join([sys.executable, "-m", "pip", *args])
+    res = run(cmd, name, env=env_pool.build_env_vars())
+    if res.returncode != 0:
+        raise RuntimeError(
+            "Failed resolving requirements.\n"
+            f"Command stdout: {res.stdout.decode(errors='replace')}\n"
+            f"Command stderr: {res.stderr.decode(errors='replace')}"
+        )
+
+
+def resolve(
+    requirements: Path, args: list[str], env_pool: EnvPool
+) -> dict[str, tuple[str, list[str]]]:
+    """
+    Resolve requirements without installing them, returns the version and hashes
+    of every distribution pip picked, keyed by name.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        report = Path(tmp) / "report.json"
+        pip(
+            [
+                "install",
+                "--dry-run",
+                "--ignore-installed",
+                "--quiet",
+                "--target",
+                str(Path(tmp) / "target"),
+                "--report",
+                str(report),
+                *args,
+                "-r",
+                str(requirements),
+            ],
+            "pip resolve",
+            env_pool,
+        )
+        with open(report) as f:
+            installs = json.load(f)["install"]
+    resolved = {}
+    for item in installs:
+        hashes = item["download_info"].get("archive_info", {}).get("hashes", {})
+        if "sha256" not in hashes:
+            raise RuntimeError(
+                f"No sha256 hash for {item['metadata']['name']}, "
+                "only index and archive requirements can be locked."
+            )
+        resolved[item["metadata"]["name"].lower()] = (
+            item["metadata"]["version"],
+            [hashes["sha256"]],
+        )
+    return resolved
+
+
+def lock_content(key: str, pins: dict[str, tuple[str, list[str]]]) -> str:
+    lines = [
+        "# Generated by eoap-gen, do not edit.",
+        f"# input: {key}",
+    ]
+    for name, (version, hashes) in sorted(pins.items()):
+        hash_args = " ".join(f"--hash=sha256:{h}" for h in sorted(set(hashes)))
+        lines.append(f"{name}=={version} {hash_args}")
+    return "\n".join(lines) + "\n"
+
+
+def lock_key(lock_path: Path) -> str | None:
+    try:
+        with open(lock_path) as f:
+            f.readline()
+            header = f.readline()
+    except FileNotFoundError:
+        return None
+    return header.removeprefix("# input:").strip() or None
+
+
+def fill_wheelhouse(step: StepConfig, lock_path: Path, env_pool: EnvPool) -> None:
+    wheelhouse = env_pool.wheelhouse
+    complete = wheelhouse / COMPLETE_DIR
+    complete.mkdir(parents=True, exist_ok=True)
+    marker = complete / hash_obj(lock_path.read_text())
+    with open(wheelhouse / ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if marker.exists():
+                return
+            for python_version, image in [
+                (image_python_version(step), True),
+                (env_python_version(step), False),
+            ]:
+                pip(
+                    [
+                        "download",
+                        "--quiet",
+                        "--no-deps",
+                        "--require-hashes",
+                        "--dest",
+                        str(wheelhouse),
+                        *target_args(python_version, image),
+                        "-r",
+                        str(lock_path),
+                    ],
+                    "pip download",
+                    env_pool,
+                )
+            marker.touch()
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def copy_image_wheels(step: StepConfig, lock_path: Path, env_pool: EnvPool) -> None:
+    wheels = lock_path.parent / WHEELS_DIR
+    shutil.rmtree(wheels, ignore_errors=True)
+    pip(
+        [
+            "download",
+            "--quiet",
+            "--no-index",
+            "--find-links",
+            str(env_pool.wheelhouse),
+            "--no-deps",
+            "--require-hashes",
+            "--dest",
+            str(wheels),
+            *target_args(image_python_version(step), True),
+            "-r",
+            str(lock_path),
+        ],
+        "pip copy wheels",
+        env_pool,
+    )
+
+
+def lock_requirements(step: StepConfig, output_dir: Path, env_pool: EnvPool) -> Path:
+    """
+    Pin the step's requirements with their hashes into `requirements.lock` next to
+    its generated files and download the pinned distributions into the wheelhouse
+    of `env_pool`, for both the image and the introspection environment. The
+    image's are copied next to the lock, so its docker build context has them.
+
+    The requirements are resolved for the image, the introspection environment gets
+    the same versions. An existing lock is kept as long as the requirements and
+    python versions it was resolved from are unchanged.
+    """
+    if not step.requirements:
+        raise ValueError(f"Step {step.id_} has no requirements.")
+    lock_path = output_dir / LOCK_NAME
+    key = hash_obj(
+        {
+            "requirements": step.requirements.read_text(),
+            "image": [image_python_version(step), IMAGE_PLATFORM],
+            "env": [env_python_version(step), sys.platform],
+        }
+    )
+    if lock_key(lock_path) != key:
+        image_pins = resolve(
+            step.requirements,
+            target_args(image_python_version(step), True),
+            env_pool,
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            pinned = Path(tmp) / "pinned.txt"
+            pinned.write_text(
+                "".join(f"{n}=={v}\n" for n, (v, _) in sorted(image_pins.items()))
+            )
+            env_pins = resolve(
+                pinned,
+                ["--no-deps", *target_args(env_python_version(step), False)],
+                env_pool,
+            )
+        for name, (_, hashes) in env_pins.items():
+            image_pins[name][1].extend(hashes)
+        lock_path.write_text(lock_content(key, image_pins))
+    fill_wheelhouse(step, lock_path, env_pool)
+    copy_image_wheels(step, lock_path, env_pool)
+    return lock_path
@@ -0,0 +1,66 @@
+from typing import Any
+
+from eoap_gen.config import StepConfig, cwl_parser
+from eoap_gen.template import get_template
+
+# wrapper script running the command of tools with list outputs, staged into
+# their working directory
+LIST_WRAPPER = "eoap_gen_outputs.py"
+
+
+def output_spec(step: StepConfig, out: Any) -> dict[str, Any]:
+    binding = out.outputBinding
+    glob = binding.glob if binding else None
+    types = out.type_ if isinstance(out.type_, list) else [out.type_]
+    types = [t for t in types if t != "null"]
+    array = len(types) == 1 and not isinstance(types[0], str)
+    class_ = types[0].items if array else types[0] if types else None
+    if (
+        binding is None
+        or binding.loadContents
+        or binding.outputEval
+        or not isinstance(glob, str)
+        or "$" in glob
+        or len(types) != 1
+        or class_ not in ["File", "Directory"]
+    ):
+        raise ValueError(
+            f"Step {step.id_} output {out.id.split('#')[-1]} can't be set next to "
+            "list outputs, only File and Directory outputs with a plain glob can."
+        )
+    return {"glob": glob, "class": class_, "array": array}
+
+
+def list_outputs_wrapper(step: StepConfig, tool_obj: Any) -> str:
+    lists = {o.id_: o.list_file for o in step.outputs if o.list_file}
+    outputs = {}
+    for out in tool_obj.outputs:
+        out_id = out.id.split("#")[-1].split("/")[-1]
+        if out_id in lists:
+            outputs[out_id] = {"list": lists[out_id]}
+        else:
+            outputs[out_id] = output_spec(step, out)
+    return get_template("list_outputs.jinja").render(outputs=outputs)
+
+
+def wrap_list_outputs(tool_obj: Any, step: StepConfig) -> None:
+    """
+    Run the tool's command through a wrapper reading its list outputs from the
+    files the script wrote them to, one item a line, into `cwl.output.json`.
+    The runner doesn't load the files' contents, so the lists can be any length.
+    """
+    from eoap_gen.cwl import add_work_dir_entries
+
+    parser = cwl_parser(step.cwl_version)
+    add_work_dir_entries(
+        tool_obj,
+        step,
+        [
+            parser.Dirent(
+                entryname=LIST_WRAPPER, entry=list_outputs_wrapper(step, tool_obj)
+            )
+        ],
+    )
+    # [..., "python", script] -> [..., "python", wrapper, "python", script]
+    base = tool_obj.baseCommand
+    tool_obj.baseCommand = [*base[:-1], LIST_WRAPPER, *base[-2:]]
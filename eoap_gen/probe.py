@@ -0,0 +1,71 @@
+"""
+Run a tool's command and record its wall time, cpu time, peak memory and the
+bytes it was given and wrote, as a JSON file in a metrics directory.
+
+    python probe.py <metrics dir> <tool id> <base command length> <command...>
+
+Tools of `eoap-gen run` call it as a script with the interpreter running
+eoap-gen, so it only uses the standard library.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+
+def path_size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    size = 0
+    for root, _, files in os.walk(path, followlinks=True):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
+
+
+def main(argv: list[str]) -> int:
+    metrics_dir, tool_id, base_length, *cmd = argv
+    cwd = os.getcwd()
+    # files staged into the work dir and paths passed as arguments
+    staged = path_size(cwd)
+    args = {
+        os.path.abspath(a)
+        for a in cmd[int(base_length) :]
+        if os.path.exists(a) and not os.path.abspath(a).startswith(cwd + os.sep)
+    }
+    input_bytes = staged + sum(path_size(a) for a in args)
+
+    started = time.time()
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd)
+    # wait4 rather than proc.wait to get the resource usage of the command
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+    returncode = os.waitstatus_to_exitcode(status)
+    max_rss = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+
+    record = {
+        "tool": tool_id,
+        "started": started,
+        "wall_s": round(wall, 3),
+        "user_s": round(usage.ru_utime, 3),
+        "sys_s": round(usage.ru_stime, 3),
+        "max_rss_kb": max_rss,
+        "input_bytes": input_bytes,
+        "output_bytes": max(path_size(cwd) - staged, 0),
+        "returncode": returncode,
+    }
+    path = os.path.join(metrics_dir, f"{tool_id}-{uuid.uuid4().hex}.json")
+    with open(path, "w") as f:
+        json.dump(record, f)
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,64 @@
+import json
+from pathlib import Path
+from typing import Any
+
+import yaml
+from ruamel.yaml import YAML
+from ruamel.yaml.constructor import SafeConstructor
+
+OUTPUT_FORMATS = ("yaml", "json")
+
+# libyaml backed emitter when pyyaml was built with it, our files don't need the
+# comment and style preserving round trip of ruamel
+BaseDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+class CwlDumper(BaseDumper):
+    pass
+
+
+def represent_str(dumper: yaml.SafeDumper, data: str) -> yaml.ScalarNode:
+    # double quote multi-line strings like ruamel does instead of folding them
+    style = '"' if "\n" in data else None
+    return dumper.represent_scalar("tag:yaml.org,2002:str", data, style=style)
+
+
+CwlDumper.add_representer(str, represent_str)
+
+
+def dumps(doc: Any, output_format: str = "yaml") -> str:
+    if output_format == "json":
+        return json.dumps(doc, indent=2) + "\n"
+    return yaml.dump(
+        doc,
+        Dumper=CwlDumper,
+        sort_keys=False,
+        default_flow_style=False,
+        allow_unicode=True,
+    )
+
+
+def dump(doc: Any, path: Path, output_format: str = "yaml") -> None:
+    with open(path, "w") as f:
+        f.write(dumps(doc, output_format))
+
+
+class NoTimestampConstructor(SafeConstructor):
+    pass
+
+
+# keep timestamps as strings, like the loader of cwl_utils and cwltool
+NoTimestampConstructor.add_constructor(
+    "tag:yaml.org,2002:timestamp", SafeConstructor.construct_yaml_str
+)
+
+
+def load(path: Path) -> Any:
+    """
+    Load a YAML or JSON file with the C based safe loader of ruamel, it follows
+    YAML 1.2 like cwltool does.
+    """
+    yaml = YAML(typ="safe")
+    yaml.Constructor = NoTimestampConstructor
+    with open(path) as f:
+        return yaml.load(f)
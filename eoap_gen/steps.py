@@ -0,0 +1,204 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from eoap_gen.batch import generate_batch_tools
+from eoap_gen.config import StepConfig
+from eoap_gen.cwl import (
+    generate_cwl_cli,
+    generate_docker_cli,
+    modify_cwl_cli,
+    write_cwl_cli_outputs,
+)
+from eoap_gen.dockerfile import generate_dockerfile, get_requirements, shared_image_name
+from eoap_gen.envs import EnvPool
+from eoap_gen.fuse import generate_fused_cli, write_fused_driver
+from eoap_gen.lock import lock_requirements
+from eoap_gen.serialize import load
+from eoap_gen.trace import span
+
+
+def step_docker_url(
+    step: StepConfig, docker_url_base: str, docker_tag: str, shared_images: bool = False
+) -> str:
+    if step.docker_image:
+        return step.docker_image
+    # fused steps need an image with all their scripts, never shared
+    image = shared_image_name(step) if shared_images and not step.fused else step.id_
+    return os.path.join(docker_url_base, f"{image}:{docker_tag}")
+
+
+def generate_step(
+    step: StepConfig,
+    output_path: Path,
+    docker_url_base: str,
+    docker_tag: str,
+    env_pool: EnvPool | None = None,
+    introspection: str = "auto",
+    output_format: str = "yaml",
+    buildkit: bool = False,
+    shared_images: bool = False,
+    lock: bool = False,
+) -> None:
+    step_output_dir = output_path / "cli" / step.id_
+    with span("step", step=step.id_):
+        if step.docker_image:
+            with span("docker_cli"):
+                generate_docker_cli(step, step_output_dir, output_format)
+        elif step.fused:
+            env_pool = env_pool or EnvPool()
+            lock_path = None
+            if lock and step.requirements:
+                with span("lock"):
+                    lock_path = lock_requirements(step, step_output_dir, env_pool)
+            with span("dockerfile"):
+                generate_dockerfile(
+                    step, step_output_dir, buildkit, lock_path is not None
+                )
+            tools = {}
+            for sub in step.fused:
+                assert sub.script
+                sub_dir = step_output_dir / sub.id_
+                os.makedirs(sub_dir, exist_ok=True)
+                shutil.copy2(sub.script, step_output_dir / f"{sub.id_}.py")
+                write_cwl_cli_outputs(sub_dir / "tool_out.yml", sub.outputs)
+                generate_cwl_cli(
+                    script_path=sub.script,
+                    output_dir=sub_dir,
+                    step_id=sub.id_,
+                    requirements=get_requirements(lock_path or step.requirements),
+                    cwl_outputs_path=sub_dir / "tool_out.yml",
+                    conda_pkgs=step.conda,
+                    python_version=step.python_version,
+                    env_pool=env_pool,
+                    introspection=introspection,
+                    output_format=output_format,
+                    wheelhouse=env_pool.wheelhouse if lock_path else None,
+                )
+                tools[sub.id_] = load(sub_dir / f"{sub.script.stem}.cwl")
+            with span("fused_cli"):
+                write_fused_driver(step, tools, step_output_dir)
+                generate_fused_cli(
+                    step,
+                    tools,
+                    step_output_dir,
+                    step_docker_url(step, docker_url_base, docker_tag, shared_images),
+                    output_format,
+                )
+        elif step.script:
+            env_pool = env_pool or EnvPool()
+            lock_path = None
+            if lock and step.requirements:
+                with span("lock"):
+                    lock_path = lock_requirements(step, step_output_dir, env_pool)
+            # shared images get their Dockerfile once all steps are generated
+            if not shared_images:
+                with span("dockerfile"):
+                    generate_dockerfile(
+                        step, step_output_dir, buildkit, lock_path is not None
+                    )
+            write_cwl_cli_outputs(step_output_dir / "tool_out.yml", step.outputs)
+            generate_cwl_cli(
+                script_path=step.script,
+                output_dir=step_output_dir,
+                step_id=step.id_,
+                requirements=get_requirements(lock_path or step.requirements),
+                cwl_outputs_path=step_output_dir / "tool_out.yml",
+                conda_pkgs=step.conda,
+                python_version=step.python_version,
+                env_pool=env_pool,
+                introspection=introspection,
+                output_format=output_format,
+                wheelhouse=env_pool.wheelhouse if lock_path else None,
+            )
+            with span("modify_cwl_cli"):
+                modify_cwl_cli(
+                    step_output_dir / f"{step.script.stem}.cwl",
+                    step_docker_url(step, docker_url_base, docker_tag, shared_images),
+                    step,
+                    output_format,
+                    f"/app/{step.id_}.py" if shared_images else "/app/app.py",
+                )
+        else:
+            raise ValueError(f"Step {step.id_} has no docker image or script.")
+        if step.scatter_batch_size:
+            with span("batch_tools"):
+                generate_batch_tools(step, step_output_dir, output_format)
+
+
+def generate_steps(
+    steps: list[StepConfig],
+    output_path: Path,
+    docker_url_base: str,
+    docker_tag: str,
+    jobs: int = 1,
+    env_pool: EnvPool | None = None,
+    introspection: str = "auto",
+    output_format: str = "yaml",
+    buildkit: bool = False,
+    shared_images: bool = False,
+    lock: bool = False,
+) -> dict[str, Exception]:
+    """
+    Generate CommandLineTools for all steps, running up to `jobs` steps at once.
+
+    Steps are independent of each other and each writes only into its own output
+    directory, so the result does not depend on the order they finish in. Returns
+    the exceptions raised by failed steps, keyed by step id in config order.
+    """
+    return generate_step_tasks(
+        {s.id_: (s, output_path) for s in steps},
+        docker_url_base,
+        docker_tag,
+        jobs=jobs,
+        env_pool=env_pool,
+        introspection=introspection,
+        output_format=output_format,
+        buildkit=buildkit,
+        shared_images=shared_images,
+        lock=lock,
+    )
+
+
+def generate_step_tasks(
+    tasks: dict[str, tuple[StepConfig, Path]],
+    docker_url_base: str,
+    docker_tag: str,
+    jobs: int = 1,
+    env_pool: EnvPool | None = None,
+    introspection: str = "auto",
+    output_format: str = "yaml",
+    buildkit: bool = False,
+    shared_images: bool = False,
+    lock: bool = False,
+) -> dict[str, Exception]:
+    """
+    Generate steps of possibly different workflows, each into its own output path.
+    Returns the exceptions raised by failed tasks, keyed like `tasks`.
+    """
+    # environment creation is the expensive part, limit how many run at once
+    env_pool = env_pool or EnvPool(max_builds=jobs)
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = {
+            key: executor.submit(
+                generate_step,
+                step,
+                output_path,
+                docker_url_base,
+                docker_tag,
+                env_pool,
+                introspection,
+                output_format,
+                buildkit,
+                shared_images,
+                lock,
+            )
+            for key, (step, output_path) in tasks.items()
+        }
+    errors = {}
+    for key, future in futures.items():
+        exc = future.exception()
+        if exc is not None:
+            errors[key] = exc
+    return errors
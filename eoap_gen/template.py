@@ -1,11 +1,26 @@
-from jinja2 import Environment, PackageLoader, Template, select_autoescape
+from functools import cache
 
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    PackageLoader,
+    Template,
+    select_autoescape,
+)
 
-def get_template(name: str) -> Template:
-    env = Environment(
+
+@cache
+def get_environment() -> Environment:
+    # one environment per process, so templates are only compiled once, and the
+    # bytecode cache saves compiling them again in every new process
+    return Environment(
         loader=PackageLoader("eoap_gen"),
         autoescape=select_autoescape(),
         trim_blocks=True,
         lstrip_blocks=True,
+        bytecode_cache=FileSystemBytecodeCache(),
     )
-    return env.get_template(name)
+
+
+def get_template(name: str) -> Template:
+    return get_environment().get_template(name)
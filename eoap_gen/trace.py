@@ -0,0 +1,149 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+
+class Tracer:
+    """
+    Collects timed spans of a run, from any thread, and renders them as a timings
+    table or as Chrome trace events (chrome://tracing, https://ui.perfetto.dev).
+    """
+
+    events: list[dict[str, Any]]
+
+    def __init__(self) -> None:
+        self.events = []
+        self.lock = threading.Lock()
+
+    def add(
+        self, name: str, cat: str, start: float, end: float, args: dict[str, Any]
+    ) -> None:
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": round(start * 1e6),
+            "dur": round((end - start) * 1e6),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+        with self.lock:
+            self.events.append(event)
+
+    def write_chrome_trace(self, path: Path) -> None:
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+    def timings_table(self) -> str:
+        # seconds spent in each phase, summed per step
+        rows: dict[str, dict[str, float]] = {}
+        phases: list[str] = []
+        for e in sorted(self.events, key=lambda e: e["ts"]):
+            step = e["args"].get("step") or "workflow"
+            if e["name"] not in phases:
+                phases.append(e["name"])
+            row = rows.setdefault(step, {})
+            row[e["name"]] = row.get(e["name"], 0) + e["dur"] / 1e6
+
+        step_width = max([len("step"), *(len(s) for s in rows)])
+        widths = [max(len(p), 8) for p in phases]
+        lines = [
+            "  ".join(
+                [
+                    "step".ljust(step_width),
+                    *(p.rjust(w) for p, w in zip(phases, widths)),
+                ]
+            )
+        ]
+        for step, row in rows.items():
+            cells = [
+                (f"{row[p]:.2f}s" if p in row else "-").rjust(w)
+                for p, w in zip(phases, widths)
+            ]
+            lines.append("  ".join([step.ljust(step_width), *cells]))
+        return "\n".join(lines)
+
+
+TRACER: Tracer | None = None
+local = threading.local()
+
+
+@contextmanager
+def tracing(tracer: Tracer | None) -> Iterator[Tracer | None]:
+    global TRACER
+    previous, TRACER = TRACER, tracer
+    try:
+        yield tracer
+    finally:
+        TRACER = previous
+
+
+@contextmanager
+def span(name: str, cat: str = "phase", **args: Any) -> Iterator[dict[str, Any]]:
+    """
+    Record a span in the active tracer, if any. Spans opened inside another span
+    in the same thread inherit its `step`. Yields the span args, which can be
+    extended before the span ends.
+    """
+    stack = local.__dict__.setdefault("stack", [])
+    if "step" not in args and stack:
+        args["step"] = stack[-1].get("step")
+    stack.append(args)
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        end = time.perf_counter()
+        stack.pop()
+        if TRACER is not None:
+            TRACER.add(name, cat, start, end, args)
+
+
+def run(cmd: str, name: str, **kwargs: Any) -> subprocess.CompletedProcess:
+    """
+    Run a bash command capturing its output, like `subprocess.run`, and record it
+    as a span with the child's wall time, cpu time and peak RSS.
+    """
+    with (
+        tempfile.TemporaryFile() as stdout,
+        tempfile.TemporaryFile() as stderr,
+        span(name, cat="subprocess") as args,
+    ):
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            cmd,
+            shell=True,
+            executable="/bin/bash",
+            stdout=stdout,
+            stderr=stderr,
+            **kwargs,
+        )
+        # wait4 rather than proc.wait to get the resource usage of the child
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss is in kilobytes on linux and in bytes on macOS
+        max_rss = (
+            usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+        )
+        args.update(
+            {
+                "returncode": proc.returncode,
+                "wall_s": round(time.perf_counter() - start, 3),
+                "user_s": round(usage.ru_utime, 3),
+                "sys_s": round(usage.ru_stime, 3),
+                "max_rss_kb": max_rss,
+            }
+        )
+        stdout.seek(0)
+        stderr.seek(0)
+        return subprocess.CompletedProcess(
+            cmd, proc.returncode, stdout.read(), stderr.read()
+        )
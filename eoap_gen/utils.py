@@ -1,8 +1,12 @@
 import json
 import os
+import time
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Iterator
 
 from eoap_gen.config import WorkflowConfig
+from eoap_gen.trace import span
 
 
 def create_output_dirs(output_path: Path, steps: list[str]):
@@ -11,14 +15,33 @@ def create_output_dirs(output_path: Path, steps: list[str]):
         os.makedirs(output_path / "cli" / s, exist_ok=True)
 
 
-def write_action_output(config: WorkflowConfig):
+def write_action_output(config: WorkflowConfig, shared_images: bool = False):
     gh_output = os.getenv("GITHUB_OUTPUT")
     if not gh_output:
         return
 
-    tools = [s.id_ for s in config.steps if s.script]
+    # images to build, each from cli/<name>/<name>.Dockerfile
+    if shared_images:
+        from eoap_gen.dockerfile import shared_image_name
+
+        tools = sorted({shared_image_name(s) for s in config.steps if s.script})
+        # fused steps always get their own image
+        tools += [s.id_ for s in config.steps if s.fused]
+    else:
+        tools = [s.id_ for s in config.steps if s.script or s.fused]
 
     with open(gh_output, "a") as f:
         print("tools<<EOF", file=f)
         print(json.dumps(tools, separators=(",", ":")), file=f)
         print("EOF", file=f)
+
+
+@contextmanager
+def timed(timings: dict[str, float] | None, phase: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        with span(phase):
+            yield
+    finally:
+        if timings is not None:
+            timings[phase] = timings.get(phase, 0) + time.perf_counter() - start
@@ -0,0 +1,117 @@
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from eoap_gen.analyze import (
+    Node,
+    StepEstimate,
+    WorkflowGraph,
+    critical_path,
+    load_estimates,
+    simulate,
+    step_jobs,
+)
+from eoap_gen.cli import analyze
+from eoap_gen.config import WorkflowConfig
+
+
+def step(id_: str, sources: list[str], scatter: bool = False, **kwargs) -> dict:
+    return {
+        "id": id_,
+        "docker_image": "alpine:latest",
+        "command": "true",
+        "inputs": [
+            {"id": f"in_{i}", "source": s, "scatter": scatter}
+            for i, s in enumerate(sources)
+        ],
+        "outputs": [{"id": "out", "type": "File", "outputBinding": {"glob": "*"}}],
+        **kwargs,
+    }
+
+
+CONFIG = WorkflowConfig.from_dict(
+    {
+        "id": "wf",
+        "inputs": [{"id": "data", "type": "string"}],
+        "outputs": [{"id": "out", "type": "File", "source": "merge/out"}],
+        "steps": [
+            step("split", ["wf/data"]),
+            step("slow", ["split/out"]),
+            step(
+                "fast",
+                ["split/out"],
+                scatter=True,
+                resources={"cores_min": 2},
+                scatter_batch_size=4,
+                scatter_batch_parallelism=2,
+            ),
+            step("merge", ["slow/out", "fast/out"]),
+        ],
+    }
+)
+ESTIMATES = {
+    "split": StepEstimate(10),
+    "slow": StepEstimate(100),
+    "fast": StepEstimate(20, scatter_size=10),
+    "merge": StepEstimate(5),
+}
+
+
+def test_critical_path() -> None:
+    graph = WorkflowGraph(CONFIG)
+    jobs = {s: step_jobs(graph.steps[s], ESTIMATES[s]) for s in graph.order}
+
+    # batches of 4, 4 and 2 items, 2 at a time
+    assert [j.duration for j in jobs["fast"]] == [40, 40, 20]
+    assert critical_path(graph, jobs) == (115, ["split", "slow", "merge"])
+
+    unlimited = simulate(graph, jobs)
+    assert unlimited.makespan == 115
+    assert (unlimited.peak_jobs, unlimited.peak_steps) == (4, 2)
+
+
+def test_simulate_on_cluster() -> None:
+    graph = WorkflowGraph(CONFIG)
+    jobs = {s: step_jobs(graph.steps[s], ESTIMATES[s]) for s in graph.order}
+
+    sim = simulate(graph, jobs, [Node(cores=3, ram=4096)])
+
+    # slow takes one core, the fast batches run one at a time on the other two
+    assert sim.steps["fast"] == (10, 110)
+    assert sim.makespan == 115
+    cores, ram = sim.utilisation(sim.nodes[0])
+    assert round(cores * 3 * 115) == 10 + 100 + 200 + 5
+
+
+def test_analyze_command() -> None:
+    res = CliRunner().invoke(
+        analyze, ["--config", "tests/data/config.yml", "--cores", "1"]
+    )
+
+    assert res.exit_code == 1
+    assert "Step process needs 2 cores" in res.output
+
+
+@pytest.mark.parametrize(
+    "estimates,error",
+    [
+        ("[get_urls]", "must map step ids to their estimates"),
+        ("get_urls: 30", "estimates of step get_urls must be a mapping"),
+        ("get_url: {duration: 30}", "no step get_url in the workflow"),
+        ("get_urls: {time: 30}", "unknown estimates time of step get_urls"),
+        ("get_urls: {duration: soon}", "duration of step get_urls must be a number"),
+    ],
+)
+def test_load_estimates_errors(tmp_path: Path, estimates: str, error: str) -> None:
+    path = tmp_path / "estimates.yml"
+    path.write_text(estimates)
+
+    with pytest.raises(ValueError, match=error):
+        load_estimates(path, step_ids=["get_urls"])
+
+    res = CliRunner().invoke(
+        analyze, ["--config", "tests/data/config.yml", "--estimates", str(path)]
+    )
+    assert res.exit_code == 1
+    assert error in res.output
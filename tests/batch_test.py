@@ -0,0 +1,93 @@
+import io
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+from cwltool.main import main as cwltool_main
+
+from eoap_gen.batch import expression_js
+from eoap_gen.build import build
+from eoap_gen.cache import BuildManifest
+from eoap_gen.config import WorkflowConfig
+from eoap_gen.envs import EnvPool
+from eoap_gen.serialize import dump, load
+
+CONFIG = {
+    "id": "wf",
+    "inputs": [
+        {"id": "names", "type": "string[]"},
+        {"id": "date", "type": "string", "default": "2020-01-01 00:00"},
+    ],
+    "outputs": [{"id": "files", "type": "File[]", "source": "touch/file"}],
+    "steps": [
+        {
+            "id": "touch",
+            "docker_image": "alpine:latest",
+            "command": "touch -d ${date} ${name}",
+            "scatter_batch_size": 2,
+            "scatter_batch_parallelism": 2,
+            "inputs": [
+                {"id": "name", "source": "wf/names", "scatter": True},
+                {"id": "date", "source": "wf/date"},
+            ],
+            "outputs": [
+                {"id": "file", "type": "File", "outputBinding": {"glob": "*.txt"}}
+            ],
+        }
+    ],
+}
+
+
+@pytest.mark.parametrize(
+    "expr, js",
+    [
+        ('$(self + "_resized.tif")', 'return (self + "_resized.tif");'),
+        (
+            "out_$(inputs.id).tif",
+            'return String("out_") + String((inputs.id)) + String(".tif");',
+        ),
+        ("${ return self.split('(')[0]; }", " return self.split('(')[0]; "),
+    ],
+)
+def test_expression_js(expr: str, js: str) -> None:
+    assert expression_js(expr) == js
+
+
+@pytest.mark.skipif(not shutil.which("node"), reason="needs node for expressions")
+@pytest.mark.parametrize("cwl_version", ["v1.0", "v1.2"])
+def test_batched_step_runs(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, cwl_version: str
+) -> None:
+    config = WorkflowConfig.from_dict({**CONFIG, "cwl_version": cwl_version})
+    manifest = BuildManifest.load(tmp_path)
+    env_pool = EnvPool(root=tmp_path / "cache")
+    build(config, tmp_path, "", "", manifest, env_pool, cache_dir=tmp_path / "cache")
+
+    packed = load(tmp_path / "cli" / "workflow-packed.cwl")
+    ids = [p["id"] for p in packed["$graph"]]
+    assert ids == ["touch_batch", "touch_chunk", "touch_flatten", "wf"]
+    assert [s["id"] for s in packed["$graph"][-1]["steps"]] == [
+        "touch_chunk",
+        "touch_batch",
+        "touch",
+    ]
+
+    # run without a container runtime
+    for process in packed["$graph"]:
+        process["requirements"] = [
+            r
+            for r in process.get("requirements", [])
+            if r["class"] != "DockerRequirement"
+        ]
+    dump(packed, tmp_path / "run.cwl")
+    names = ["a.txt", "b c.txt", "d'e.txt"]
+    stdout = io.StringIO()
+    monkeypatch.chdir(tmp_path)
+    argv = ["--no-container", "--quiet", "run.cwl#wf"]
+    for name in names:
+        argv += ["--names", name]
+    assert cwltool_main(argv, stdout=stdout) == 0
+
+    files = json.loads(stdout.getvalue())["files"]
+    assert [f["basename"] for f in files] == names
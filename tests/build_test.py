@@ -0,0 +1,57 @@
+from pathlib import Path
+
+import pytest
+
+from eoap_gen import build as build_module
+from eoap_gen.build import build_many
+from eoap_gen.config import WorkflowConfig
+from eoap_gen.envs import EnvPool
+
+
+def workflow(id_: str, command: str = "echo hello") -> WorkflowConfig:
+    return WorkflowConfig.from_dict(
+        {
+            "id": id_,
+            "inputs": [],
+            "outputs": [],
+            "steps": [
+                {
+                    "id": "hello",
+                    "docker_image": "alpine:latest",
+                    "command": command,
+                    "outputs": [],
+                }
+            ],
+        }
+    )
+
+
+def test_build_many_dedupes_steps(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    generated = []
+
+    def generate_step_tasks(tasks, *args, **kwargs):
+        generated.extend(tasks)
+        return original(tasks, *args, **kwargs)
+
+    original = build_module.generate_step_tasks
+    monkeypatch.setattr(build_module, "generate_step_tasks", generate_step_tasks)
+    configs = [workflow("wf1"), workflow("wf2"), workflow("wf3", "echo bye")]
+
+    errors = build_many(
+        configs,
+        tmp_path,
+        "ghcr.io/owner/repo",
+        "main",
+        EnvPool(root=tmp_path / "cache"),
+        cache_dir=tmp_path / "cache",
+    )
+
+    assert errors == {}
+    assert len(generated) == 2
+    for wf_id in ["wf1", "wf2", "wf3"]:
+        assert (tmp_path / wf_id / "cli" / "workflow-packed.cwl").exists()
+    assert (tmp_path / "wf1" / "cli" / "hello" / "hello.cwl").read_text() == (
+        tmp_path / "wf2" / "cli" / "hello" / "hello.cwl"
+    ).read_text()
@@ -0,0 +1,51 @@
+from pathlib import Path
+
+from eoap_gen.cache import BuildManifest, step_fingerprint
+from eoap_gen.config import StepConfig
+from eoap_gen.steps import generate_steps
+from eoap_gen.utils import create_output_dirs
+
+
+def script_step(script: Path) -> StepConfig:
+    return StepConfig.from_dict(
+        {
+            "id": "step",
+            "script": script,
+            "outputs": [{"id": "out", "type": "File", "outputBinding": {"glob": "*"}}],
+        }
+    )
+
+
+def test_step_fingerprint_tracks_script(tmp_path: Path) -> None:
+    script = tmp_path / "script.py"
+    script.write_text("print('a')\n")
+    key = step_fingerprint(script_step(script), "ghcr.io/owner/repo/step:main")
+
+    assert key == step_fingerprint(script_step(script), "ghcr.io/owner/repo/step:main")
+    assert key != step_fingerprint(script_step(script), "ghcr.io/owner/repo/step:dev")
+    assert key != step_fingerprint(
+        script_step(script), "ghcr.io/owner/repo/step:main", introspection="static"
+    )
+
+    script.write_text("print('b')\n")
+    assert key != step_fingerprint(script_step(script), "ghcr.io/owner/repo/step:main")
+
+
+def test_manifest_roundtrip(tmp_path: Path) -> None:
+    step = StepConfig.from_dict(
+        {"id": "step", "docker_image": "alpine", "command": "echo"}
+    )
+    create_output_dirs(tmp_path, [step.id_])
+    key = step_fingerprint(step)
+
+    manifest = BuildManifest.load(tmp_path)
+    assert not manifest.is_step_fresh(step, key, tmp_path / "cli" / step.id_)
+
+    assert not generate_steps([step], tmp_path, "ghcr.io/owner/repo", "main")
+    manifest.steps[step.id_] = key
+    manifest.save()
+
+    manifest = BuildManifest.load(tmp_path)
+    assert manifest.is_step_fresh(step, key, tmp_path / "cli" / step.id_)
+    (tmp_path / "cli" / step.id_ / f"{step.id_}.cwl").unlink()
+    assert not manifest.is_step_fresh(step, key, tmp_path / "cli" / step.id_)
@@ -0,0 +1,145 @@
+import time
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from eoap_gen.cli import generate
+from eoap_gen.config import ConfigValidationError, WorkflowConfig
+from eoap_gen.serialize import dump
+
+
+def chain(n: int) -> dict:
+    steps = [
+        {
+            "id": f"step{i}",
+            "docker_image": "alpine:latest",
+            "command": "cp ${src} out",
+            "inputs": [{"id": "src", "source": f"step{i - 1}/out" if i else "wf/src"}],
+            "outputs": [
+                {"id": "out", "type": "File", "outputBinding": {"glob": "out"}}
+            ],
+        }
+        for i in range(n)
+    ]
+    return {
+        "id": "wf",
+        "inputs": [{"id": "src", "type": "File"}],
+        "outputs": [{"id": "out", "type": "File", "source": f"step{n - 1}/out"}],
+        "steps": steps,
+    }
+
+
+def test_load_config_indexes() -> None:
+    config = WorkflowConfig.load_config("tests/data/config.yml")
+
+    step = config.steps_by_id["process"]
+    assert step.inputs_by_id["url"].scatter
+    assert step.outputs_by_id["resized"].params["type"] == "File"
+    assert not hasattr(step, "__dict__")
+
+
+def test_validate_config_reports_every_error() -> None:
+    raw = chain(2)
+    raw["steps"][0]["scatter_method"] = "dotproduct"
+    raw["steps"][0]["resources"] = {"cores_min": True}
+    raw["steps"][1]["inputs"][0]["source"] = "step0/missing"
+    raw["steps"][1]["inputs"][0]["scater"] = True
+    raw["steps"].append(raw["steps"][1])
+    raw["outputs"][0]["source"] = "step9/out"
+
+    with pytest.raises(ConfigValidationError) as e:
+        WorkflowConfig.from_dict(raw)
+
+    assert e.value.errors == [
+        "steps: id step1 is used twice.",
+        "outputs[0].source: no input or step output step9/out.",
+        "steps[0].resources.cores_min: True has the wrong type.",
+        "steps[0]: scatter_method set but no input scatters.",
+        "steps[1].inputs[0]: unknown key scater.",
+        "steps[1].inputs[0].source: no input or step output step0/missing.",
+        "steps[2].inputs[0]: unknown key scater.",
+        "steps[2].inputs[0].source: no input or step output step0/missing.",
+    ]
+
+
+def test_validate_config_reports_option_errors(tmp_path: Path) -> None:
+    raw = {**chain(2), "metrics": True}
+    raw["steps"][0]["load_listing"] = "deep_listing"
+    raw["steps"][0]["inputs"][0]["stage"] = "inplace"
+    raw["steps"][0]["outputs"].append({"id": "names", "list": "names.txt"})
+    raw["steps"][1]["inputs"][0]["scatter"] = True
+    raw["steps"][1]["scatter_batch_size"] = 0
+    raw["outputs"].append({"id": "step1_metrics", "source": "step1/out"})
+    path = tmp_path / "config.yml"
+    dump(raw, path)
+
+    res = CliRunner().invoke(
+        generate,
+        [
+            *["--config", str(path), "--output", str(tmp_path / "out")],
+            *["--docker-url-base", "ghcr.io/o/r", "--docker-tag", "main"],
+        ],
+    )
+
+    assert res.exit_code == 1
+    assert res.exception is not None and not isinstance(
+        res.exception, ConfigValidationError
+    )
+    assert res.output.splitlines()[1:] == [
+        "steps[0]: load_listing, work_reuse and network_access need cwl_version"
+        " v1.2.",
+        "steps[0].outputs[1]: list outputs need a script step.",
+        "steps[0].inputs[0].stage: inplace needs cwl_version v1.2.",
+        "outputs: id step1_metrics is steps[1]'s metrics output.",
+        "steps[1].scatter_batch_size: must be positive.",
+        "steps[1]: batched docker_image steps can't record metrics.",
+    ]
+
+
+def test_validate_config_reports_batch_conflicts() -> None:
+    raw = chain(2)
+    step = raw["steps"][1]
+    step["scatter_batch_size"] = 2
+    step["inputs"][0].update(scatter=True, stage="link")
+    step["outputs"][0]["outputBinding"]["glob"] = "$(inputs.src.basename)"
+    step["outputs"].append({"id": "names", "list": "names.txt"})
+    raw["outputs"][0]["type"] = "File[]"
+
+    with pytest.raises(ConfigValidationError) as e:
+        WorkflowConfig.from_dict(raw)
+
+    assert e.value.errors == [
+        "steps[1].outputs[1]: list outputs need a script step.",
+        "steps[1]: batched steps can't have list outputs.",
+        "steps[1]: batched steps can't stage inputs.",
+        "steps[1].outputs[0]: batched steps need outputs with a plain glob.",
+    ]
+
+
+def test_load_config_numeric_python_version(tmp_path: Path) -> None:
+    path = tmp_path / "config.yml"
+    path.write_text(
+        """
+id: wf
+outputs: []
+steps:
+  - id: step
+    script: step.py
+    python_version: 3.11
+"""
+    )
+
+    config = WorkflowConfig.load_config(path)
+
+    assert config.steps[0].python_version == "3.11"
+
+
+def test_load_large_config() -> None:
+    raw = chain(5000)
+
+    start = time.perf_counter()
+    config = WorkflowConfig.from_dict(raw)
+
+    assert time.perf_counter() - start < 1
+    assert len(config.steps_by_id) == 5000
@@ -0,0 +1,67 @@
+import json
+import shutil
+import sys
+from pathlib import Path
+from typing import Any, Callable
+
+import pytest
+
+from eoap_gen.build import build
+from eoap_gen.cache import BuildManifest
+from eoap_gen.config import WorkflowConfig
+from eoap_gen.envs import EnvPool
+from eoap_gen.execute import run_workflow
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        "--run-network",
+        action="store_true",
+        help="run the tests that download from the package index",
+    )
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    config.addinivalue_line("markers", "network: needs the package index")
+
+
+def pytest_collection_modifyitems(
+    config: pytest.Config, items: list[pytest.Item]
+) -> None:
+    if config.getoption("--run-network"):
+        return
+    skip = pytest.mark.skip(reason="needs the package index, use --run-network")
+    for item in items:
+        if "network" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def run_built(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> Callable[[WorkflowConfig, dict[str, Any]], dict[str, Any]]:
+    """
+    Build a workflow into `tmp_path` and run it on some inputs with cwltool,
+    without containers, returning the run report.
+    """
+    if not shutil.which("node"):
+        pytest.skip("needs node for expressions")
+    monkeypatch.chdir(tmp_path)
+
+    def run(config: WorkflowConfig, inputs: dict[str, Any]) -> dict[str, Any]:
+        manifest = BuildManifest.load(tmp_path)
+        env_pool = EnvPool(root=tmp_path / "cache")
+        build(
+            config, tmp_path, "", "", manifest, env_pool, cache_dir=tmp_path / "cache"
+        )
+        (tmp_path / "inputs.json").write_text(json.dumps(inputs))
+        return run_workflow(
+            config,
+            tmp_path,
+            tmp_path / "run",
+            tmp_path / "inputs.json",
+            runner=f"{sys.executable} -m cwltool --parallel --no-container",
+            python=sys.executable,
+        )
+
+    return run
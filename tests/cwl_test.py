@@ -0,0 +1,254 @@
+from pathlib import Path
+
+import pytest
+from cwl_utils.parser import save
+
+from eoap_gen.config import WorkflowConfig
+from eoap_gen.cwl import (
+    WorkflowValidationError,
+    generate_docker_cli,
+    pack_workflow,
+    validate_workflow,
+)
+from eoap_gen.serialize import dump, load
+
+TOOL = """
+cwlVersion: v1.0
+class: CommandLineTool
+baseCommand: echo
+inputs:
+  mode:
+    type:
+    - "null"
+    - type: enum
+      symbols: [near, cubic]
+outputs: []
+"""
+
+
+@pytest.mark.parametrize("output_format", ["yaml", "json"])
+def test_pack_workflow(tmp_path: Path, output_format: str) -> None:
+    config = WorkflowConfig.from_dict(
+        {
+            "id": "wf",
+            "inputs": [{"id": "mode", "type": "string"}],
+            "outputs": [],
+            "steps": [
+                {
+                    "id": "resize",
+                    "docker_image": "alpine:latest",
+                    "inputs": [{"id": "mode", "source": "wf/mode"}],
+                    "outputs": [],
+                }
+            ],
+        }
+    )
+    (tmp_path / "resize").mkdir()
+    (tmp_path / "resize" / "resize.cwl").write_text(TOOL)
+    config.set_step_run(tmp_path)
+
+    packed = pack_workflow(
+        config, tmp_path / "workflow-packed.cwl", output_format=output_format
+    )
+
+    tool, wf = packed["$graph"]
+    assert tool["id"] == "resize"
+    assert tool["inputs"][0]["type"][1] == {
+        "symbols": ["near", "cubic"],
+        "type": "enum",
+    }
+    assert wf["id"] == "wf"
+    assert wf["steps"][0]["run"] == "#resize"
+    assert wf["steps"][0]["in"][0]["source"] == "mode"
+    assert load(tmp_path / "workflow-packed.cwl") == packed
+
+
+def test_validate_workflow(tmp_path: Path) -> None:
+    packed_path = Path("tests/data/ref-out/cli/workflow-packed.cwl")
+    packed = load(packed_path)
+
+    validate_workflow(packed, packed_path, tmp_path)
+    assert len(list((tmp_path / "validated").iterdir())) == 1
+
+    packed["$graph"][-1]["steps"][0]["in"][0]["source"] = "missing"
+    broken_path = tmp_path / "workflow-packed.cwl"
+    dump(packed, broken_path)
+
+    with pytest.raises(WorkflowValidationError) as e:
+        validate_workflow(packed, broken_path, tmp_path)
+    assert len(e.value.errors) == 1
+    assert "'missing'" in e.value.errors[0]
+
+
+def test_step_resources(tmp_path: Path) -> None:
+    config = WorkflowConfig.from_dict(
+        {
+            "id": "wf",
+            "resources": {"cores_min": 1, "ram_min": 1024},
+            "inputs": [],
+            "outputs": [],
+            "steps": [
+                {
+                    "id": "light",
+                    "docker_image": "alpine:latest",
+                    "command": "echo",
+                    "outputs": [],
+                },
+                {
+                    "id": "heavy",
+                    "docker_image": "alpine:latest",
+                    "command": "echo",
+                    "outputs": [],
+                    "resources": {"cores_min": 4, "tmpdir_min": 2048, "hint": True},
+                },
+            ],
+        }
+    )
+    config.set_step_run(tmp_path)
+    for step in config.steps:
+        generate_docker_cli(step, tmp_path)
+
+    light = load(tmp_path / "light.cwl")
+    assert light["requirements"][-1] == {
+        "class": "ResourceRequirement",
+        "coresMin": 1,
+        "ramMin": 1024,
+    }
+    heavy = load(tmp_path / "heavy.cwl")
+    assert len(heavy["requirements"]) == 2
+    assert heavy["hints"] == [
+        {
+            "class": "ResourceRequirement",
+            "coresMin": 4,
+            "ramMin": 1024,
+            "tmpdirMin": 2048,
+        }
+    ]
+    assert "ResourceRequirement" not in str(save(config.to_cwl()))
+
+
+def test_cwl_v1_2_runtime_controls(tmp_path: Path) -> None:
+    raw = {
+        "id": "wf",
+        "cwl_version": "v1.2",
+        "inputs": [],
+        "outputs": [],
+        "steps": [
+            {
+                "id": "list",
+                "docker_image": "alpine:latest",
+                "command": "ls",
+                "outputs": [],
+                "load_listing": "no_listing",
+                "work_reuse": False,
+                "network_access": False,
+            },
+            {
+                "id": "fetch",
+                "docker_image": "alpine:latest",
+                "command": "wget",
+                "outputs": [],
+            },
+        ],
+    }
+    config = WorkflowConfig.from_dict(raw)
+    config.set_step_run(tmp_path)
+    for step in config.steps:
+        step.run.parent.mkdir()
+        generate_docker_cli(step, step.run.parent)
+
+    listing = load(tmp_path / "list" / "list.cwl")
+    assert listing["cwlVersion"] == "v1.2"
+    assert listing["requirements"][-2:] == [
+        {"class": "LoadListingRequirement", "loadListing": "no_listing"},
+        {"class": "NetworkAccess", "networkAccess": False},
+    ]
+    assert listing["hints"] == [{"class": "WorkReuse", "enableReuse": False}]
+    # network access is kept like in v1.0 unless turned off
+    assert load(tmp_path / "fetch" / "fetch.cwl")["requirements"][-1] == {
+        "class": "NetworkAccess",
+        "networkAccess": True,
+    }
+    packed = pack_workflow(config, tmp_path / "packed.cwl")
+    assert packed["cwlVersion"] == "v1.2"
+    validate_workflow(packed, tmp_path / "packed.cwl", tmp_path / "cache")
+
+    with pytest.raises(ValueError, match="need cwl_version v1.2"):
+        WorkflowConfig.from_dict({**raw, "cwl_version": "v1.0"})
+
+
+@pytest.mark.parametrize(
+    "cwl_version, stage, entry",
+    [
+        ("v1.0", "link", "$(inputs.files)"),
+        ("v1.2", "link", {"entry": "$(inputs.files)", "writable": False}),
+        ("v1.2", "inplace", {"entry": "$(inputs.files)", "writable": True}),
+    ],
+)
+def test_staging(
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture,
+    cwl_version: str,
+    stage: str,
+    entry: object,
+) -> None:
+    raw = {
+        "id": "wf",
+        "cwl_version": cwl_version,
+        "inputs": [{"id": "files", "type": "File[]"}],
+        "outputs": [{"id": "stac", "type": "Directory", "source": "stac/stac"}],
+        "steps": [
+            {
+                "id": "stac",
+                "docker_image": "alpine:latest",
+                "command": "make-stac ${files}",
+                "inputs": [
+                    {
+                        "id": "files",
+                        "source": "wf/files",
+                        "type": "File[]",
+                        "stage": stage,
+                    }
+                ],
+                "outputs": [
+                    {
+                        "id": "stac",
+                        "type": "Directory",
+                        "outputBinding": {"glob": "."},
+                    }
+                ],
+            },
+        ],
+    }
+    config = WorkflowConfig.from_dict(raw)
+    config.set_step_run(tmp_path)
+    step = config.steps[0]
+    step.run.parent.mkdir()
+    generate_docker_cli(step, step.run.parent)
+
+    tool = load(tmp_path / "stac" / "stac.cwl")
+    requirements = {r["class"]: r for r in tool["requirements"]}
+    assert requirements["InitialWorkDirRequirement"]["listing"] == [entry]
+    assert ("InplaceUpdateRequirement" in requirements) == (stage == "inplace")
+    assert "output stac globs the whole work dir" in capsys.readouterr().err
+    packed = pack_workflow(config, tmp_path / "packed.cwl")
+    validate_workflow(packed, tmp_path / "packed.cwl", tmp_path / "cache")
+
+
+def test_staging_inplace_needs_v1_2() -> None:
+    with pytest.raises(ValueError, match="stage: inplace needs cwl_version v1.2"):
+        WorkflowConfig.from_dict(
+            {
+                "id": "wf",
+                "outputs": [],
+                "steps": [
+                    {
+                        "id": "update",
+                        "docker_image": "alpine:latest",
+                        "command": "update ${file}",
+                        "inputs": [{"id": "file", "stage": "inplace"}],
+                        "outputs": [],
+                    }
+                ],
+            }
+        )
@@ -0,0 +1,133 @@
+import json
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from eoap_gen.cli import generate
+from eoap_gen.config import StepConfig, WorkflowConfig
+from eoap_gen.dockerfile import (
+    generate_dockerfile,
+    generate_shared_dockerfiles,
+    shared_image_name,
+)
+
+
+def test_generate_buildkit_dockerfile(tmp_path: Path) -> None:
+    step = StepConfig.from_dict(
+        {
+            "id": "get_urls",
+            "script": "tests/data/get_urls.py",
+            "requirements": "tests/data/get_urls_reqs.txt",
+            "apt_install": ["gdal-bin"],
+            "conda": ["eo-tools"],
+            "base_image_digest": "sha256:0123",
+            "outputs": [],
+        }
+    )
+
+    generate_dockerfile(step, tmp_path, buildkit=True)
+
+    lines = (tmp_path / "get_urls.Dockerfile").read_text().splitlines()
+    assert lines[:2] == [
+        "# syntax=docker/dockerfile:1",
+        "FROM mambaorg/micromamba@sha256:0123",
+    ]
+    mounts = [line for line in lines if "--mount=type=cache" in line]
+    assert [m.split(",")[1] for m in mounts] == [
+        "target=/var/cache/apt",
+        "target=/var/lib/apt",
+        "target=/opt/conda/pkgs",
+        "target=/home/mambauser/.cache/pip",
+    ]
+    # dependencies are installed before the script is copied
+    assert lines.index("COPY get_urls.py app.py") > max(map(lines.index, mounts))
+
+
+def script_step(id_: str, requirements: str) -> StepConfig:
+    return StepConfig.from_dict(
+        {
+            "id": id_,
+            "script": "tests/data/make_stac.py",
+            "requirements": requirements,
+            "outputs": [],
+        }
+    )
+
+
+def test_generate_shared_dockerfiles(tmp_path: Path) -> None:
+    (tmp_path / "env-stale").mkdir()
+    steps = [
+        script_step("a", "tests/data/make_stac_reqs.txt"),
+        script_step("b", "tests/data/get_urls_reqs.txt"),
+        script_step("c", "tests/data/make_stac_reqs.txt"),
+    ]
+
+    images = generate_shared_dockerfiles(steps, tmp_path)
+
+    assert images == sorted({shared_image_name(s) for s in steps})
+    assert len(images) == 2
+    assert not (tmp_path / "env-stale").exists()
+    image = shared_image_name(steps[0])
+    assert sorted(p.name for p in (tmp_path / image).iterdir()) == [
+        "a.py",
+        "c.py",
+        f"{image}.Dockerfile",
+    ]
+    dockerfile = (tmp_path / image / f"{image}.Dockerfile").read_text()
+    assert "COPY a.py a.py\nCOPY c.py c.py\n" in dockerfile
+
+
+def test_generate_shared_images(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("GITHUB_OUTPUT", str(tmp_path / "gh_output"))
+    output_path = tmp_path / "out"
+    result = CliRunner().invoke(
+        generate,
+        [
+            "--config=tests/data/config.yml",
+            f"--output={output_path}",
+            "--docker-url-base=ghcr.io/owner/repo",
+            "--docker-tag=main",
+            "--shared-images",
+        ],
+    )
+
+    assert result.exit_code == 0, result.output
+    config = WorkflowConfig.load_config("tests/data/config.yml")
+    images = [shared_image_name(s) for s in config.steps if s.script]
+    gh_output = (tmp_path / "gh_output").read_text().splitlines()
+    assert json.loads(gh_output[1]) == sorted(images)
+    packed = (output_path / "cli" / "workflow-packed.cwl").read_text()
+    for image in images:
+        assert f"ghcr.io/owner/repo/{image}:main" in packed
+    assert "/app/get_urls.py" in packed
+    assert not (output_path / "cli" / "get_urls" / "get_urls.Dockerfile").exists()
+
+
+def test_generate_locked_dockerfile(tmp_path: Path) -> None:
+    step = StepConfig.from_dict(
+        {
+            "id": "make_stac",
+            "script": "tests/data/make_stac.py",
+            "requirements": "tests/data/make_stac_reqs.txt",
+            "python_version": "3.11",
+            "outputs": [],
+        }
+    )
+
+    generate_dockerfile(step, tmp_path, buildkit=True, locked=True)
+
+    content = (tmp_path / "make_stac.Dockerfile").read_text()
+    assert "FROM python:3.11-slim\n" in content
+    assert "COPY requirements.lock .\n" in content
+    assert "--mount=type=bind,source=wheels,target=/wheels" in content
+    assert "--no-index --find-links /wheels" in content
+    assert "make_stac_reqs" not in content
+
+    generate_dockerfile(step, tmp_path, locked=True)
+
+    content = (tmp_path / "make_stac.Dockerfile").read_text()
+    assert "COPY wheels /wheels\n" in content
+    assert "--no-index --find-links /wheels" in content
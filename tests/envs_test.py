@@ -0,0 +1,105 @@
+import fcntl
+import json
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+import eoap_gen.envs
+from eoap_gen.envs import READY_MARKER, EnvPool, EnvSpec
+
+
+def fake_env(pool: EnvPool, name: str, size: int, last_used: float) -> Path:
+    path = pool.envs_dir / name
+    path.mkdir(parents=True)
+    (path / "payload").write_bytes(b"0" * size)
+    marker = path / READY_MARKER
+    marker.write_text(json.dumps({"key": name}))
+    os.utime(marker, (last_used, last_used))
+    return path
+
+
+def test_env_spec_key() -> None:
+    spec = EnvSpec("3.11", ["gdal", "eo-tools"], ["click", "pystac", ""])
+
+    assert spec.key == EnvSpec("3.11", ["eo-tools", "gdal"], ["pystac", "click"]).key
+    assert spec.base_key == EnvSpec("3.11", ["gdal", "eo-tools"], ["click"]).base_key
+    assert spec.key != EnvSpec("3.11", ["gdal", "eo-tools"], ["click"]).key
+    assert spec.base_key != EnvSpec("3.12", ["gdal", "eo-tools"]).base_key
+
+
+def test_env_pool_evicts_least_recently_used(tmp_path: Path) -> None:
+    pool = EnvPool(root=tmp_path, max_size=2500)
+    oldest = fake_env(pool, "oldest", 1000, 100)
+    newest = fake_env(pool, "newest", 1000, 300)
+    middle = fake_env(pool, "middle", 1000, 200)
+
+    assert pool.evict() == [oldest]
+    assert not oldest.exists()
+    assert newest.exists() and middle.exists()
+
+
+def test_env_pool_reuses_ready_env(tmp_path: Path) -> None:
+    pool = EnvPool(root=tmp_path)
+    spec = EnvSpec(requirements=["click"])
+    path = fake_env(pool, spec.key, 10, 100)
+
+    with pool.acquire(spec) as env_path:
+        assert env_path == path
+        # in use environments are never evicted
+        pool.max_size = 0
+        assert pool.evict() == []
+    assert (path / READY_MARKER).stat().st_mtime > 100
+
+
+def test_env_pool_rebuilds_env_evicted_between_locks(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    pool = EnvPool(root=tmp_path)
+    spec = EnvSpec(requirements=["click"])
+    path = fake_env(pool, spec.key, 10, 100)
+    builds = []
+    lock = pool._lock
+
+    def evicting_lock(key: str, mode: int):
+        if mode == fcntl.LOCK_SH and not builds:
+            # another process evicts it once the exclusive lock is released
+            shutil.rmtree(path)
+        return lock(key, mode)
+
+    monkeypatch.setattr(pool, "_lock", evicting_lock)
+
+    def build(spec: EnvSpec, env_path: Path) -> None:
+        builds.append(env_path)
+        fake_env(pool, spec.key, 10, 100)
+
+    monkeypatch.setattr(pool, "_build", build)
+
+    with pool.acquire(spec) as env_path:
+        assert env_path == path
+        assert (path / READY_MARKER).exists()
+    assert builds == [path]
+
+
+def test_env_pool_creates_and_installs_separately(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    pool = EnvPool(root=tmp_path)
+    spec = EnvSpec(requirements=["click"])
+    runs = []
+
+    def run(cmd: str, name: str, **kwargs) -> subprocess.CompletedProcess:
+        runs.append((name, cmd))
+        (pool.envs_dir / spec.key).mkdir(exist_ok=True)
+        return subprocess.CompletedProcess(cmd, 0, b"", b"")
+
+    monkeypatch.setattr(eoap_gen.envs, "run", run)
+
+    with pool.acquire(spec):
+        pass
+    (create, create_cmd), (install, install_cmd) = runs
+    assert (create, install) == ("env create", "env install")
+    assert "python -m venv" in create_cmd and "pip" not in create_cmd
+    assert "pip install argparse2tool  click" in install_cmd
@@ -0,0 +1,57 @@
+from pathlib import Path
+
+from eoap_gen.config import WorkflowConfig
+from eoap_gen.execute import localize
+
+CONFIG = {
+    "id": "wf",
+    "inputs": [{"id": "names", "type": "string[]"}],
+    "outputs": [{"id": "files", "type": "File[]", "source": "write/file"}],
+    "steps": [
+        {
+            "id": "write",
+            "docker_image": "alpine:latest",
+            "command": "cp ${name} ${dest}",
+            "inputs": [
+                {"id": "name", "source": "wf/names", "scatter": True},
+                {"id": "dest", "default": "."},
+            ],
+            "outputs": [{"id": "file", "type": "File", "outputBinding": {"glob": "*"}}],
+        }
+    ],
+}
+
+
+def test_localize() -> None:
+    tool = {
+        "baseCommand": [
+            "/usr/local/bin/_entrypoint.sh",
+            "env",
+            "HOME=/tmp",
+            "python",
+            "/app/app.py",
+        ],
+        "entry": 'var base = ["python", "/app/step.py"];',
+    }
+
+    assert localize(tool, "/src/step.py", "/venv/bin/python") == {
+        "baseCommand": ["/venv/bin/python", "/src/step.py"],
+        "entry": 'var base = ["/venv/bin/python", "/src/step.py"];',
+    }
+
+
+def test_run_workflow(tmp_path: Path, run_built) -> None:
+    names = [tmp_path / name for name in ["a", "b", "c"]]
+    for name in names:
+        name.write_bytes(b"0" * 1000)
+
+    report = run_built(
+        WorkflowConfig.from_dict(CONFIG), {"names": list(map(str, names))}
+    )
+
+    assert report["returncode"] == 0
+    assert len(report["outputs"]["files"]) == 3
+    step = report["steps"]["write"]
+    assert step["jobs"] == 3 and step["failed"] == 0
+    assert step["input_bytes"] == step["output_bytes"] == 3000
+    assert [j["step"] for j in report["jobs"]] == ["write"] * 3
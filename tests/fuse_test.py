@@ -0,0 +1,172 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from eoap_gen.config import ConfigValidationError, WorkflowConfig
+
+PREPARE = """import click
+
+
+@click.command()
+@click.option("--name")
+def main(name):
+    with open("prepared.txt", "w") as f:
+        f.write(name.upper())
+
+
+if __name__ == "__main__":
+    main()
+"""
+
+REPORT = """import click
+
+
+@click.command()
+@click.option("--src", type=click.File())
+@click.option("--suffix")
+def main(src, suffix):
+    with open("report.txt", "w") as f:
+        f.write(src.read() + suffix)
+
+
+if __name__ == "__main__":
+    main()
+"""
+
+
+def config(tmp_path: Path, **kwargs) -> dict:
+    return {
+        "id": "wf",
+        "inputs": [{"id": "name"}, {"id": "suffix"}],
+        "outputs": [{"id": "final", "type": "File", "source": "report/report"}],
+        "steps": [
+            {
+                "id": "prepare",
+                "script": str(tmp_path / "prepare.py"),
+                "inputs": [{"id": "name", "source": "wf/name"}],
+                "outputs": [
+                    {
+                        "id": "prepared",
+                        "type": "File",
+                        "outputBinding": {"glob": "prepared.txt"},
+                    }
+                ],
+            },
+            {
+                "id": "report",
+                "script": str(tmp_path / "report.py"),
+                "inputs": [
+                    {"id": "src", "source": "prepare/prepared"},
+                    {"id": "suffix", "source": "wf/suffix"},
+                ],
+                "outputs": [
+                    {
+                        "id": "report",
+                        "type": "File",
+                        "outputBinding": {"glob": "report.txt"},
+                    }
+                ],
+                **kwargs,
+            },
+        ],
+    }
+
+
+def test_fuse_steps(tmp_path: Path) -> None:
+    raw = config(tmp_path)
+    assert len(WorkflowConfig.from_dict(raw).steps) == 2
+
+    wf = WorkflowConfig.from_dict({**raw, "fuse": True})
+    (step,) = wf.steps
+    assert step.id_ == "report"
+    assert [s.id_ for s in step.fused or []] == ["prepare", "report"]
+    assert [(i.id_, i.source) for i in step.inputs] == [
+        ("prepare_name", "wf/name"),
+        ("report_suffix", "wf/suffix"),
+    ]
+
+    assert (
+        len(
+            WorkflowConfig.from_dict(
+                {**config(tmp_path, fuse=False), "fuse": True}
+            ).steps
+        )
+        == 2
+    )
+
+    raw = config(tmp_path, fuse=True)
+    raw["outputs"].append(
+        {"id": "prepared", "type": "File", "source": "prepare/prepared"}
+    )
+    with pytest.raises(ValueError, match="used by other steps or the workflow"):
+        WorkflowConfig.from_dict(raw)
+
+    raw = config(tmp_path, fuse=True, resources={"ram_min": 512, "outdir_min": 100})
+    raw["steps"][0]["resources"] = {"ram_min": 1024, "outdir_min": 50, "hint": True}
+    resources = WorkflowConfig.from_dict(raw).steps[0].resources
+    assert (resources.ram_min, resources.outdir_min) == (1024, 150)
+    assert not resources.hint
+    raw["steps"][1]["resources"]["hint"] = True
+    assert WorkflowConfig.from_dict(raw).steps[0].resources.hint
+    raw["resources"] = {"hint": True}
+    raw["steps"][1]["resources"]["hint"] = False
+    assert not WorkflowConfig.from_dict(raw).steps[0].resources.hint
+
+    # the workflow's defaults count once, not once per fused step
+    raw = config(tmp_path, fuse=True)
+    raw["resources"] = {"cores_min": 2, "tmpdir_min": 1000, "outdir_min": 200}
+    raw["steps"][0]["resources"] = {"outdir_min": 50, "tmpdir_min": 300}
+    raw["steps"][1]["resources"] = {"outdir_min": 70}
+    (step,) = WorkflowConfig.from_dict(raw).steps
+    resources = step.resources
+    assert (resources.cores_min, resources.tmpdir_min) == (2, 300)
+    assert resources.outdir_min == 120
+    assert step.fused is not None and step.fused[1].resources.tmpdir_min == 1000
+    del raw["steps"][0]["resources"]
+    del raw["steps"][1]["resources"]
+    resources = WorkflowConfig.from_dict(raw).steps[0].resources
+    assert (resources.tmpdir_min, resources.outdir_min) == (1000, 200)
+
+    with pytest.raises(ConfigValidationError) as e:
+        WorkflowConfig.from_dict(config(tmp_path, fuse=True, python_version="3.11"))
+    assert e.value.errors == [
+        "steps[1].fuse: can't be fused, prepare and report need different "
+        "environments."
+    ]
+
+
+def test_run_fused_steps(tmp_path: Path, run_built) -> None:
+    (tmp_path / "prepare.py").write_text(PREPARE)
+    (tmp_path / "report.py").write_text(REPORT)
+
+    report = run_built(
+        WorkflowConfig.from_dict(config(tmp_path, fuse=True)),
+        {"name": "abc", "suffix": "!"},
+    )
+
+    assert report["returncode"] == 0
+    assert Path(report["outputs"]["final"]["path"]).read_text() == "ABC!"
+    assert [j["step"] for j in report["jobs"]] == ["report"]
+    assert (tmp_path / "cli" / "report" / "report.Dockerfile").read_text().count(
+        "COPY"
+    ) == 3
+
+
+def test_run_fused_steps_with_metrics(tmp_path: Path, run_built) -> None:
+    (tmp_path / "prepare.py").write_text(PREPARE)
+    (tmp_path / "report.py").write_text(REPORT)
+
+    report = run_built(
+        WorkflowConfig.from_dict({**config(tmp_path, fuse=True), "metrics": True}),
+        {"name": "abc", "suffix": "!"},
+    )
+
+    assert report["returncode"] == 0
+    metrics = json.loads(Path(report["outputs"]["report_metrics"]["path"]).read_text())
+    steps = metrics["steps"]
+    assert list(steps) == ["prepare", "report"]
+    # sampled in the scripts, not the driver running them
+    assert metrics["samples"] == sum(s["samples"] for s in steps.values()) > 0
+    assert metrics["user_s"] == round(sum(s["user_s"] for s in steps.values()), 3)
+    assert all("fused.py" not in f["file"] for f in metrics["hot_functions"])
@@ -1,12 +1,21 @@
 import filecmp
+import os
 from pathlib import Path
 
+import pytest
 from click.testing import CliRunner
 
-from eoap_gen.cli import generate
+from eoap_gen import build as build_module
+from eoap_gen import cli as cli_module
+from eoap_gen.build import build
+from eoap_gen.cache import BuildManifest
+from eoap_gen.cli import generate, watch
+from eoap_gen.config import WorkflowConfig
+from eoap_gen.envs import EnvPool
+from eoap_gen.serialize import dump
 
 
-def test_generate_output() -> None:
+def test_generate_output(tmp_path: Path) -> None:
     """
     Test the generate function and compare its output with a reference directory.
     """
@@ -15,7 +24,7 @@ def test_generate_output() -> None:
     reference_output_path = Path("tests/data/ref-out")
 
     config_path = Path("tests/data/config.yml")
-    output_path = Path("tests/output")
+    output_path = tmp_path / "output"
     docker_url_base = "ghcr.io/figi44/eoap"
     docker_tag = "main"
 
@@ -47,3 +56,80 @@ def test_generate_output() -> None:
 
     assert result.exit_code == 0
     assert not diff_files, f"The following files differ: {', '.join(diff_files)}"
+
+
+def test_build_metadata_change_skips_steps(tmp_path: Path) -> None:
+    config = WorkflowConfig.from_dict(
+        {
+            "id": "wf",
+            "doc": "first",
+            "inputs": [],
+            "outputs": [],
+            "steps": [
+                {
+                    "id": "hello",
+                    "docker_image": "alpine:latest",
+                    "command": "echo hello",
+                    "outputs": [],
+                }
+            ],
+        }
+    )
+    manifest = BuildManifest.load(tmp_path)
+    env_pool = EnvPool(root=tmp_path / "cache")
+    tools = {}
+    args = (tmp_path, "ghcr.io/owner/repo", "main", manifest, env_pool)
+
+    build(config, *args, cache_dir=tmp_path / "cache", tools=tools)
+    tool = tools["hello"]
+    tool_mtime = (tmp_path / "cli" / "hello" / "hello.cwl").stat().st_mtime_ns
+    config.doc = "second"
+    build(config, *args, cache_dir=tmp_path / "cache", tools=tools)
+
+    assert tools["hello"] is tool
+    assert (tmp_path / "cli" / "hello" / "hello.cwl").stat().st_mtime_ns == tool_mtime
+    assert "second" in (tmp_path / "cli" / "workflow-packed.cwl").read_text()
+
+
+def test_watch_retries_broken_config(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    config_path = tmp_path / "config.yml"
+    script = tmp_path / "step.py"
+    script.write_text("print('a')\n")
+    step = {"id": "step", "script": str(script), "outputs": []}
+    dump({"id": "wf", "doc": "first", "outputs": [], "steps": [step]}, config_path)
+
+    def touch(path: Path, text: str) -> None:
+        path.write_text(text)
+        mtime = path.stat().st_mtime_ns + 10**9
+        os.utime(path, ns=(mtime, mtime))
+
+    # each sleep of the watch loop makes the next change
+    changes = [
+        lambda: touch(config_path, "id: [wf\n"),
+        lambda: touch(script, "print('b')\n"),
+    ]
+
+    def sleep(_: float) -> None:
+        if not changes:
+            raise KeyboardInterrupt
+        changes.pop(0)()
+
+    builds = []
+    monkeypatch.setattr(
+        build_module, "build", lambda config, *args, **kwargs: builds.append(config.doc)
+    )
+    monkeypatch.setattr(cli_module.time, "sleep", sleep)
+
+    res = CliRunner(mix_stderr=False).invoke(
+        watch,
+        [
+            *["--config", str(config_path), "--output", str(tmp_path / "out")],
+            *["--docker-url-base", "ghcr.io/o/r", "--docker-tag", "main"],
+        ],
+    )
+
+    assert res.exit_code == 0
+    assert builds == ["first"]
+    assert res.stderr.count("Generating failed") == 2
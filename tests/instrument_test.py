@@ -0,0 +1,105 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from eoap_gen.config import ConfigValidationError, WorkflowConfig
+
+BUSY = """import click
+
+
+def busy(n):
+    total = 0
+    for i in range(n):
+        total += i * i
+    return total
+
+
+@click.command()
+@click.option("--n", type=int)
+def main(n):
+    with open("busy.txt", "w") as f:
+        f.write(str(busy(n)))
+
+
+if __name__ == "__main__":
+    main()
+"""
+
+
+def config(tmp_path: Path) -> dict:
+    return {
+        "id": "wf",
+        "metrics": True,
+        "inputs": [{"id": "n", "type": "int"}, {"id": "file_name"}],
+        "outputs": [{"id": "busy", "type": "File", "source": "busy/busy"}],
+        "steps": [
+            {
+                "id": "busy",
+                "script": str(tmp_path / "busy.py"),
+                "inputs": [{"id": "n", "source": "wf/n"}],
+                "outputs": [
+                    {
+                        "id": "busy",
+                        "type": "File",
+                        "outputBinding": {"glob": "busy.txt"},
+                    }
+                ],
+            },
+            {
+                "id": "touch",
+                "docker_image": "alpine",
+                "command": "touch ${file_name}",
+                "inputs": [{"id": "file_name", "source": "wf/file_name"}],
+                "outputs": [
+                    {
+                        "id": "touched",
+                        "type": "File",
+                        "outputBinding": {"glob": "$(inputs.file_name)"},
+                    }
+                ],
+            },
+        ],
+    }
+
+
+def test_metrics_outputs(tmp_path: Path) -> None:
+    wf = WorkflowConfig.from_dict(config(tmp_path))
+    for step in wf.steps:
+        assert step.metrics
+        assert step.outputs_by_id["metrics"].params["outputBinding"] == {
+            "glob": "metrics.json"
+        }
+    assert [(o.id_, o.source, o.type_) for o in wf.outputs[1:]] == [
+        ("busy_metrics", ["busy/metrics"], "File"),
+        ("touch_metrics", ["touch/metrics"], "File"),
+    ]
+
+    raw = config(tmp_path)
+    raw["steps"][0]["outputs"][0]["id"] = "metrics"
+    raw["outputs"][0]["source"] = "busy/metrics"
+    with pytest.raises(ConfigValidationError, match="is the step.s metrics output"):
+        WorkflowConfig.from_dict(raw)
+
+
+def test_run_with_metrics(tmp_path: Path, run_built) -> None:
+    (tmp_path / "busy.py").write_text(BUSY)
+
+    report = run_built(
+        WorkflowConfig.from_dict(config(tmp_path)),
+        {"n": 3_000_000, "file_name": "touched.txt"},
+    )
+
+    assert report["returncode"] == 0
+    busy = json.loads(Path(report["outputs"]["busy_metrics"]["path"]).read_text())
+    assert busy["returncode"] == 0
+    assert busy["user_s"] > 0 and busy["max_rss_kb"] > 0
+    assert busy["hot_functions"][0]["function"] == "busy"
+    touch = json.loads(Path(report["outputs"]["touch_metrics"]["path"]).read_text())
+    assert touch["returncode"] == 0 and touch["wall_s"] >= 0
+    # the same keys as script steps, without the ones only python can sample
+    assert set(busy) - set(touch) == {"samples", "hot_functions"}
+    assert (
+        "COPY instrument.py /opt/eoap-gen/instrument.py"
+        in (tmp_path / "cli" / "busy" / "busy.Dockerfile").read_text()
+    )
@@ -0,0 +1,101 @@
+from pathlib import Path
+
+import pytest
+
+from eoap_gen.introspect import StaticIntrospectionError, introspect_script
+
+ARGPARSE_SCRIPT = """
+import argparse
+
+parser = argparse.ArgumentParser(description="Resize: a file")
+parser.add_argument("input", help="input file")
+parser.add_argument("-s", "--size", type=int, default=5)
+parser.add_argument("--fast", action="store_true")
+parser.add_argument("--bands", nargs="+", type=float)
+parser.add_argument("--method", choices=["near", "cubic"])
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+"""
+
+
+def test_introspect_click_script() -> None:
+    tool = introspect_script(
+        Path("tests/data/get_urls.py"),
+        Path("tests/data/ref-out/cli/get_urls/tool_out.yml"),
+    )
+
+    assert tool["baseCommand"] == ["get_urls.py"]
+    assert tool["doc"] == "None\n"
+    assert tool["inputs"] == {
+        "catalog": {
+            "type": ["null", "string"],
+            "inputBinding": {"prefix": "--catalog"},
+        },
+        "collection": {
+            "type": ["null", "string"],
+            "inputBinding": {"prefix": "--collection"},
+        },
+    }
+    assert list(tool["outputs"]) == ["urls", "ids"]
+
+
+def test_introspect_click_argument() -> None:
+    tool = introspect_script(Path("tests/data/make_stac.py"))
+
+    assert tool["inputs"] == {"files": {"type": ["null", "string"], "doc": "FILES"}}
+    assert tool["outputs"] == []
+
+
+def test_introspect_argparse_script(tmp_path: Path) -> None:
+    script = tmp_path / "resize.py"
+    script.write_text(ARGPARSE_SCRIPT)
+
+    tool = introspect_script(script)
+
+    assert tool["doc"] == "Resize: a file\n"
+    assert tool["inputs"] == {
+        "input": {
+            "type": "string",
+            "doc": "input file",
+            "inputBinding": {"position": 1},
+        },
+        "size": {
+            "type": ["null", "int"],
+            "default": 5,
+            "inputBinding": {"prefix": "--size"},
+        },
+        "fast": {
+            "type": ["null", "boolean"],
+            "default": False,
+            "inputBinding": {"prefix": "--fast"},
+        },
+        "bands": {
+            "type": ["null", {"type": "array", "items": "float"}],
+            "inputBinding": {"prefix": "--bands"},
+        },
+        "method": {
+            "type": ["null", {"type": "enum", "symbols": ["near", "cubic"]}],
+            "inputBinding": {"prefix": "--method"},
+        },
+    }
+
+
+@pytest.mark.parametrize(
+    "script",
+    [
+        "import click\n\n@click.group()\ndef cli():\n    pass\n",
+        "import argparse\n\np = argparse.ArgumentParser()\np.add_subparsers()\n",
+        "import click\n\n@click.command()\n@click.option('--x', type=MyType())\n"
+        "def main(x):\n    pass\n",
+        "import argparse\n\np = argparse.ArgumentParser()\n"
+        "for name in NAMES:\n    p.add_argument(name)\n",
+        "print('no cli')\n",
+    ],
+)
+def test_introspect_unresolvable(tmp_path: Path, script: str) -> None:
+    path = tmp_path / "script.py"
+    path.write_text(script)
+
+    with pytest.raises(StaticIntrospectionError):
+        introspect_script(path)
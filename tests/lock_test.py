@@ -0,0 +1,44 @@
+from pathlib import Path
+
+import pytest
+
+from eoap_gen.config import StepConfig
+from eoap_gen.envs import EnvPool
+from eoap_gen.lock import lock_requirements
+
+
+@pytest.mark.network
+def test_lock_requirements(tmp_path: Path) -> None:
+    step = StepConfig.from_dict(
+        {
+            "id": "make_stac",
+            "script": "tests/data/make_stac.py",
+            "requirements": "tests/data/make_stac_reqs.txt",
+            "outputs": [],
+        }
+    )
+    env_pool = EnvPool(root=tmp_path / "cache")
+
+    lock_path = lock_requirements(step, tmp_path, env_pool)
+
+    lines = lock_path.read_text().splitlines()
+    pins = [line for line in lines if not line.startswith("#")]
+    names = {line.split("==")[0] for line in pins}
+    assert {"click", "pystac"} <= names
+    assert all(" --hash=sha256:" in line for line in pins)
+    wheels = {
+        p.name.split("-")[0].lower().replace("_", "-")
+        for p in env_pool.wheelhouse.glob("*.whl")
+    }
+    assert names <= wheels
+    # the image's wheels, in the step's build context
+    image_wheels = {
+        p.name.split("-")[0].lower().replace("_", "-")
+        for p in (tmp_path / "wheels").glob("*.whl")
+    }
+    assert image_wheels == names
+
+    # an up to date lock is kept as it is
+    mtime = lock_path.stat().st_mtime_ns
+    assert lock_requirements(step, tmp_path, env_pool) == lock_path
+    assert lock_path.stat().st_mtime_ns == mtime
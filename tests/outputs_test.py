@@ -0,0 +1,131 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from eoap_gen.config import StepConfig, StepOutputConfig, WorkflowConfig, cwl_parser
+from eoap_gen.cwl import load_cwl
+from eoap_gen.outputs import LIST_WRAPPER, wrap_list_outputs
+from eoap_gen.serialize import dump, load
+
+SCRIPT = """import click
+
+
+@click.command()
+@click.option("--count", type=int)
+def main(count):
+    with open("names.txt", "w") as f:
+        print(*(f"name-{i}" for i in range(count)), file=f, sep="\\n")
+
+
+if __name__ == "__main__":
+    main()
+"""
+
+
+def config(script: Path) -> dict:
+    return {
+        "id": "wf",
+        "inputs": [{"id": "count", "type": "int"}],
+        "outputs": [
+            {"id": "names", "type": "string[]", "source": "list/names"},
+            {"id": "files", "type": "File[]", "source": "write/file"},
+        ],
+        "steps": [
+            {
+                "id": "list",
+                "script": str(script),
+                "inputs": [{"id": "count", "source": "wf/count"}],
+                "outputs": [{"id": "names", "list": "names.txt"}],
+            },
+            {
+                "id": "write",
+                "docker_image": "alpine:latest",
+                "command": "touch ${name}",
+                "inputs": [{"id": "name", "source": "list/names"}],
+                "outputs": [
+                    {"id": "file", "type": "File", "outputBinding": {"glob": "*"}}
+                ],
+            },
+        ],
+    }
+
+
+def test_list_inputs_scattered(tmp_path: Path) -> None:
+    raw = config(tmp_path / "list.py")
+    wf = WorkflowConfig.from_dict(raw)
+    assert wf.steps[0].outputs[0].params == {"type": "string[]"}
+    assert wf.steps[1].scatter_ids == ["name"]
+
+    raw["steps"][1]["inputs"][0]["scatter"] = False
+    assert not WorkflowConfig.from_dict(raw).steps[1].scatter_ids
+
+    del raw["steps"][0]["script"]
+    raw["steps"][0].update(docker_image="alpine:latest", command="ls")
+    with pytest.raises(ValueError, match="need a script step"):
+        WorkflowConfig.from_dict(raw)
+
+
+def test_list_outputs_wrapper(tmp_path: Path) -> None:
+    step = StepConfig(
+        id_="list",
+        inputs=[],
+        outputs=[
+            StepOutputConfig("names", {}, list_file="names.txt"),
+            StepOutputConfig(
+                "report",
+                {"type": "File", "outputBinding": {"glob": 'report\'s "final".csv'}},
+            ),
+        ],
+    )
+    tool_path = tmp_path / "list.cwl"
+    dump(
+        {
+            "class": "CommandLineTool",
+            "cwlVersion": "v1.0",
+            "baseCommand": ["python", "/app/app.py"],
+            "inputs": [],
+            "outputs": {o.id_: o.params for o in step.outputs},
+        },
+        tool_path,
+    )
+    tool = load_cwl(tool_path)
+    parser = cwl_parser(step.cwl_version)
+    staged = parser.Dirent(entryname="staged.txt", entry="staged")
+    tool.requirements = [parser.InitialWorkDirRequirement(listing=[staged])]
+    wrap_list_outputs(tool, step)
+    assert tool.baseCommand == ["python", LIST_WRAPPER, "python", "/app/app.py"]
+    # one work dir requirement, with the wrapper next to what was staged
+    (work_dir,) = tool.requirements
+    assert [e.entryname for e in work_dir.listing] == ["staged.txt", LIST_WRAPPER]
+
+    (tmp_path / LIST_WRAPPER).write_text(work_dir.listing[1].entry)
+    # far past the 64 KiB runners load file contents up to
+    script = (
+        "print(*range(100000), file=open('names.txt', 'w'), sep='\\n');"
+        "open('report\\'s \"final\".csv', 'w')"
+    )
+    subprocess.run(
+        [sys.executable, LIST_WRAPPER, sys.executable, "-c", script],
+        cwd=tmp_path,
+        check=True,
+    )
+    outputs = load(tmp_path / "cwl.output.json")
+    assert outputs["names"] == [str(i) for i in range(100000)]
+    assert outputs["report"] == {"class": "File", "path": 'report\'s "final".csv'}
+
+
+def test_run_list_outputs(tmp_path: Path, run_built) -> None:
+    script = tmp_path / "list.py"
+    script.write_text(SCRIPT)
+
+    report = run_built(WorkflowConfig.from_dict(config(script)), {"count": 3})
+
+    assert report["returncode"] == 0
+    assert report["outputs"]["names"] == ["name-0", "name-1", "name-2"]
+    assert sorted(f["basename"] for f in report["outputs"]["files"]) == [
+        "name-0",
+        "name-1",
+        "name-2",
+    ]
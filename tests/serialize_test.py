@@ -0,0 +1,37 @@
+from pathlib import Path
+
+import pytest
+
+from eoap_gen.serialize import dump, dumps, load
+
+DOC = {
+    "class": "CommandLineTool",
+    "doc": "Resize a file\nto a given size",
+    "switches": ["on", "off", "yes", "010", "1:20", "null"],
+    "date": "2024-01-01",
+    "default": None,
+    "inputs": [{"id": "size", "type": "int", "default": 5}],
+}
+
+
+@pytest.mark.parametrize("output_format", ["yaml", "json"])
+def test_dump_load_round_trip(tmp_path: Path, output_format: str) -> None:
+    path = tmp_path / "tool.cwl"
+    dump(DOC, path, output_format)
+
+    assert load(path) == DOC
+
+
+def test_dumps_yaml_style() -> None:
+    text = dumps(DOC)
+
+    assert text.startswith("class: CommandLineTool\n")
+    assert 'doc: "Resize a file\\nto a given size"\n' in text
+    assert "- id: size\n" in text
+
+
+def test_load_yaml_1_2(tmp_path: Path) -> None:
+    path = tmp_path / "tool.cwl"
+    path.write_text("a: on\nb: 010\nc: 1:20\nd: 2024-01-01\n")
+
+    assert load(path) == {"a": "on", "b": 10, "c": "1:20", "d": "2024-01-01"}
@@ -0,0 +1,47 @@
+import subprocess
+import sys
+
+import pytest
+
+# modules that are slow to import and only needed once steps are generated
+HEAVY_MODULES = ["cwl_utils", "cwltool", "schema_salad", "jinja2"]
+# budget for the cumulative import time of the statement, in microseconds
+IMPORT_BUDGET_US = 250_000
+
+
+def import_times(code: str) -> dict[str, int]:
+    """
+    Run code under `python -X importtime` and return the cumulative import time
+    of every imported module.
+    """
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "from eoap_gen.cli import cli; cli(['--help'], standalone_mode=False)",
+        "from eoap_gen.config import WorkflowConfig; "
+        "WorkflowConfig.load_config('tests/data/config.yml')",
+    ],
+)
+def test_startup_imports(code: str) -> None:
+    times = import_times(code)
+
+    heavy = [m for m in times if m.split(".")[0] in HEAVY_MODULES]
+    assert not heavy, f"Slow modules imported at startup: {', '.join(heavy)}"
+    # the outermost eoap_gen module includes everything imported through it
+    eoap_gen_time = max(t for m, t in times.items() if m.startswith("eoap_gen."))
+    assert eoap_gen_time < IMPORT_BUDGET_US
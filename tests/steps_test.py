@@ -0,0 +1,32 @@
+from pathlib import Path
+
+from eoap_gen.config import StepConfig
+from eoap_gen.steps import generate_steps
+from eoap_gen.utils import create_output_dirs
+
+
+def docker_step(id_: str, command: str | None = "echo") -> StepConfig:
+    return StepConfig.from_dict(
+        {
+            "id": id_,
+            "docker_image": "alpine:latest",
+            "command": command,
+            "outputs": [{"id": "out", "type": "stdout"}],
+        }
+    )
+
+
+def test_generate_steps_parallel(tmp_path: Path) -> None:
+    """
+    Concurrent generation writes every step and reports failures per step.
+    """
+    steps = [docker_step(f"step_{i}") for i in range(8)]
+    steps.insert(3, docker_step("broken", command=None))
+    create_output_dirs(tmp_path, [s.id_ for s in steps])
+
+    errors = generate_steps(steps, tmp_path, "ghcr.io/owner/repo", "main", jobs=4)
+
+    assert list(errors) == ["broken"]
+    assert isinstance(errors["broken"], ValueError)
+    for i in range(8):
+        assert (tmp_path / "cli" / f"step_{i}" / f"step_{i}.cwl").exists()
@@ -0,0 +1,22 @@
+from eoap_gen.trace import Tracer, run, span, tracing
+
+
+def test_trace_spans_and_subprocesses() -> None:
+    tracer = Tracer()
+    with tracing(tracer):
+        with span("step", step="hello"):
+            res = run("echo out; echo err >&2; exit 3", "script")
+        with span("pack"):
+            pass
+
+    assert res.returncode == 3
+    assert res.stdout == b"out\n"
+    assert res.stderr == b"err\n"
+    script = next(e for e in tracer.events if e["name"] == "script")
+    assert script["cat"] == "subprocess"
+    assert script["args"]["step"] == "hello"
+    assert script["args"]["returncode"] == 3
+    assert script["args"]["max_rss_kb"] > 0
+    table = tracer.timings_table().splitlines()
+    assert table[0].split() == ["step", "step", "script", "pack"]
+    assert [row.split()[0] for row in table[1:]] == ["hello", "workflow"]